@@ -0,0 +1,259 @@
+import hashlib
+import os
+import queue
+import shutil
+import threading
+import traceback
+from pathlib import Path
+
+import attr
+
+from exprec import constants as c
+from exprec import utils
+
+
+ARTIFACTS_FOLDER = 'artifacts'  # In the cache folder
+FILES_MANIFEST_FILENAME = 'files.json'  # In the experiment's folder. Maps relative paths in `files/` to hashes.
+CHUNK_SIZE = 2**20
+
+_STOP = object()
+
+
+@attr.s
+class ArtifactDeduplicator:
+    """Moves files into a shared content-addressed store on a background thread, and hardlinks them back.
+
+    Each file is hashed in chunks with sha256. If the store already has a file with the same content, the experiment's
+    file is replaced by a hardlink to it, and otherwise the file itself is linked into the store. Stored files are
+    read-only, since they are shared between experiments. Files that can't be linked (e.g. if the store is on
+    another device) are left as they are.
+
+    A stored file's link count is its reference count: the store's own link plus one per experiment file.
+
+    A file must not be modified while it waits to be deduplicated: `wait(path)` returns when it has been. A file
+    that is modified anyway, while it's hashed or linked, is left as it is.
+    """
+    experiment_path = attr.ib()
+
+    def __attrs_post_init__(self):
+        self.experiment_path = Path(self.experiment_path)
+        self.files_path = self.experiment_path/c.FILES_FOLDER
+
+        self._hash_by_relative_path = load_files_manifest(self.experiment_path)
+
+        self._queue = queue.Queue()
+        self._condition = threading.Condition()
+        self._n_pending_by_path = {}
+        self._thread = threading.Thread(target=self._work, name='exprec-deduplicator', daemon=True)
+        self._thread.start()
+
+    def add(self, path):
+        path = Path(path)
+        with self._condition:
+            self._n_pending_by_path[path] = self._n_pending_by_path.get(path, 0) + 1
+        self._queue.put(path)
+
+    def wait(self, path):
+        """Waits until the file isn't queued or being deduplicated anymore."""
+        path = Path(path)
+        with self._condition:
+            self._condition.wait_for(lambda: path not in self._n_pending_by_path)
+
+    def close(self):
+        """Deduplicates all files in `files/` that aren't deduplicated yet, and waits until it's done."""
+        if self.files_path.exists():
+            for path in sorted(self.files_path.glob('**/*')):
+                if path.is_file() and not path.is_symlink() and path.stat().st_nlink == 1:
+                    self.add(path)
+
+        self._queue.put(_STOP)
+        self._thread.join()
+
+        utils.dump_json(self._hash_by_relative_path, str(self.experiment_path/FILES_MANIFEST_FILENAME))
+
+    def _work(self):
+        while True:
+            path = self._queue.get()
+            if path is _STOP:
+                return
+
+            try:
+                file_hash = deduplicate_file(path)
+            except FileNotFoundError:
+                file_hash = None  # Removed after it was closed
+            except Exception:
+                traceback.print_exc()
+                file_hash = None
+
+            if file_hash is not None:
+                self._hash_by_relative_path[path.relative_to(self.files_path).as_posix()] = file_hash
+
+            with self._condition:
+                self._n_pending_by_path[path] -= 1
+                if self._n_pending_by_path[path] == 0:
+                    del self._n_pending_by_path[path]
+                self._condition.notify_all()
+
+
+def deduplicate_file(path, parent_folder=c.DEFAULT_PARENT_FOLDER):
+    """Replaces the file by a hardlink to the stored file with the same content. Returns the file's hash, or None if
+    the file couldn't be linked or was modified meanwhile.
+    """
+    path = Path(path)
+    stat = path.stat()
+    if stat.st_nlink > 1:
+        return None  # Already linked, or hardlinked by the user
+
+    file_hash = hash_file(path)
+    artifact_path = get_artifact_path(file_hash, parent_folder)
+    artifact_path.parent.mkdir(exist_ok=True, parents=True)
+
+    if is_modified(path, stat):
+        return None  # The hash may not match the content
+
+    try:
+        os.chmod(str(path), 0o444)
+        os.link(str(path), str(artifact_path))
+    except FileExistsError:
+        pass  # The content is already stored
+    except OSError:
+        os.chmod(str(path), 0o644)
+        return None
+    else:
+        if is_modified(path, stat):
+            # Modified by a writer that opened the file before it was made read-only
+            os.remove(str(artifact_path))
+            os.chmod(str(path), 0o644)
+            return None
+
+        return file_hash
+
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        os.link(str(artifact_path), temp_path)
+    except OSError:
+        os.chmod(str(path), 0o644)
+        return None
+
+    if is_modified(path, stat):
+        os.remove(temp_path)
+        os.chmod(str(path), 0o644)
+        return None
+    os.replace(temp_path, str(path))
+
+    return file_hash
+
+
+def is_modified(path, stat):
+    # Whether the file has been replaced or written to since the stat was taken
+    new_stat = os.stat(str(path))
+    return (new_stat.st_ino, new_stat.st_size, new_stat.st_mtime_ns) != (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def hash_file(path):
+    sha256 = hashlib.sha256()
+
+    with Path(path).open('rb') as fp:
+        for chunk in iter(lambda: fp.read(CHUNK_SIZE), b''):
+            sha256.update(chunk)
+
+    return sha256.hexdigest()
+
+
+def break_link(path):
+    """Gives the file its own copy of its content, so that it can be modified without modifying the stored file."""
+    path = Path(path)
+    if not path.exists() or path.stat().st_nlink == 1:
+        return
+
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    shutil.copyfile(str(path), temp_path)
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, str(path))
+
+
+def delete_experiment_files(experiment_path):
+    """Deletes the files in the experiment's `files/` folder, and the stored files that are no longer referenced."""
+    experiment_path = Path(experiment_path)
+    hashes = set(load_files_manifest(experiment_path).values())
+
+    files_path = experiment_path/c.FILES_FOLDER
+    for path in files_path.glob('*'):
+        if path.is_dir():
+            shutil.rmtree(str(path))
+        elif path.is_file():
+            os.remove(str(path))
+
+    manifest_path = experiment_path/FILES_MANIFEST_FILENAME
+    if manifest_path.exists():
+        os.remove(str(manifest_path))
+
+    remove_unreferenced_artifacts(hashes, experiment_path.parent)
+
+
+def remove_unreferenced_artifacts(hashes, parent_folder=c.DEFAULT_PARENT_FOLDER):
+    """Removes the stored files with the given hashes that aren't linked from any experiment."""
+    for file_hash in hashes:
+        artifact_path = get_artifact_path(file_hash, parent_folder)
+        try:
+            if artifact_path.stat().st_nlink == 1:
+                os.remove(str(artifact_path))
+        except FileNotFoundError:
+            pass
+
+
+def remove_orphaned_artifacts(parent_folder=c.DEFAULT_PARENT_FOLDER):
+    """Removes all stored files that no experiment links to, e.g. after experiment folders were deleted outside the
+    dashboard. Returns the number of removed files and their total size in bytes.
+    """
+    n_removed = 0
+    n_bytes = 0
+
+    for artifact_path in (Path(parent_folder)/c.CACHE_FOLDER/ARTIFACTS_FOLDER).glob('*/*'):
+        try:
+            stat = artifact_path.stat()
+            if stat.st_nlink == 1:
+                os.remove(str(artifact_path))
+                n_removed += 1
+                n_bytes += stat.st_size
+        except FileNotFoundError:
+            pass
+
+    return n_removed, n_bytes
+
+
+def get_file_usage(root):
+    """Returns the logical and physical size in bytes of all files under `root`.
+
+    The logical size counts every file in full. A stored file that is linked from several experiments counts towards
+    the physical size of each of them in equal shares, so that the physical sizes of all experiments add up to the
+    space used on disk.
+    """
+    logical_size = 0
+    physical_size = 0
+
+    for dirpath, _, filenames in os.walk(str(root)):
+        for filename in filenames:
+            stat = os.stat(os.path.join(dirpath, filename))
+            logical_size += stat.st_size
+
+            n_experiment_links = stat.st_nlink - 1 if is_read_only(stat) else stat.st_nlink
+            physical_size += stat.st_size / max(n_experiment_links, 1)
+
+    return logical_size, int(physical_size)
+
+
+def is_read_only(stat):
+    # Stored files are read-only. A writable file with several links was hardlinked by the user, not by the store.
+    return stat.st_mode & 0o222 == 0
+
+
+def get_artifact_path(file_hash, parent_folder=c.DEFAULT_PARENT_FOLDER):
+    return Path(parent_folder)/c.CACHE_FOLDER/ARTIFACTS_FOLDER/file_hash[:2]/file_hash[2:]
+
+
+def load_files_manifest(experiment_path):
+    try:
+        return utils.load_json(str(Path(experiment_path)/FILES_MANIFEST_FILENAME))
+    except (OSError, ValueError):
+        return {}
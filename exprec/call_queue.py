@@ -0,0 +1,64 @@
+import collections
+import threading
+import traceback
+
+import attr
+
+
+DRAIN_INTERVAL = 0.1  # Seconds
+MAX_PENDING_CALLS = 10000  # The writer thread is woken up early when this many calls are pending
+
+
+@attr.s
+class CallQueue:
+    """Runs function calls on a single writer thread, in the order they were added.
+
+    `put` only appends the call to a deque, which doesn't take a lock, so any number of threads can add calls
+    concurrently while only the writer thread touches the files. The writer thread runs the pending calls every
+    `DRAIN_INTERVAL` seconds (or earlier if many calls are pending). `close` runs all remaining calls and stops
+    the thread. A call that raises doesn't stop the later calls; the first exception is raised again by `close`.
+    """
+    name = attr.ib(default='exprec-writer')
+
+    def __attrs_post_init__(self):
+        self._pending_calls = collections.deque()
+        self._wake_up = threading.Event()
+        self._is_closing = False
+        self._error = None
+
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def put(self, function, *args):
+        self._pending_calls.append((function, args))
+
+        if len(self._pending_calls) >= MAX_PENDING_CALLS:
+            self._wake_up.set()
+
+    def close(self):
+        self._is_closing = True
+        self._wake_up.set()
+        self._thread.join()
+
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        while not self._is_closing:
+            self._wake_up.wait(DRAIN_INTERVAL)
+            self._wake_up.clear()
+
+            self._drain()
+
+        self._drain()
+
+    def _drain(self):
+        while self._pending_calls:
+            function, args = self._pending_calls.popleft()
+
+            try:
+                function(*args)
+            except Exception as error:
+                traceback.print_exc()
+                if self._error is None:
+                    self._error = error
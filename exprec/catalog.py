@@ -0,0 +1,302 @@
+import json
+import os
+import sqlite3
+
+from exprec import constants as c
+from exprec import utils
+from exprec import scalars
+from exprec import experiment_index
+from exprec import artifact_store
+from exprec import change_watcher
+
+
+CATALOG_FILENAME = 'catalog.sqlite'  # In the cache folder
+SCHEMA_VERSION = 2
+TIMEOUT = 30  # Seconds to wait for another process's write to finish
+UPDATE_TIMEOUT = 1.0  # Seconds that an experiment waits to update the catalog, e.g. while the dashboard writes to it
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS experiments (
+    uuid TEXT PRIMARY KEY,
+    metadata TEXT NOT NULL,
+    metadata_mtime INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    files_count INTEGER,
+    files_mtime INTEGER,
+    logical_size INTEGER NOT NULL,
+    physical_size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tags (
+    uuid TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (uuid, tag)
+);
+CREATE INDEX IF NOT EXISTS tags_by_tag ON tags (tag);
+CREATE TABLE IF NOT EXISTS parameters (
+    uuid TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (uuid, name)
+);
+CREATE INDEX IF NOT EXISTS parameters_by_name ON parameters (name);
+CREATE TABLE IF NOT EXISTS scalars (
+    uuid TEXT NOT NULL,
+    name TEXT NOT NULL,
+    mtime INTEGER NOT NULL,
+    value REAL,
+    PRIMARY KEY (uuid, name)
+);
+CREATE INDEX IF NOT EXISTS scalars_by_name ON scalars (name);
+'''
+
+TABLES = ['experiments', 'tags', 'parameters', 'scalars']
+
+
+def get_catalog_path():
+    return experiment_index.get_parent_folder()/c.CACHE_FOLDER/CATALOG_FILENAME
+
+
+def connect(timeout=TIMEOUT):
+    """Opens the catalog, and creates it if it doesn't exist or has an old schema.
+
+    The catalog is a cache of the experiments' metadata, tags, parameters, scalar names, last scalar values and file
+    usage, so that the dashboard doesn't have to read every experiment's files for each request. It can be deleted
+    at any time, and is then rebuilt. Writes wait up to `timeout` seconds for other processes' writes to finish.
+    """
+    catalog_path = get_catalog_path()
+    catalog_path.parent.mkdir(exist_ok=True, parents=True)
+
+    connection = sqlite3.connect(str(catalog_path), timeout=timeout)
+
+    try:
+        schema_version = connection.execute('PRAGMA user_version').fetchone()[0]
+    except sqlite3.DatabaseError:
+        # A corrupt catalog, e.g. after an OS crash during a write, is rebuilt
+        connection.close()
+        os.remove(str(catalog_path))
+        connection = sqlite3.connect(str(catalog_path), timeout=timeout)
+        schema_version = None
+
+    # Writes aren't synced to disk, since the catalog can always be rebuilt:
+    connection.execute('PRAGMA synchronous = OFF')
+
+    if schema_version != SCHEMA_VERSION:
+        _create_schema(connection)
+
+    return connection
+
+
+def _create_schema(connection):
+    # Other processes may create the catalog at the same time, so the schema is created in a transaction that locks
+    # the catalog, and only if it still has another version. (`executescript` would commit before each statement.)
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        if connection.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            for table in TABLES:
+                connection.execute('DROP TABLE IF EXISTS {}'.format(table))
+            for statement in SCHEMA.split(';'):
+                if statement.strip():
+                    connection.execute(statement)
+            connection.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+    except BaseException:
+        connection.rollback()
+        raise
+
+    connection.commit()
+
+
+def update_experiment(uuid, timeout=TIMEOUT):
+    """Updates an experiment in the catalog. Called by the recorder when an experiment starts and exits."""
+    connection = connect(timeout)
+    try:
+        with connection:
+            _update_experiment(connection, uuid)
+    finally:
+        connection.close()
+
+
+def reconcile(connection, changes=None):
+    """Brings the catalog up to date with the experiment folders.
+
+    Experiments whose metadata file has been modified since they were cataloged are updated, and deleted experiments
+    are removed. Only running experiments have their scalars and files checked as well, since a finished experiment's
+    metadata file is rewritten whenever anything else about it changes. This takes one `stat` per experiment.
+
+    If `changes` is given, as a dict that maps uuids to the kinds of changes reported by a
+    `change_watcher.ChangeWatcher`, only those experiments are checked, and only for those kinds of changes.
+    """
+    if changes is not None:
+        _reconcile_changes(connection, changes)
+        return
+
+    uuids = experiment_index.load_index()['uuids']
+    cataloged = {uuid: (metadata_mtime, status) for uuid, metadata_mtime, status
+        in connection.execute('SELECT uuid, metadata_mtime, status FROM experiments')}
+
+    with connection:
+        for uuid in set(cataloged) - set(uuids):
+            _delete_experiment(connection, uuid)
+
+        for uuid in uuids:
+            metadata_mtime = _get_mtime(get_metadata_path(uuid))
+
+            if metadata_mtime is None:
+                continue  # Being created
+            elif uuid not in cataloged or cataloged[uuid][0] != metadata_mtime:
+                _update_experiment(connection, uuid)
+            elif cataloged[uuid][1] == 'running':
+                _update_scalars(connection, uuid)
+                _update_file_usage(connection, uuid)
+
+
+def _reconcile_changes(connection, changes):
+    cataloged = {uuid: metadata_mtime for uuid, metadata_mtime
+        in connection.execute('SELECT uuid, metadata_mtime FROM experiments')}
+
+    with connection:
+        for uuid, kinds in changes.items():
+            metadata_mtime = _get_mtime(get_metadata_path(uuid))
+
+            if metadata_mtime is None:
+                _delete_experiment(connection, uuid)  # Deleted, or being created
+            elif uuid not in cataloged or cataloged[uuid] != metadata_mtime:
+                _update_experiment(connection, uuid)
+            else:
+                if change_watcher.SCALARS_CHANGE in kinds:
+                    _update_scalars(connection, uuid)
+                if change_watcher.FILES_CHANGE in kinds:
+                    _update_file_usage(connection, uuid)
+
+
+def get_experiments(connection, filters=None):
+    """Returns a list of (uuid, metadata, logical file size, physical file size) for the experiments that pass the
+    tag filters, which is a dict with a 'blacklist' and a 'whitelist' of tags. Experiments with any blacklisted tag
+    are left out, and if the whitelist isn't empty, only experiments with at least one whitelisted tag are included.
+    """
+    query = 'SELECT uuid, metadata, logical_size, physical_size FROM experiments'
+    conditions = []
+    arguments = []
+
+    if filters is not None:
+        if filters['blacklist']:
+            conditions.append('uuid NOT IN (SELECT uuid FROM tags WHERE tag IN ({}))'.format(
+                ', '.join('?' * len(filters['blacklist']))))
+            arguments += filters['blacklist']
+        if filters['whitelist']:
+            conditions.append('uuid IN (SELECT uuid FROM tags WHERE tag IN ({}))'.format(
+                ', '.join('?' * len(filters['whitelist']))))
+            arguments += filters['whitelist']
+
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY uuid'
+
+    return [(uuid, json.loads(metadata), logical_size, physical_size)
+        for uuid, metadata, logical_size, physical_size in connection.execute(query, arguments)]
+
+
+def get_all_tags(connection):
+    return [tag for tag, in connection.execute('SELECT DISTINCT tag FROM tags ORDER BY tag')]
+
+
+def get_all_parameter_names(connection):
+    return [name for name, in connection.execute('SELECT DISTINCT name FROM parameters ORDER BY name')]
+
+
+def get_all_scalar_names(connection):
+    return [name for name, in connection.execute('SELECT DISTINCT name FROM scalars ORDER BY name')]
+
+
+def get_last_scalar_values(connection, uuids):
+    """Returns a dict that maps each of the uuids to a dict with the last value of each of the experiment's scalars."""
+    value_by_name_by_uuid = {uuid: {} for uuid in uuids}
+
+    for uuid, name, value in connection.execute('SELECT uuid, name, value FROM scalars'):
+        if uuid in value_by_name_by_uuid:
+            value_by_name_by_uuid[uuid][name] = value
+
+    return value_by_name_by_uuid
+
+
+def _update_experiment(connection, uuid):
+    metadata_path = get_metadata_path(uuid)
+    metadata_mtime = _get_mtime(metadata_path)
+
+    try:
+        metadata = utils.load_json(str(metadata_path))
+    except (OSError, ValueError):
+        return  # Removed, or not written yet
+
+    connection.execute('INSERT OR REPLACE INTO experiments (uuid, metadata, metadata_mtime, status, logical_size, '
+        'physical_size) VALUES (?, ?, ?, ?, 0, 0)', (uuid, json.dumps(metadata), metadata_mtime, metadata['status']))
+
+    connection.execute('DELETE FROM tags WHERE uuid = ?', (uuid,))
+    connection.executemany('INSERT OR IGNORE INTO tags (uuid, tag) VALUES (?, ?)',
+        [(uuid, tag) for tag in metadata['tags']])
+
+    connection.execute('DELETE FROM parameters WHERE uuid = ?', (uuid,))
+    connection.executemany('INSERT INTO parameters (uuid, name) VALUES (?, ?)',
+        [(uuid, name) for name in metadata['parameters']])
+
+    _update_scalars(connection, uuid)
+    _update_file_usage(connection, uuid, force=True)
+
+
+def _update_scalars(connection, uuid):
+    # Only the scalars whose files have been modified are read. The table shows the scalars written by rank 0.
+    mtime_by_name = dict(connection.execute('SELECT name, mtime FROM scalars WHERE uuid = ?', (uuid,)))
+
+    path_by_name = {}
+    scalars_folder = experiment_index.get_parent_folder()/uuid/c.SCALARS_FOLDER
+    for name in scalars.get_scalar_names(scalars_folder):
+        if name.startswith(c.SYSTEM_SCALAR_PREFIX):
+            continue  # The resource monitor's samples are shown as charts, not as columns
+        path_by_name[name] = scalars.get_scalar_path(scalars_folder, name)
+
+    for name in set(mtime_by_name) - set(path_by_name):
+        connection.execute('DELETE FROM scalars WHERE uuid = ? AND name = ?', (uuid, name))
+
+    for name, path in path_by_name.items():
+        mtime = _get_mtime(path)
+        if mtime is None or mtime_by_name.get(name) == mtime:
+            continue
+
+        try:
+            value = scalars.read_last_value(path)
+        except (OSError, ValueError):
+            value = None
+
+        connection.execute('INSERT OR REPLACE INTO scalars (uuid, name, mtime, value) VALUES (?, ?, ?, ?)',
+            (uuid, name, mtime, value))
+
+
+def _update_file_usage(connection, uuid, force=False):
+    # The number of entries in the files folder and their latest mtime change when a file is added, overwritten or
+    # removed at any depth
+    files_path = experiment_index.get_parent_folder()/uuid/c.FILES_FOLDER
+    files_count, files_mtime = change_watcher.get_tree_mtime(files_path) or (None, None)
+
+    if not force:
+        cataloged = connection.execute('SELECT files_count, files_mtime FROM experiments WHERE uuid = ?',
+            (uuid,)).fetchone()
+        if cataloged == (files_count, files_mtime):
+            return
+
+    logical_size, physical_size = artifact_store.get_file_usage(files_path)
+    connection.execute('UPDATE experiments SET files_count = ?, files_mtime = ?, logical_size = ?, physical_size = ? '
+        'WHERE uuid = ?', (files_count, files_mtime, logical_size, physical_size, uuid))
+
+
+def _delete_experiment(connection, uuid):
+    for table in TABLES:
+        connection.execute('DELETE FROM {} WHERE uuid = ?'.format(table), (uuid,))
+
+
+def get_metadata_path(uuid):
+    return experiment_index.get_parent_folder()/uuid/c.METADATA_JSON_FILENAME
+
+
+def _get_mtime(path):
+    try:
+        return os.stat(str(path)).st_mtime_ns
+    except FileNotFoundError:
+        return None
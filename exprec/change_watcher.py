@@ -0,0 +1,406 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import traceback
+from pathlib import Path
+
+import attr
+
+from exprec import constants as c
+from exprec import scalars
+
+
+DEFAULT_POLL_INTERVAL = 2.0  # Seconds, when polling
+READ_TIMEOUT = 1.0  # Seconds that the inotify thread waits for events before checking whether it should stop
+
+# Kinds of changes to an experiment:
+EXPERIMENT_CHANGE = 'experiment'  # The experiment's folder was created or deleted
+METADATA_CHANGE = 'metadata'
+SCALARS_CHANGE = 'scalars'
+FILES_CHANGE = 'files'
+
+# From <sys/inotify.h>:
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len, followed by the name
+
+PARENT_FOLDER_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+# Metadata files are replaced atomically, so they're created or moved into place rather than modified:
+EXPERIMENT_FOLDER_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_ONLYDIR
+SCALARS_FOLDER_MASK = IN_MODIFY | IN_CREATE | IN_DELETE | IN_MOVED_TO | IN_ONLYDIR
+FILES_FOLDER_MASK = IN_CLOSE_WRITE | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+
+
+@attr.s
+class ChangeWatcher:
+    """Watches the experiment folders on a daemon thread, and collects which experiments have changed.
+
+    Changes are reported per experiment, as the kinds of things that changed: the experiment's folder, its metadata,
+    its scalars (written by rank 0) or its files, at any depth. Each consumer of the changes gets its own `ChangeSet`
+    from `subscribe()`.
+
+    On Linux, the folders are watched with inotify, so unchanged experiments cost nothing. Elsewhere, or when the
+    inotify watch limit is reached, the folders are polled every `poll_interval` seconds instead: each poll takes one
+    `stat` of each experiment's metadata file and of everything in its files folder, plus one of each scalar file of
+    running experiments.
+    """
+    parent_folder = attr.ib(default=c.DEFAULT_PARENT_FOLDER)
+    poll_interval = attr.ib(default=DEFAULT_POLL_INTERVAL)
+    use_inotify = attr.ib(default=True)
+
+    def __attrs_post_init__(self):
+        self.parent_folder = Path(self.parent_folder)
+        self._change_sets = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+        # The watches are added, or the folders scanned, before the constructor returns, so that every change after
+        # it is reported:
+        self._inotify = None
+        if self.use_inotify and sys.platform.startswith('linux'):
+            try:
+                self._inotify = Inotify()
+                self._add_watches()
+            except OSError:
+                self._stop_inotify()
+
+        if self._inotify is None:
+            self._start_polling()
+
+        self._thread = threading.Thread(target=self._run, name='exprec-change-watcher', daemon=True)
+        self._thread.start()
+
+    @property
+    def backend(self):
+        return 'inotify' if self._inotify is not None else 'polling'
+
+    def subscribe(self):
+        """Returns a `ChangeSet` that collects all changes from now on. It starts out as if everything had changed."""
+        change_set = ChangeSet()
+        with self._lock:
+            self._change_sets.append(change_set)
+
+        return change_set
+
+    def close(self):
+        self._stop_event.set()
+        self._thread.join()
+
+        if self._inotify is not None:
+            self._inotify.close()
+
+    def _publish(self, changes):
+        with self._lock:
+            for change_set in self._change_sets:
+                change_set.add(changes)
+
+    def _publish_everything(self):
+        with self._lock:
+            for change_set in self._change_sets:
+                change_set.invalidate()
+
+    def _run(self):
+        try:
+            while not self._stop_event.is_set():
+                if self._inotify is not None:
+                    try:
+                        changes = self._read_events()
+                    except OSError as error:
+                        if error.errno not in (errno.ENOSPC, errno.EMFILE):
+                            raise
+                        # The limit on inotify watches has been reached, so changes may have been missed
+                        self._stop_inotify()
+                        self._start_polling()
+                        self._publish_everything()
+                        continue
+                else:
+                    changes = self._poll()
+                    self._stop_event.wait(self.poll_interval)
+
+                if changes:
+                    self._publish(changes)
+        except Exception:
+            traceback.print_exc()
+
+    def _stop_inotify(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def _add_watches(self):
+        self._folder_by_watch = {}  # Maps each watch descriptor to the experiment's uuid and the kind of folder
+        self._files_path_by_watch = {}  # The path of each watched folder in a files folder, to watch its subfolders
+
+        self.parent_folder.mkdir(exist_ok=True)
+        self._folder_by_watch[self._inotify.add_watch(self.parent_folder, PARENT_FOLDER_MASK)] = (None, None)
+        for uuid in get_experiment_uuids(self.parent_folder):
+            self._add_experiment_watches(uuid)
+
+    def _add_experiment_watches(self, uuid):
+        try:
+            watch = self._inotify.add_watch(self.parent_folder/uuid, EXPERIMENT_FOLDER_MASK)
+        except (FileNotFoundError, NotADirectoryError):
+            return  # Deleted
+
+        self._folder_by_watch[watch] = (uuid, EXPERIMENT_CHANGE)
+        self._add_subfolder_watch(uuid, c.SCALARS_FOLDER)
+        self._add_subfolder_watch(uuid, c.FILES_FOLDER)
+
+    def _add_subfolder_watch(self, uuid, folder_name):
+        if folder_name == c.SCALARS_FOLDER:
+            kind, mask = SCALARS_CHANGE, SCALARS_FOLDER_MASK
+        else:
+            kind, mask = FILES_CHANGE, FILES_FOLDER_MASK
+
+        if kind == FILES_CHANGE:
+            self._add_files_watches(uuid, self.parent_folder/uuid/folder_name)
+            return
+
+        try:
+            self._folder_by_watch[self._inotify.add_watch(self.parent_folder/uuid/folder_name, mask)] = (uuid, kind)
+        except (FileNotFoundError, NotADirectoryError):
+            pass  # Created later
+
+    def _add_files_watches(self, uuid, path):
+        # inotify only reports changes to a folder's direct children, so each subfolder gets its own watch:
+        for folder, _, _ in os.walk(str(path)):
+            try:
+                watch = self._inotify.add_watch(Path(folder), FILES_FOLDER_MASK)
+            except (FileNotFoundError, NotADirectoryError):
+                continue  # Deleted, or created later
+
+            self._folder_by_watch[watch] = (uuid, FILES_CHANGE)
+            self._files_path_by_watch[watch] = Path(folder)
+
+    def _read_events(self):
+        changes = {}
+
+        for watch, mask, name in self._inotify.read(READ_TIMEOUT):
+            if mask & IN_Q_OVERFLOW:
+                self._publish_everything()
+                continue
+            if mask & IN_IGNORED:
+                self._folder_by_watch.pop(watch, None)  # The folder was deleted
+                self._files_path_by_watch.pop(watch, None)
+                continue
+            if watch not in self._folder_by_watch:
+                continue
+
+            uuid, kind = self._folder_by_watch[watch]
+
+            if uuid is None:
+                # A folder in the parent folder
+                if not name or name.startswith('.'):
+                    continue
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_experiment_watches(name)
+                changes.setdefault(name, set()).add(EXPERIMENT_CHANGE)
+            elif kind == EXPERIMENT_CHANGE:
+                if name in (c.SCALARS_FOLDER, c.FILES_FOLDER) and mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_subfolder_watch(uuid, name)
+                    changes.setdefault(uuid, set()).add(SCALARS_CHANGE if name == c.SCALARS_FOLDER else FILES_CHANGE)
+                elif is_metadata_filename(name) or mask & IN_DELETE_SELF:
+                    changes.setdefault(uuid, set()).add(METADATA_CHANGE)
+            elif kind == SCALARS_CHANGE:
+                if Path(name).suffix in SCALAR_EXTENSIONS:
+                    changes.setdefault(uuid, set()).add(SCALARS_CHANGE)
+            else:
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and watch in self._files_path_by_watch:
+                    self._add_files_watches(uuid, self._files_path_by_watch[watch]/name)
+                changes.setdefault(uuid, set()).add(FILES_CHANGE)
+
+        return changes
+
+    def _start_polling(self):
+        self._mtimes_by_uuid = {}  # Maps each experiment to the mtimes of its metadata, files and scalar files
+        self._running_uuids = set()
+        self._poll()
+
+    def _poll(self):
+        changes = {}
+        uuids = set(get_experiment_uuids(self.parent_folder))
+
+        for uuid in set(self._mtimes_by_uuid) - uuids:
+            del self._mtimes_by_uuid[uuid]
+            self._running_uuids.discard(uuid)
+            changes[uuid] = {EXPERIMENT_CHANGE}
+
+        for uuid in uuids:
+            experiment_path = self.parent_folder/uuid
+            metadata_mtime = get_mtime(experiment_path/c.METADATA_JSON_FILENAME)
+            files_mtime = get_tree_mtime(experiment_path/c.FILES_FOLDER)
+            scalar_mtimes = get_scalar_mtimes(experiment_path) if uuid in self._running_uuids else None
+
+            if uuid not in self._mtimes_by_uuid:
+                kinds = {EXPERIMENT_CHANGE}
+            else:
+                old_metadata_mtime, old_files_mtime, old_scalar_mtimes = self._mtimes_by_uuid[uuid]
+                kinds = set()
+                if metadata_mtime != old_metadata_mtime:
+                    kinds.add(METADATA_CHANGE)
+                if files_mtime != old_files_mtime:
+                    kinds.add(FILES_CHANGE)
+                if scalar_mtimes is not None and scalar_mtimes != old_scalar_mtimes:
+                    kinds.add(SCALARS_CHANGE)
+
+            if kinds & {EXPERIMENT_CHANGE, METADATA_CHANGE}:
+                # Only the scalar files of running experiments are checked, since the metadata file of an experiment
+                # is rewritten when it exits:
+                if scalars.is_running(experiment_path):
+                    self._running_uuids.add(uuid)
+                    scalar_mtimes = get_scalar_mtimes(experiment_path)
+                else:
+                    self._running_uuids.discard(uuid)
+                    scalar_mtimes = None
+
+            self._mtimes_by_uuid[uuid] = (metadata_mtime, files_mtime, scalar_mtimes)
+            if kinds:
+                changes[uuid] = kinds
+
+        return changes
+
+
+@attr.s
+class ChangeSet:
+    """The changes collected for one consumer since it last drained them."""
+
+    def __attrs_post_init__(self):
+        self._lock = threading.Lock()
+        self._kinds_by_uuid = {}
+        self._everything = True
+
+    def add(self, kinds_by_uuid):
+        with self._lock:
+            if self._everything:
+                return
+
+            for uuid, kinds in kinds_by_uuid.items():
+                self._kinds_by_uuid.setdefault(uuid, set()).update(kinds)
+
+    def invalidate(self):
+        with self._lock:
+            self._everything = True
+            self._kinds_by_uuid = {}
+
+    def drain(self):
+        """Returns a dict that maps each experiment that has changed to the kinds of changes, or None if anything may
+        have changed, e.g. before the watcher has started.
+        """
+        with self._lock:
+            if self._everything:
+                self._everything = False
+                return None
+
+            kinds_by_uuid, self._kinds_by_uuid = self._kinds_by_uuid, {}
+            return kinds_by_uuid
+
+
+class Inotify:
+    """A minimal binding of Linux's inotify API with ctypes."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+
+        self.fd = libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add_watch(self, path, mask):
+        watch = self._add_watch(self.fd, os.fsencode(str(path)), mask)
+        if watch < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), str(path))
+
+        return watch
+
+    def read(self, timeout):
+        """Returns the events that have happened as a list of (watch descriptor, mask, name), waiting at most
+        `timeout` seconds for the first one.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        data = os.read(self.fd, 2**16)
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            watch, mask, _, name_length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = os.fsdecode(data[offset:offset + name_length].rstrip(b'\0'))
+            offset += name_length
+            events.append((watch, mask, name))
+
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+SCALAR_EXTENSIONS = set(scalars.EXTENSION_BY_FORMAT.values())
+
+
+def is_metadata_filename(name):
+    # The metadata files of all ranks, but not their temporary files
+    return name.startswith('experiment') and name.endswith('.json')
+
+
+def get_experiment_uuids(parent_folder):
+    try:
+        return [entry.name for entry in os.scandir(str(parent_folder)) if entry.is_dir() and not entry.name.startswith('.')]
+    except FileNotFoundError:
+        return []
+
+
+def get_scalar_mtimes(experiment_path):
+    try:
+        return {entry.name: entry.stat().st_mtime_ns for entry in os.scandir(str(experiment_path/c.SCALARS_FOLDER))
+            if entry.is_file()}
+    except FileNotFoundError:
+        return {}
+
+
+def get_tree_mtime(path):
+    """Returns the number of files and folders under `path` and their latest mtime, or None if `path` doesn't exist.
+    A file that is created, modified, moved or deleted at any depth changes it.
+    """
+    if not os.path.isdir(str(path)):
+        return None
+
+    n_entries = 0
+    max_mtime = get_mtime(path)
+
+    for folder, folder_names, filenames in os.walk(str(path)):
+        for name in folder_names + filenames:
+            mtime = get_mtime(os.path.join(folder, name))
+            if mtime is not None:
+                n_entries += 1
+                max_mtime = max(max_mtime or 0, mtime)
+
+    return n_entries, max_mtime
+
+
+def get_mtime(path):
+    try:
+        return os.stat(str(path)).st_mtime_ns
+    except FileNotFoundError:
+        return None
@@ -4,6 +4,7 @@ import collections
 
 from exprec import constants as c
 from exprec import html_utils
+from exprec import source_store
 
 
 def compare_experiments(uuids):
@@ -24,6 +25,9 @@ def compare_experiments(uuids):
     content_by_tab_name[html_utils.icon_title('chart-bar', 'Parameters')] = html_utils.create_parameters(uuids)
     content_by_tab_name[html_utils.icon_title('chart-area', 'Charts')] = html_utils.create_charts(uuids)
 
+    if len(uuids) == 2:
+        content_by_tab_name[html_utils.icon_title('fire', 'Profile')] = html_utils.create_profile_diff(*uuids)
+
     html += html_utils.create_tabs(content_by_tab_name, tabs_id='compare-tabs')
 
     return {
@@ -34,14 +38,14 @@ def compare_experiments(uuids):
 
 def get_experiment_diff_with_local(uuid):
     local_path = '.'
-    uuid_source_path = str(Path(c.DEFAULT_PARENT_FOLDER)/uuid/'src')
+    uuid_source_path = str(source_store.get_source_folder(Path(c.DEFAULT_PARENT_FOLDER)/uuid))
 
     return create_compare('local', html_utils.circle_with_short_uuid(uuid), local_path, uuid_source_path)
 
 
 def get_experiments_diff(uuid1, uuid2):
-    uuid1_source_path = str(Path(c.DEFAULT_PARENT_FOLDER)/uuid1/'src')
-    uuid2_source_path = str(Path(c.DEFAULT_PARENT_FOLDER)/uuid2/'src')
+    uuid1_source_path = str(source_store.get_source_folder(Path(c.DEFAULT_PARENT_FOLDER)/uuid1))
+    uuid2_source_path = str(source_store.get_source_folder(Path(c.DEFAULT_PARENT_FOLDER)/uuid2))
 
     return create_compare(html_utils.circle_with_short_uuid(uuid1), 
         html_utils.circle_with_short_uuid(uuid2), uuid1_source_path, uuid2_source_path)
@@ -1,9 +1,15 @@
 DEFAULT_PARENT_FOLDER = '.exprec'
+CACHE_FOLDER = '.cache'  # In DEFAULT_PARENT_FOLDER. Shared between experiments.
 METADATA_JSON_FILENAME = 'experiment.json'
 FILES_FOLDER = 'files'
 ARCHIVE_TAG = 'archive'
 SOURCE_CODE_FOLDER = 'src'
+SOURCE_MANIFEST_FILENAME = 'src.json'
 SCALARS_FOLDER = 'scalars'
 SCALARS_HEADER_FIELDS = ['step', 'value', 'datetime']
+SYSTEM_SCALAR_PREFIX = 'system.'  # Reserved for the scalars recorded by the resource monitor
+HISTOGRAMS_FOLDER = 'histograms'
+TIMERS_FOLDER = 'timers'
 IMAGE_FOLDER = 'img'
 TAG_REGEX_PATTERN = '^[a-z0-9-]*$'
+DASHBOARD_EDITABLE_FIELDS = ['title', 'description', 'conclusion', 'tags']
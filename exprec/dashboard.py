@@ -1,8 +1,6 @@
 from flask import Flask, send_from_directory, request, jsonify
 from pathlib import Path
 import json
-import shutil
-import os
 import cgi
 import re
 
@@ -12,11 +10,19 @@ from exprec import compare_creation
 from exprec import constants as c
 from exprec import utils
 from exprec import html_utils
+from exprec import source_store
+from exprec import experiment_index
+from exprec import artifact_store
+from exprec import catalog
+from exprec import change_watcher
 
 
 def dashboard(host=None, port=None, restore_button=False):
     app = Flask(__name__)
 
+    # The experiment table is updated incrementally, from the changes to the experiment folders:
+    table_cache = table_creation.TableCache(change_watcher.ChangeWatcher())
+
     @app.route('/')
     def index():
         return send_from_directory('', 'index.html')
@@ -36,17 +42,20 @@ def dashboard(host=None, port=None, restore_button=False):
     @app.route('/experiment-table', methods=['POST'])
     def get_main():
         filters = request.json
-        path = Path(c.DEFAULT_PARENT_FOLDER)
-
-        uuids = utils.get_uuids(path)
-        table = table_creation.create_table_from_uuids(uuids, path, filters)
-        return table
+        return table_creation.create_table(filters, table_cache)
 
     @app.route('/alltags', methods=['GET'])
     def alltags():
-        path = Path(c.DEFAULT_PARENT_FOLDER)
-        uuids = utils.get_uuids(path)
-        all_tags = utils.get_all_tags(uuids)
+        with table_cache.lock:
+            connection = catalog.connect()
+            try:
+                table_cache.reconcile(connection)
+                all_tags = catalog.get_all_tags(connection)
+            finally:
+                connection.close()
+
+        if c.ARCHIVE_TAG in all_tags:
+            all_tags.remove(c.ARCHIVE_TAG)
 
         return jsonify(all_tags)
 
@@ -56,8 +65,8 @@ def dashboard(host=None, port=None, restore_button=False):
             return experiment_creation.create_experiment_div(id, restore_button)
 
         elif request.method == 'DELETE':
-            experiment_path = str(Path(c.DEFAULT_PARENT_FOLDER)/id)
-            shutil.rmtree(experiment_path)
+            experiment_index.delete_experiment_folder(id)
+            table_cache.mark_changed(id)
             return id
 
         else:
@@ -67,13 +76,9 @@ def dashboard(host=None, port=None, restore_button=False):
 
     @app.route('/deletefiles/<id>', methods=['GET'])
     def deletefiles(id):
-        experiment_files_path = Path(c.DEFAULT_PARENT_FOLDER)/id/'files'
-        for path in experiment_files_path.glob('*'):
-            if path.is_dir():
-                shutil.rmtree(str(path))
-            elif path.is_file():
-                os.remove(str(path))
-        
+        artifact_store.delete_experiment_files(Path(c.DEFAULT_PARENT_FOLDER)/id)
+        table_cache.mark_changed(id)
+
         return id
 
     @app.route('/save-text/<id>/<text_id>', methods=['POST'])
@@ -85,6 +90,7 @@ def dashboard(host=None, port=None, restore_button=False):
 
         with utils.UpdateJsonFile(str(experiment_json_path)) as experiment_json:
             experiment_json[text_id] = request.json
+        table_cache.mark_changed(id)
         
         return id
 
@@ -95,18 +101,18 @@ def dashboard(host=None, port=None, restore_button=False):
 
     @app.route('/restore-source-code/<id>')
     def restore_source_code(id):
-        utils.restore_source_code(id)
+        source_store.restore_source_code(id)
         return id
 
     @app.route('/get-code/<id>', methods=['POST'])
     def get_code(id):
-        code_path = Path(c.DEFAULT_PARENT_FOLDER)/id/request.json
-        assert code_path.exists(), code_path
+        source_files = source_store.get_source_files(Path(c.DEFAULT_PARENT_FOLDER)/id)
 
-        if code_path.is_dir():
-            return ''
+        relative_path = request.json[len(c.SOURCE_CODE_FOLDER + '/'):]
+        if relative_path not in source_files:
+            return ''  # A folder in the tree
 
-        return jsonify(experiment_creation.load_code(code_path))
+        return jsonify(experiment_creation.load_code(source_files[relative_path]))
 
     @app.route('/add_tags/<id>', methods=['POST'])
     def add_tags(id):
@@ -120,6 +126,7 @@ def dashboard(host=None, port=None, restore_button=False):
             for tag in request.json:
                 if tag not in experiment_json['tags']:
                     experiment_json['tags'].append(tag)
+        table_cache.mark_changed(id)
         
         return id
 
@@ -132,6 +139,7 @@ def dashboard(host=None, port=None, restore_button=False):
         with utils.UpdateJsonFile(str(experiment_json_path)) as experiment_json:
             tags = experiment_json['tags']
             experiment_json['tags'] = list(set(tags) - set(tags_to_remove))
+        table_cache.mark_changed(id)
         
         return id
 
@@ -141,4 +149,5 @@ def dashboard(host=None, port=None, restore_button=False):
             output = cgi.escape(fp.read())
         return html_utils.monospace(output)
     
-    app.run(host=host, port=port, debug=True)
+    # The reloader would run this function in a second process as well, with a second change watcher:
+    app.run(host=host, port=port, debug=True, use_reloader=False)
@@ -11,10 +11,15 @@ from jinja2 import Template
 from exprec import html_utils
 from exprec import constants as c
 from exprec import utils
+from exprec import experiment_index
+from exprec import image_writer
+from exprec import source_store
 from exprec.html_utils import same_line
 
 MAX_CHARS_IN_SHORT_OUTPUT = 500
 
+IMAGE_EXTENSIONS = set(image_writer.EXTENSION_BY_FORMAT.values())
+
 
 def create_experiment_div(uuid, restore_button):
     path = Path(c.DEFAULT_PARENT_FOLDER)/uuid
@@ -46,7 +51,7 @@ def create_experiment_div(uuid, restore_button):
     header = template.render(fa_icon=html_utils.fa_icon, 
         title=experiment_json['title'], 
         uuid_color=html_utils.color_circle(uuid),
-        short_uuid=utils.get_short_uuid(uuid), 
+        short_uuid=experiment_index.get_short_uuid(uuid), 
         status_icon=html_utils.get_status_icon_tag(experiment_json['status']),
         filename=experiment_json['filename'],
         tags=' '.join([html_utils.badge(tag) for tag in tags]),
@@ -60,6 +65,7 @@ def create_experiment_div(uuid, restore_button):
     content_by_tab_name[html_utils.icon_title('terminal', 'Output')] = create_short_output(path, uuid)
     content_by_tab_name[html_utils.icon_title('chart-area', 'Charts')] = html_utils.create_charts([uuid])
     content_by_tab_name[html_utils.icon_title('image', 'Images')] = create_images(path)
+    content_by_tab_name[html_utils.icon_title('fire', 'Profile')] = html_utils.create_profile(uuid)
 
     content_by_tab_name = collections.OrderedDict([(key, html_utils.margin(value)) for key, value in content_by_tab_name.items()])
 
@@ -110,7 +116,8 @@ def create_summary(uuid, path, experiment_json):
         ('File space', utils.get_file_space_representation(str(path/c.FILES_FOLDER))),
         ('Parents', html_utils.monospace(' '.join(parents))),
         ('Exception', html_utils.monospace(exception) if exception is not None else None),
-        ('Git commit', html_utils.monospace(html_utils.color_circle_and_string(experiment_json['git']['short'])) if experiment_json['git'] is not None else None),
+        ('Git commit', create_git_commit_html(experiment_json['git'])),
+        ('Git branch', experiment_json['git'].get('branch') if experiment_json['git'] is not None else None),
         ('PID', html_utils.monospace(experiment_json['pid'])),
         ('Python version', experiment_json['pythonVersion']),
         ('OS', experiment_json['osVersion']),
@@ -125,9 +132,28 @@ def create_summary(uuid, path, experiment_json):
     return html
 
 
+def create_git_commit_html(git_metadata):
+    if git_metadata is None:
+        return None
+
+    html = html_utils.monospace(html_utils.color_circle_and_string(git_metadata['short']))
+
+    # Experiments recorded before the dirty status was captured don't have the key:
+    if git_metadata.get('dirty'):
+        html += ' (uncommitted changes'
+        if git_metadata.get('patchFilename') is not None:
+            html += ' saved in ' + git_metadata['patchFilename']
+        html += ')'
+
+    return html
+
+
 def create_packages(path):
     pip_freeze_path = path/'pip_freeze.txt'
 
+    if not pip_freeze_path.exists():
+        return 'The installed packages have not been recorded yet.'
+
     with pip_freeze_path.open() as fp:
         pip_freeze = fp.read()
     
@@ -137,7 +163,8 @@ def create_packages(path):
 def create_code(uuid, path, experiment_json):
     filename = experiment_json['filename']
 
-    tree = create_tree(root=path/'src', path_to_root=Path('src'), selected_path='{}/{}'.format(c.SOURCE_CODE_FOLDER, filename))
+    source_files = source_store.get_source_files(path)
+    tree = create_tree(source_files.keys(), root_name=c.SOURCE_CODE_FOLDER, selected_path='{}/{}'.format(c.SOURCE_CODE_FOLDER, filename))
 
     json_string_tree = json.dumps(tree)
 
@@ -177,29 +204,41 @@ def create_code(uuid, path, experiment_json):
     return html
 
 
-def create_tree(root, path_to_root, selected_path=None):
+def create_tree(relative_paths, root_name, selected_path=None):
+    """Creates a jstree tree from file paths relative to the root. Each node's id is its path, starting with `root_name`."""
+    return create_tree_node(root_name, [Path(relative_path).parts for relative_path in relative_paths], selected_path)
+
+
+def create_tree_node(path_to_node, paths_parts, selected_path):
     agg = {
-        'text': root.name,
-        'id': str(path_to_root),
+        'text': Path(path_to_node).name,
+        'id': path_to_node,
         'children': [],
         'state': {
             'opened': True,
         }
     }
 
-    sub_dirs = sorted([directory for directory in root.iterdir() if directory.is_dir()])
-    for sub_dir in sub_dirs:
-        sub_agg = create_tree(sub_dir, path_to_root/sub_dir.name, selected_path)
+    sub_dir_paths_parts = collections.defaultdict(list)
+    file_names = []
+    for parts in paths_parts:
+        if len(parts) == 1:
+            file_names.append(parts[0])
+        else:
+            sub_dir_paths_parts[parts[0]].append(parts[1:])
+
+    for sub_dir_name in sorted(sub_dir_paths_parts):
+        sub_agg = create_tree_node('{}/{}'.format(path_to_node, sub_dir_name), sub_dir_paths_parts[sub_dir_name], selected_path)
         agg['children'].append(sub_agg)
 
-    files = sorted([file for file in root.iterdir() if file.is_file()])
-    for file in files:
+    for file_name in sorted(file_names):
+        file_path = '{}/{}'.format(path_to_node, file_name)
         agg['children'].append({
-            'text': file.name,
-            'id': str(path_to_root/file.name),
+            'text': file_name,
+            'id': file_path,
             'type': 'file',
             'state': {
-                'selected': str(path_to_root/file.name) == selected_path
+                'selected': file_path == selected_path
             },
         })
     
@@ -327,14 +366,14 @@ def get_image_by_name_map(path):
                               if image_folder_path.is_dir()]
 
         for image_folder_path in image_folder_paths:
-            image_ids = [int(image_path.stem) for image_path in image_folder_path.glob('*.png')]
-            if not image_ids:
+            image_path_by_id = {int(image_path.stem): image_path for image_path in image_folder_path.iterdir() 
+                                if image_path.suffix in IMAGE_EXTENSIONS}
+            if not image_path_by_id:
                 continue
 
-            max_image_id = max(image_ids)
+            max_image_id = max(image_path_by_id)
 
-            image_path = image_folder_path / '{}.png'.format(max_image_id)
-            image = Image.open(image_path)
+            image = Image.open(image_path_by_id[max_image_id])
 
             name = '{} [step: {}]'.format(image_folder_path.name, max_image_id)
 
@@ -0,0 +1,231 @@
+import bisect
+import os
+import shutil
+from pathlib import Path
+
+from exprec import constants as c
+from exprec import utils
+from exprec import artifact_store
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+INDEX_FILENAME = 'index.json'
+LOCK_FILENAME = 'index.lock'
+
+MINIMUM_SHORT_UUID_LENGTH = 7
+
+# The index is kept in memory by each process and reloaded when the index file or the parent folder has changed:
+_cached_index = None
+_cached_index_key = None
+
+
+def create_experiment_folder(uuid, name, parent_folder=None):
+    """Creates the experiment's folder and adds the experiment to the index.
+
+    Raises a ValueError if the name is already occupied by another experiment. An empty name is always available.
+    """
+    parent_folder = Path(parent_folder) if parent_folder is not None else get_parent_folder()
+
+    with _IndexLock(parent_folder):
+        index = _load_valid_index(parent_folder)
+
+        if name and name in index['uuidByName']:
+            raise ValueError("Name '{}' is already occupied.".format(name))
+
+        (parent_folder/uuid).mkdir(exist_ok=False)
+
+        bisect.insort(index['uuids'], uuid)
+        if name:
+            index['uuidByName'][name] = uuid
+
+        _write_index(index, parent_folder)
+
+
+def set_experiment_name(uuid, name, parent_folder=None):
+    """Records the name of an experiment whose folder was created without one, e.g. by the collector."""
+    parent_folder = Path(parent_folder) if parent_folder is not None else get_parent_folder()
+
+    with _IndexLock(parent_folder):
+        index = _load_valid_index(parent_folder)
+
+        if index['uuidByName'].get(name) != uuid:
+            index['uuidByName'][name] = uuid
+            _write_index(index, parent_folder)
+
+
+def delete_experiment_folder(uuid):
+    """Deletes the experiment's folder, removes the experiment from the index and removes its deduplicated files 
+    from the artifact store unless other experiments link to them.
+    """
+    with _IndexLock(get_parent_folder()):
+        index = _load_valid_index(get_parent_folder())
+
+        experiment_path = get_parent_folder()/uuid
+        artifact_hashes = set(artifact_store.load_files_manifest(experiment_path).values())
+
+        shutil.rmtree(str(experiment_path))
+        artifact_store.remove_unreferenced_artifacts(artifact_hashes, get_parent_folder())
+
+        i = bisect.bisect_left(index['uuids'], uuid)
+        if i < len(index['uuids']) and index['uuids'][i] == uuid:
+            del index['uuids'][i]
+        index['uuidByName'] = {name: other_uuid for name, other_uuid in index['uuidByName'].items() if other_uuid != uuid}
+
+        _write_index(index, get_parent_folder())
+
+
+def is_name_available(name, parent_folder=None):
+    if name == '':
+        return True
+
+    if parent_folder is None or Path(parent_folder) == get_parent_folder():
+        index = load_index()
+    else:
+        with _IndexLock(Path(parent_folder)):
+            index = _load_valid_index(Path(parent_folder))
+
+    return name not in index['uuidByName']
+
+
+def get_short_uuid(uuid):
+    return uuid[:load_index()['shortUuidLength']]
+
+
+def get_full_uuid(prefix):
+    """Returns the uuid that starts with `prefix`. Raises a ValueError if no uuid or more than one uuid starts with it."""
+    uuids = load_index()['uuids']
+
+    # The uuids starting with the prefix are adjacent in sorted order, beginning at the prefix's insertion point:
+    i = bisect.bisect_left(uuids, prefix)
+    if i == len(uuids) or not uuids[i].startswith(prefix):
+        raise ValueError("No UUID exists corresponding to the short UUID '{}'".format(prefix))
+    if i + 1 < len(uuids) and uuids[i + 1].startswith(prefix):
+        raise ValueError("The short UUID '{}' is ambiguous, several UUIDs start with it".format(prefix))
+
+    return uuids[i]
+
+
+def load_index():
+    """Returns the index, which is a dict with the keys:
+
+    - 'uuids': The sorted uuids of all experiments
+    - 'uuidByName': Maps experiment names to uuids
+    - 'shortUuidLength': The shortest prefix length (at least `MINIMUM_SHORT_UUID_LENGTH`) that is unique for all uuids
+    - 'folderMtime': The modification time of the parent folder when the index was written
+
+    The index is rebuilt if the parent folder has been modified since the index was written, e.g. if an experiment
+    folder was deleted manually.
+    """
+    global _cached_index, _cached_index_key
+
+    key = (_get_mtime(get_index_path()), _get_mtime(get_parent_folder()))
+    if _cached_index is not None and key == _cached_index_key:
+        return _cached_index
+
+    index = _read_index(get_parent_folder())
+    if index is None or index['folderMtime'] != key[1]:
+        with _IndexLock(get_parent_folder()):
+            index = _load_valid_index(get_parent_folder())
+
+    _cached_index = index
+    _cached_index_key = (_get_mtime(get_index_path()), index['folderMtime'])
+
+    return index
+
+
+def get_parent_folder():
+    return Path(c.DEFAULT_PARENT_FOLDER)
+
+
+def get_index_path(parent_folder=None):
+    return (Path(parent_folder) if parent_folder is not None else get_parent_folder())/c.CACHE_FOLDER/INDEX_FILENAME
+
+
+def _load_valid_index(parent_folder):
+    # Must be called with the lock held.
+    index = _read_index(parent_folder)
+    if index is None or index['folderMtime'] != _get_mtime(parent_folder):
+        index = _build_index(parent_folder)
+        _write_index(index, parent_folder)
+
+    return index
+
+
+def _build_index(parent_folder):
+    uuids = []
+    uuid_by_name = {}
+
+    for path in parent_folder.iterdir():
+        if not path.is_dir() or utils.is_hidden_path(Path(path.name)):
+            continue
+
+        uuids.append(path.name)
+
+        metadata_json_path = path/c.METADATA_JSON_FILENAME
+        if metadata_json_path.exists():
+            name = utils.load_json(str(metadata_json_path))['name']
+            if name:
+                uuid_by_name[name] = path.name
+
+    return {
+        'uuids': sorted(uuids),
+        'uuidByName': uuid_by_name,
+    }
+
+
+def _write_index(index, parent_folder):
+    index['shortUuidLength'] = compute_short_uuid_length(index['uuids'])
+    index['folderMtime'] = _get_mtime(parent_folder)
+
+    utils.dump_json(index, str(get_index_path(parent_folder)))
+
+
+def compute_short_uuid_length(sorted_uuids):
+    """Returns the shortest prefix length that is unique for all uuids. Only neighbours in sorted order can share
+    a longer prefix than any other pair, so one pass over adjacent pairs is enough.
+    """
+    length = MINIMUM_SHORT_UUID_LENGTH
+
+    for uuid1, uuid2 in zip(sorted_uuids, sorted_uuids[1:]):
+        common_prefix_length = len(os.path.commonprefix([uuid1, uuid2]))
+        length = max(length, common_prefix_length + 1)
+
+    return length
+
+
+def _read_index(parent_folder):
+    try:
+        return utils.load_json(str(get_index_path(parent_folder)))
+    except (OSError, ValueError):
+        return None
+
+
+def _get_mtime(path):
+    try:
+        return os.stat(str(path)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class _IndexLock:
+    """An exclusive lock on the index, shared between processes. No locking is done on platforms without fcntl."""
+
+    def __init__(self, parent_folder):
+        self.parent_folder = parent_folder
+
+    def __enter__(self):
+        cache_folder = self.parent_folder/c.CACHE_FOLDER
+        cache_folder.mkdir(exist_ok=True, parents=True)
+
+        self.fp = (cache_folder/LOCK_FILENAME).open('w')
+        if fcntl is not None:
+            fcntl.flock(self.fp, fcntl.LOCK_EX)
+
+    def __exit__(self, type, value, traceback):
+        if fcntl is not None:
+            fcntl.flock(self.fp, fcntl.LOCK_UN)
+        self.fp.close()
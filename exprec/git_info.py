@@ -0,0 +1,441 @@
+import bisect
+import gzip
+import hashlib
+import os
+import stat
+import struct
+import subprocess
+import time
+import zlib
+from pathlib import Path
+
+
+SHORT_SHA_LENGTH = 7  # The minimum length of the short sha, which is extended until it's unique in the repository
+PATCH_FILENAME = 'git.patch.gz'
+
+# Index entry flags, see https://git-scm.com/docs/index-format
+ASSUME_VALID_FLAG = 0x8000
+EXTENDED_FLAG = 0x4000
+SKIP_WORKTREE_FLAG = 0x4000  # In the extended flags
+NAME_LENGTH_MASK = 0xfff
+GITLINK_MODE = 0o160000
+
+COMMIT_OBJECT_TYPE = 1  # In pack files
+
+
+def get_git_metadata(patch_folder=None, start_path='.'):
+    """Returns a dict with the commit sha, short sha (see `get_short_sha`), branch (None if HEAD is detached) and
+    whether the working tree has uncommitted changes to tracked files. Returns None if `start_path` isn't in a git
+    repository.
+
+    HEAD and the index are read directly from the `.git` folder. If `patch_folder` is given and the working tree is
+    dirty, the uncommitted changes (`git diff HEAD`) are saved gzipped in `patch_folder/git.patch.gz`.
+    The time spent is reported in 'captureSeconds'.
+    """
+    start_time = time.perf_counter()
+
+    repository = find_repository(start_path)
+    if repository is None:
+        return None
+
+    work_tree, git_dir, common_dir = repository
+
+    sha, ref = resolve_head(git_dir, common_dir)
+    if sha is None:
+        return None  # A repository without commits
+
+    dirty = is_dirty(work_tree, git_dir, common_dir, sha)
+
+    git_metadata = {
+        'sha': sha,
+        'short': get_short_sha(common_dir, sha),
+        'branch': ref[len('refs/heads/'):] if ref is not None and ref.startswith('refs/heads/') else None,
+        'dirty': dirty,
+        'patchFilename': None,
+    }
+
+    if patch_folder is not None and dirty:
+        if save_patch(work_tree, Path(patch_folder)/PATCH_FILENAME):
+            git_metadata['patchFilename'] = PATCH_FILENAME
+
+    git_metadata['captureSeconds'] = time.perf_counter() - start_time
+
+    return git_metadata
+
+
+def find_repository(start_path='.'):
+    """Returns (work tree, git folder, common git folder), or None if `start_path` isn't in a git repository.
+
+    In a linked worktree, `.git` is a file that points to the worktree's git folder, whose `commondir` file points
+    to the main repository's git folder, which holds the shared refs and objects.
+    """
+    path = Path(start_path).resolve()
+
+    for work_tree in [path] + list(path.parents):
+        dot_git = work_tree/'.git'
+
+        if dot_git.is_dir():
+            git_dir = dot_git
+        elif dot_git.is_file():
+            content = dot_git.read_text().strip()
+            if not content.startswith('gitdir:'):
+                continue
+            git_dir = (work_tree/content[len('gitdir:'):].strip()).resolve()
+        else:
+            continue
+
+        common_dir = git_dir
+        commondir_path = git_dir/'commondir'
+        if commondir_path.is_file():
+            common_dir = (git_dir/commondir_path.read_text().strip()).resolve()
+
+        return work_tree, git_dir, common_dir
+
+    return None
+
+
+def resolve_head(git_dir, common_dir):
+    """Returns (sha, ref) for HEAD. `ref` is None if HEAD is detached, and `sha` is None if the ref has no commit."""
+    content = (git_dir/'HEAD').read_text().strip()
+
+    ref = None
+    for _ in range(10):  # Symbolic refs can point to other symbolic refs
+        if not content.startswith('ref:'):
+            return content, ref
+
+        ref = content[len('ref:'):].strip()
+        content = read_ref(git_dir, common_dir, ref)
+        if content is None:
+            return None, ref
+
+    raise ValueError('Too many levels of symbolic refs: ' + ref)
+
+
+def read_ref(git_dir, common_dir, ref):
+    for folder in (git_dir, common_dir):
+        ref_path = folder/ref
+        if ref_path.is_file():
+            return ref_path.read_text().strip()
+
+    packed_refs_path = common_dir/'packed-refs'
+    if packed_refs_path.is_file():
+        with packed_refs_path.open() as fp:
+            for line in fp:
+                if line.startswith('#') or line.startswith('^'):
+                    continue
+
+                sha, _, name = line.strip().partition(' ')
+                if name == ref:
+                    return sha
+
+    return None
+
+
+def is_dirty(work_tree, git_dir, common_dir, head_sha):
+    """Returns whether tracked files have uncommitted changes, either in the working tree or staged in the index.
+
+    Falls back to `git status` when the index or the HEAD commit can't be read directly. Returns None if
+    that fails as well.
+    """
+    try:
+        index = read_index(git_dir/'index')
+
+        if is_work_tree_modified(work_tree, index):
+            return True
+
+        tree_sha = read_commit_tree_sha(common_dir, head_sha)
+        if tree_sha is not None and index['rootTreeSha'] is not None:
+            return tree_sha != index['rootTreeSha']
+    except (OSError, ValueError, struct.error, zlib.error):
+        pass
+
+    return is_dirty_according_to_git(work_tree)
+
+
+def read_index(index_path):
+    """Parses a git index file (versions 2-4). Returns a dict with the 'entries' (path, mtime in ns, size, mode, sha
+    and whether the working tree file should be checked) and the 'rootTreeSha' from the cache tree extension,
+    which is None if the extension is missing or invalidated.
+    """
+    data = index_path.read_bytes()
+
+    signature, version, n_entries = struct.unpack_from('>4sLL', data, 0)
+    if signature != b'DIRC' or version not in (2, 3, 4):
+        raise ValueError('Unsupported git index: {} version {}'.format(signature, version))
+
+    entries = []
+    offset = 12
+    previous_path = b''
+
+    for _ in range(n_entries):
+        entry_start = offset
+        (_, _, mtime_seconds, mtime_nanoseconds, _, _, mode, _, _, size, sha, flags) = \
+            struct.unpack_from('>LLLLLLLLLL20sH', data, offset)
+        offset += 62
+
+        check = not (flags & ASSUME_VALID_FLAG)
+        if version >= 3 and flags & EXTENDED_FLAG:
+            extended_flags, = struct.unpack_from('>H', data, offset)
+            offset += 2
+            if extended_flags & SKIP_WORKTREE_FLAG:
+                check = False
+
+        if version == 4:
+            n_removed, offset = _read_offset_varint(data, offset)
+            end = data.index(b'\0', offset)
+            path = previous_path[:len(previous_path) - n_removed] + data[offset:end]
+            offset = end + 1
+        else:
+            name_length = flags & NAME_LENGTH_MASK
+            if name_length == NAME_LENGTH_MASK:
+                name_length = data.index(b'\0', offset) - offset
+            path = data[offset:offset + name_length]
+            # Entries are padded with 1-8 NUL bytes to a multiple of 8 bytes:
+            offset = entry_start + ((offset + name_length - entry_start) // 8 + 1) * 8
+
+        previous_path = path
+        entries.append({
+            'path': os.fsdecode(path),
+            'mtime': mtime_seconds * 10**9 + mtime_nanoseconds,
+            'size': size,
+            'mode': mode,
+            'sha': sha.hex(),
+            'check': check,
+        })
+
+    return {
+        'entries': entries,
+        'rootTreeSha': _read_root_tree_sha(data, offset),
+    }
+
+
+def _read_offset_varint(data, offset):
+    byte = data[offset]
+    offset += 1
+    value = byte & 0x7f
+
+    while byte & 0x80:
+        byte = data[offset]
+        offset += 1
+        value = ((value + 1) << 7) | (byte & 0x7f)
+
+    return value, offset
+
+
+def _read_root_tree_sha(data, offset):
+    end = len(data) - 20  # The index ends with a checksum
+
+    while offset + 8 <= end:
+        signature, size = struct.unpack_from('>4sL', data, offset)
+        offset += 8
+
+        if signature == b'TREE':
+            # The root entry: an empty path, entry count, subtree count and the tree sha (if the entry count isn't -1)
+            path_end = data.index(b'\0', offset)
+            counts_end = data.index(b'\n', path_end)
+            entry_count = int(data[path_end + 1:counts_end].split(b' ')[0])
+            if data[offset:path_end] != b'' or entry_count < 0:
+                return None
+            return data[counts_end + 1:counts_end + 21].hex()
+
+        offset += size
+
+    return None
+
+
+def is_work_tree_modified(work_tree, index):
+    for entry in index['entries']:
+        if not entry['check'] or entry['mode'] == GITLINK_MODE:
+            continue
+
+        path = work_tree/entry['path']
+        try:
+            file_stat = os.lstat(str(path))
+        except FileNotFoundError:
+            return True
+
+        if file_stat.st_size == entry['size'] and file_stat.st_mtime_ns == entry['mtime']:
+            continue
+
+        # The stat data differs, e.g. after a checkout or `touch`. The content decides:
+        if stat.S_ISLNK(file_stat.st_mode):
+            content = os.fsencode(os.readlink(str(path)))
+        else:
+            content = path.read_bytes()
+
+        if hash_blob(content) != entry['sha']:
+            return True
+
+    return False
+
+
+def hash_blob(content):
+    return hashlib.sha1(b'blob ' + str(len(content)).encode('ascii') + b'\0' + content).hexdigest()
+
+
+def read_commit_tree_sha(common_dir, commit_sha):
+    """Returns the sha of the commit's tree, or None if the commit object can't be read directly."""
+    content = read_loose_object(common_dir, commit_sha)
+    if content is None:
+        content = read_packed_commit(common_dir, commit_sha)
+    if content is None:
+        return None
+
+    header, _, body = content.partition(b'\0')
+    if not header.startswith(b'commit ') or not body.startswith(b'tree '):
+        return None
+
+    return body[len(b'tree '):len(b'tree ') + 40].decode('ascii')
+
+
+def read_loose_object(common_dir, sha):
+    object_path = common_dir/'objects'/sha[:2]/sha[2:]
+    if not object_path.is_file():
+        return None
+
+    return zlib.decompress(object_path.read_bytes())
+
+
+def read_packed_commit(common_dir, sha):
+    """Reads a commit object from a pack file. Returns None if it isn't found or is stored as a delta."""
+    binary_sha = bytes.fromhex(sha)
+
+    for index_path in (common_dir/'objects'/'pack').glob('*.idx'):
+        offset = _find_in_pack_index(index_path, binary_sha)
+        if offset is None:
+            continue
+
+        with index_path.with_suffix('.pack').open('rb') as fp:
+            fp.seek(offset)
+            byte = fp.read(1)[0]
+            object_type = (byte >> 4) & 0x7
+            size = byte & 0x0f
+            shift = 4
+            while byte & 0x80:
+                byte = fp.read(1)[0]
+                size |= (byte & 0x7f) << shift
+                shift += 7
+
+            if object_type != COMMIT_OBJECT_TYPE:
+                return None
+
+            decompressor = zlib.decompressobj()
+            body = b''
+            while len(body) < size:
+                chunk = fp.read(4096)
+                if not chunk:
+                    break
+                body += decompressor.decompress(chunk)
+
+        return b'commit ' + str(size).encode('ascii') + b'\0' + body[:size]
+
+    return None
+
+
+def get_short_sha(common_dir, sha):
+    """Returns the shortest prefix of the sha, of at least `SHORT_SHA_LENGTH` characters, that no other loose or
+    packed object of the repository starts with, like `git rev-parse --short`. Objects in alternate object
+    folders aren't taken into account. Falls back to `SHORT_SHA_LENGTH` characters if the objects can't be read.
+    """
+    length = SHORT_SHA_LENGTH
+
+    try:
+        for other_sha in _get_neighbor_shas(common_dir, sha):
+            length = max(length, len(os.path.commonprefix([sha, other_sha])) + 1)
+    except (OSError, ValueError, struct.error):
+        return sha[:SHORT_SHA_LENGTH]
+
+    return sha[:length]
+
+
+def _get_neighbor_shas(common_dir, sha):
+    # Yields the shas that could share the longest prefix with `sha`: the loose objects in its folder, and the
+    # neighbors of its position in each pack index, which are sorted.
+    loose_folder = common_dir/'objects'/sha[:2]
+    if loose_folder.is_dir():
+        for name in os.listdir(str(loose_folder)):
+            if sha[:2] + name != sha:
+                yield sha[:2] + name
+
+    binary_sha = bytes.fromhex(sha)
+
+    for index_path in (common_dir/'objects'/'pack').glob('*.idx'):
+        pack_index = _read_pack_index(index_path)
+        if pack_index is None:
+            continue
+
+        data, fanout, shas = pack_index
+        i = bisect.bisect_left(shas, binary_sha, 0, fanout[255])
+        for j in (i - 1, i, i + 1):
+            if 0 <= j < fanout[255] and shas[j] != binary_sha:
+                yield shas[j].hex()
+
+
+def _read_pack_index(index_path):
+    # Pack index version 2: magic, version, 256 fanout counts, sorted shas, crcs, 4-byte offsets, 8-byte offsets.
+    data = index_path.read_bytes()
+    if data[:8] != b'\xfftOc\x00\x00\x00\x02':
+        return None
+
+    return data, struct.unpack_from('>256L', data, 8), _ShaList(data, 8 + 256*4)
+
+
+def _find_in_pack_index(index_path, binary_sha):
+    pack_index = _read_pack_index(index_path)
+    if pack_index is None:
+        return None
+
+    data, fanout, shas = pack_index
+    n_objects = fanout[255]
+    shas_offset = shas.offset
+
+    start = fanout[binary_sha[0] - 1] if binary_sha[0] > 0 else 0
+    end = fanout[binary_sha[0]]
+    i = bisect.bisect_left(shas, binary_sha, start, end)
+    if i >= end or shas[i] != binary_sha:
+        return None
+
+    offsets_offset = shas_offset + n_objects*20 + n_objects*4
+    offset, = struct.unpack_from('>L', data, offsets_offset + i*4)
+    if offset & 0x80000000:
+        large_offsets_offset = offsets_offset + n_objects*4
+        offset, = struct.unpack_from('>Q', data, large_offsets_offset + (offset & 0x7fffffff)*8)
+
+    return offset
+
+
+class _ShaList:
+    """A read-only sequence view of the sorted shas in a pack index, for bisect."""
+
+    def __init__(self, data, offset):
+        self.data = data
+        self.offset = offset
+
+    def __getitem__(self, i):
+        start = self.offset + i*20
+        return self.data[start:start + 20]
+
+
+def is_dirty_according_to_git(work_tree):
+    try:
+        output = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+            cwd=str(work_tree), stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return len(output.strip()) > 0
+
+
+def save_patch(work_tree, patch_path):
+    """Saves the uncommitted changes to tracked files (`git diff HEAD`) gzipped in `patch_path`.
+    Returns whether the patch was saved.
+    """
+    try:
+        patch = subprocess.check_output(['git', 'diff', 'HEAD', '--binary'], cwd=str(work_tree), stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return False
+
+    with gzip.open(str(patch_path), 'wb') as fp:
+        fp.write(patch)
+
+    return True
@@ -0,0 +1,309 @@
+import json
+import math
+import threading
+import time
+from pathlib import Path
+
+import attr
+
+
+DEFAULT_N_BINS = 64
+HISTOGRAM_EXTENSION = '.jsonl'
+DEFAULT_FLUSH_INTERVAL = 1.0  # Seconds
+
+# The sketch's buckets have exponentially growing widths, so any quantile is estimated with a relative error of at
+# most `RELATIVE_ACCURACY`, as long as the magnitudes of a sign fit in `MAX_SKETCH_BUCKETS` buckets (about 4.4
+# orders of magnitude). Wider ranges are collapsed by merging pairs of adjacent buckets, which doubles the range that
+# fits and roughly doubles the relative error, as many times as needed.
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+MIN_MAGNITUDE = 1e-30  # Values with a smaller magnitude are counted as zero
+MAX_SKETCH_BUCKETS = 512  # Per sign
+
+DEFAULT_QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+
+@attr.s
+class HistogramWriter:
+    """Appends histogram summaries (see `summarize`) to one json lines file per histogram in the given folder.
+
+    Lines are buffered in memory and written at most once per `flush_interval` seconds (by a timer thread, so lines
+    reach the disk even if no more summaries are added), and when the writer is closed.
+    """
+    folder = attr.ib()
+    flush_interval = attr.ib(default=DEFAULT_FLUSH_INTERVAL)
+
+    def __attrs_post_init__(self):
+        self.folder = Path(self.folder)
+        self._lines_by_name = {}
+        self._fp_by_name = {}
+        self._last_flush_time = time.time()
+        self._lock = threading.RLock()  # The timer flushes from its own thread
+        self._timer = None
+
+    def add(self, name, summary, step):
+        now = time.time()
+        line = json.dumps(dict(summary, step=step, timestamp=now))
+
+        with self._lock:
+            self._lines_by_name.setdefault(name, []).append(line + '\n')
+            self._flush_if_needed(now)
+
+    def _flush_if_needed(self, now):
+        if now - self._last_flush_time >= self.flush_interval:
+            self.flush()
+        else:
+            self._schedule_flush(self._last_flush_time + self.flush_interval - now)
+
+    def _schedule_flush(self, delay):
+        if self._timer is not None:
+            return
+
+        self._timer = threading.Timer(delay, self._flush_on_timer)
+        self._timer.name = 'exprec-histograms'
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._flush()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def flush(self):
+        with self._lock:
+            self._cancel_timer()
+            self._flush()
+
+    def _flush(self):
+        lines_by_name, self._lines_by_name = self._lines_by_name, {}
+        self._last_flush_time = time.time()
+
+        for name, lines in lines_by_name.items():
+            if name not in self._fp_by_name:
+                self.folder.mkdir(exist_ok=True, parents=True)
+                self._fp_by_name[name] = (self.folder/(name + HISTOGRAM_EXTENSION)).open('a')
+
+            fp = self._fp_by_name[name]
+            fp.write(''.join(lines))
+            fp.flush()
+
+    def close(self):
+        with self._lock:
+            self._cancel_timer()
+            self._flush()
+
+            for fp in self._fp_by_name.values():
+                fp.close()
+            self._fp_by_name = {}
+
+
+def summarize(array, n_bins=DEFAULT_N_BINS):
+    """Reduces an array of any shape to a fixed-size summary in one vectorized pass.
+
+    The summary is a dict with the number of finite values ('count') and non-finite values ('nNonFinite'), their
+    'min', 'max', 'mean' and 'std', the counts of `n_bins` equal-width bins between the min and max ('bins'), and a
+    mergeable quantile 'sketch' (see `create_sketch`).
+    """
+    import numpy as np
+
+    values = np.asarray(array, dtype=np.float64).ravel()
+    is_finite = np.isfinite(values)
+    n_non_finite = len(values) - int(is_finite.sum())
+    if n_non_finite > 0:
+        values = values[is_finite]
+
+    summary = {
+        'count': len(values),
+        'nNonFinite': n_non_finite,
+        'min': None,
+        'max': None,
+        'mean': None,
+        'std': None,
+        'bins': [],
+        'sketch': create_sketch(values),
+    }
+
+    if len(values) > 0:
+        minimum, maximum = float(values.min()), float(values.max())
+        summary.update({
+            'min': minimum,
+            'max': maximum,
+            'mean': float(values.mean()),
+            'std': float(values.std()),
+            'bins': np.histogram(values, bins=n_bins, range=(minimum, maximum))[0].tolist(),
+        })
+
+    return summary
+
+
+def create_sketch(values):
+    """Returns a DDSketch-style quantile sketch of a numpy array of finite values.
+
+    Positive and negative values are counted in separate stores of logarithmic buckets: a value `x` is counted in the
+    bucket `ceil(log(|x|) / log(GAMMA**(2**level)))`. A store is a dict with the index of its first bucket ('offset'),
+    the bucket 'counts', and the number of times its buckets have been collapsed ('level', see `RELATIVE_ACCURACY`).
+    Sketches are merged by adding their counts (see `merge_sketches`).
+    """
+    import numpy as np
+
+    return {
+        'positive': _create_store(values[values > MIN_MAGNITUDE]),
+        'negative': _create_store(-values[values < -MIN_MAGNITUDE]),
+        'zero': int((np.abs(values) <= MIN_MAGNITUDE).sum()),
+    }
+
+
+def _create_store(magnitudes):
+    import numpy as np
+
+    if len(magnitudes) == 0:
+        return {'offset': 0, 'counts': [], 'level': 0}
+
+    indices = np.ceil(np.log(magnitudes) / LOG_GAMMA).astype(np.int64)
+    offset = int(indices.min())
+
+    return _limit_store(offset, np.bincount(indices - offset), 0)
+
+
+def _limit_store(offset, counts, level):
+    # Collapses the buckets until the store has at most `MAX_SKETCH_BUCKETS` of them
+    while len(counts) > MAX_SKETCH_BUCKETS:
+        offset, counts = _collapse_buckets(offset, counts)
+        level += 1
+
+    return {'offset': int(offset), 'counts': counts.tolist(), 'level': level}
+
+
+def _collapse_buckets(offset, counts):
+    # Bucket `i` covers the magnitudes up to `gamma**i`, so buckets `2j - 1` and `2j` make up bucket `j` when gamma
+    # is squared:
+    import numpy as np
+
+    indices = -((offset + np.arange(len(counts))) // -2)  # ceil(i / 2)
+    new_offset = int(indices[0])
+    new_counts = np.zeros(int(indices[-1]) - new_offset + 1, dtype=np.int64)
+    np.add.at(new_counts, indices - new_offset, counts)
+
+    return new_offset, new_counts
+
+
+def merge_sketches(sketches):
+    """Merges sketches, e.g. of several steps or ranks, into one sketch of all their values."""
+    return {
+        'positive': _merge_stores([sketch['positive'] for sketch in sketches]),
+        'negative': _merge_stores([sketch['negative'] for sketch in sketches]),
+        'zero': sum(sketch['zero'] for sketch in sketches),
+    }
+
+
+def _merge_stores(stores):
+    import numpy as np
+
+    stores = [store for store in stores if store['counts']]
+    if not stores:
+        return {'offset': 0, 'counts': [], 'level': 0}
+
+    # The stores are collapsed to the coarsest of their levels first:
+    level = max(store.get('level', 0) for store in stores)
+    collapsed_stores = []
+    for store in stores:
+        offset, counts = store['offset'], np.asarray(store['counts'], dtype=np.int64)
+        for _ in range(level - store.get('level', 0)):
+            offset, counts = _collapse_buckets(offset, counts)
+        collapsed_stores.append((offset, counts))
+
+    offset = min(store_offset for store_offset, _ in collapsed_stores)
+    end = max(store_offset + len(store_counts) for store_offset, store_counts in collapsed_stores)
+
+    counts = np.zeros(end - offset, dtype=np.int64)
+    for store_offset, store_counts in collapsed_stores:
+        start = store_offset - offset
+        counts[start:start + len(store_counts)] += store_counts
+
+    return _limit_store(offset, counts, level)
+
+
+def get_quantiles(sketch, quantiles=DEFAULT_QUANTILES):
+    """Returns the estimated values at the given quantiles (between 0 and 1), or NaN for an empty sketch."""
+    import numpy as np
+
+    # All buckets in ascending order of value: negative buckets by descending magnitude, zero, positive buckets:
+    negative, positive = sketch['negative'], sketch['positive']
+    negative_indices = negative['offset'] + np.arange(len(negative['counts']))
+    positive_indices = positive['offset'] + np.arange(len(positive['counts']))
+
+    values = np.concatenate([
+        -_get_bucket_values(negative_indices[::-1], negative.get('level', 0)),
+        [0.0],
+        _get_bucket_values(positive_indices, positive.get('level', 0)),
+    ])
+    counts = np.concatenate([negative['counts'][::-1], [sketch['zero']], positive['counts']])
+
+    n_values = counts.sum()
+    if n_values == 0:
+        return [math.nan] * len(quantiles)
+
+    cumulative_counts = np.cumsum(counts)
+    ranks = np.asarray(quantiles) * (n_values - 1)
+
+    return values[np.searchsorted(cumulative_counts, ranks, side='right')].tolist()
+
+
+def _get_bucket_values(indices, level):
+    # The value in the middle of each bucket (relative to its width), which is within the relative accuracy of all
+    # values in it
+    gamma = GAMMA**(2**level)
+    return 2 * gamma**indices.astype(float) / (gamma + 1)
+
+
+def get_histogram_names(folder):
+    folder = Path(folder)
+    if not folder.is_dir():
+        return []
+
+    return sorted(path.stem for path in folder.glob('*' + HISTOGRAM_EXTENSION))
+
+
+def read_histogram(path):
+    """Returns the list of summaries in a histogram file. An incomplete last line (which is being written) is skipped."""
+    summaries = []
+
+    with Path(path).open() as fp:
+        for line in fp:
+            if line.endswith('\n'):
+                summaries.append(json.loads(line))
+
+    return summaries
+
+
+def get_quantiles_over_steps(summaries_by_rank, max_points, quantiles=DEFAULT_QUANTILES):
+    """Merges the summaries of all ranks by step, and the steps into at most `max_points` windows. Returns a dict with
+    the 'step' of each window (its first step) and the 'quantiles' of each window, as a list per quantile.
+    """
+    sketches_by_step = {}
+    for summaries in summaries_by_rank.values():
+        for summary in summaries:
+            sketches_by_step.setdefault(summary['step'], []).append(summary['sketch'])
+
+    steps = sorted(sketches_by_step)
+    window_size = max(1, math.ceil(len(steps) / max_points))
+
+    window_steps = []
+    quantiles_by_window = []
+    for start in range(0, len(steps), window_size):
+        window = steps[start:start + window_size]
+        sketch = merge_sketches([sketch for step in window for sketch in sketches_by_step[step]])
+
+        window_steps.append(window[0])
+        quantiles_by_window.append(get_quantiles(sketch, quantiles))
+
+    return {
+        'step': window_steps,
+        'quantiles': [list(values) for values in zip(*quantiles_by_window)] if quantiles_by_window else [[] for _ in quantiles],
+    }
@@ -1,6 +1,8 @@
 from pathlib import Path
+from html import escape
+import zlib
 import colorhash
-import pandas as pd
+import numpy as np
 from bokeh.plotting import figure, ColumnDataSource
 from bokeh.embed import components
 from bokeh.models import HoverTool
@@ -9,6 +11,11 @@ from jinja2 import Template
 
 from exprec import constants as c
 from exprec import utils
+from exprec import experiment_index
+from exprec import scalars
+from exprec import histograms
+from exprec import timers
+from exprec import profiler
 
 
 ICON_BY_STATUS = {
@@ -19,11 +26,16 @@ ICON_BY_STATUS = {
 
 FIGURE_WIDTH = 600
 FIGURE_HEIGHT = 400
+MAX_CHART_POINTS = 2 * FIGURE_WIDTH
 
 N_A = '<div style="color: #B2B2B2;">N/A</div>'
 
 N_SIGNIFICANT_DIGITS = 4
 
+FLAMEGRAPH_ROW_HEIGHT = 18  # Pixels
+MIN_FLAMEGRAPH_WIDTH = 0.001  # Frames with a smaller share of the samples aren't drawn
+N_PROFILE_DIFF_ROWS = 30
+
 
 def monospace(string):
     return "<pre>{}</pre>".format(string)
@@ -166,67 +178,224 @@ def create_charts(uuids):
         title = experiment_json['title']
         
         if title:
-            html += '{} {} - {}\n<br>'.format(color_circle(uuid), utils.get_short_uuid(uuid), title)
+            html += '{} {} - {}\n<br>'.format(color_circle(uuid), experiment_index.get_short_uuid(uuid), title)
         else:
-            html += '{} {}\n<br>'.format(color_circle(uuid), utils.get_short_uuid(uuid))
+            html += '{} {}\n<br>'.format(color_circle(uuid), experiment_index.get_short_uuid(uuid))
 
     scalar_names = get_all_scalar_names(paths)
+    system_scalar_names = [name for name in scalar_names if name.startswith(c.SYSTEM_SCALAR_PREFIX)]
+    scalar_names = [name for name in scalar_names if not name.startswith(c.SYSTEM_SCALAR_PREFIX)]
+
+    plots = [create_scalar_plot(scalar_name, uuids, paths) for scalar_name in scalar_names]
+    plots += create_histogram_plots(uuids, paths)
+    plots += create_timer_breakdowns(uuids, paths)
+
+    if system_scalar_names:
+        # The resource monitor's scalars are recorded with the milliseconds since the experiment started as steps:
+        plots.append('<h5 class="mt-4">System</h5>')
+        plots += [create_scalar_plot(scalar_name, uuids, paths, title=scalar_name[len(c.SYSTEM_SCALAR_PREFIX):], 
+            x_axis_label='Seconds', x_scale=1e-3) for scalar_name in system_scalar_names]
+
+    return html + '\n\n'.join(plots)
+
 
+def create_scalar_plot(scalar_name, uuids, paths, title=None, x_axis_label='Step', x_scale=1):
     hover = HoverTool(
         tooltips=[
-            ('step', '@x'),
+            (x_axis_label.lower(), '@x'),
             ('value', '@y'),
         ],
         mode='vline'
     )
 
+    plot = figure(
+        tools=[hover, 'reset', 'pan', 'wheel_zoom', 'box_zoom'], 
+        title=title or scalar_name,
+        x_axis_label=x_axis_label,
+        width=FIGURE_WIDTH,
+        height=FIGURE_HEIGHT,
+    )
+
+    for uuid, path in zip(uuids, paths):
+        # Long series are read from their downsampled summaries, with just enough points for the chart:
+        scalar_by_rank = scalars.read_scalar_shards(path / c.SCALARS_FOLDER, scalar_name, max_points=MAX_CHART_POINTS)
+        color = colorhash.ColorHash(uuid).rgb
+        legend = experiment_index.get_short_uuid(uuid)
+
+        if len(scalar_by_rank) == 1:
+            scalar, = scalar_by_rank.values()
+            xs, ys = np.asarray(scalar['step']) * x_scale, scalar['value']
+
+            if 'min' in scalar:
+                # The values are bucket means, which are shown with a band between each bucket's min and max:
+                plot.patch(np.concatenate([xs, xs[::-1]]), np.concatenate([scalar['max'], scalar['min'][::-1]]),
+                    fill_color=bokeh.colors.RGB(*color),
+                    fill_alpha=0.2,
+                    line_alpha=0,
+                )
+        elif len(scalar_by_rank) > 1:
+            # The shards written by the ranks of a multi-process experiment are shown as their mean, 
+            # with a band between the min and max:
+            merged = scalars.merge_shards(scalar_by_rank)
+            xs, ys = np.asarray(merged['step']) * x_scale, merged['mean']
+            legend += ' (mean of {} ranks)'.format(len(scalar_by_rank))
+
+            plot.patch(np.concatenate([xs, xs[::-1]]), np.concatenate([merged['max'], merged['min'][::-1]]),
+                fill_color=bokeh.colors.RGB(*color),
+                fill_alpha=0.2,
+                line_alpha=0,
+            )
+        else:
+            continue
+
+        source = ColumnDataSource(data={
+            'x': xs,
+            'y': ys,
+        })
+
+        plot.line('x', 'y', 
+            source=source, 
+            line_color=bokeh.colors.RGB(*color),
+            legend=legend,
+            line_width=2,
+        )
+
+    plot.legend.location = "top_left"
+    plot.legend.click_policy = "hide"
+
+    script, div = components(plot)
+    return '{}\n{}'.format(script, div)
+
+
+def create_histogram_plots(uuids, paths):
+    """Plots each histogram as bands between its quantiles over the steps, with the median as a line. The sketches 
+    of all ranks are merged per step, and consecutive steps are merged when there are more steps than chart points.
+    """
+    histogram_names = set()
+    for path in paths:
+        for rank_folder in scalars.get_rank_folders(path / c.HISTOGRAMS_FOLDER).values():
+            histogram_names.update(histograms.get_histogram_names(rank_folder))
+
     plots = []
 
-    for scalar_name in scalar_names:
+    for histogram_name in sorted(histogram_names):
         plot = figure(
-            tools=[hover, 'reset', 'pan', 'wheel_zoom', 'box_zoom'], 
-            title=scalar_name,
+            tools=['reset', 'pan', 'wheel_zoom', 'box_zoom'], 
+            title='{} (5%, 25%, 50%, 75% and 95% quantiles)'.format(histogram_name),
             x_axis_label='Step',
             width=FIGURE_WIDTH,
             height=FIGURE_HEIGHT,
         )
 
         for uuid, path in zip(uuids, paths):
-            scalar_file = path / c.SCALARS_FOLDER / '{}.csv'.format(scalar_name)
-
-            if scalar_file.is_file():
-                df = pd.read_csv(scalar_file)
-                
-                source = ColumnDataSource(data={
-                    'x': df['step'],
-                    'y': df['value'],
-                })
-
-                color = colorhash.ColorHash(uuid).rgb
-
-                plot.line('x', 'y', 
-                    source=source, 
-                    line_color=bokeh.colors.RGB(*color),
-                    legend=utils.get_short_uuid(uuid),
-                    line_width=2,
+            summaries_by_rank = {}
+            for rank, rank_folder in scalars.get_rank_folders(path / c.HISTOGRAMS_FOLDER).items():
+                histogram_path = rank_folder / (histogram_name + histograms.HISTOGRAM_EXTENSION)
+                if histogram_path.exists():
+                    summaries_by_rank[rank] = histograms.read_histogram(histogram_path)
+
+            if not summaries_by_rank:
+                continue
+
+            quantiles = histograms.get_quantiles_over_steps(summaries_by_rank, MAX_CHART_POINTS, histograms.DEFAULT_QUANTILES)
+            xs = np.array(quantiles['step'], dtype=float)
+            q05, q25, q50, q75, q95 = [np.array(values, dtype=float) for values in quantiles['quantiles']]
+            color = bokeh.colors.RGB(*colorhash.ColorHash(uuid).rgb)
+
+            for lower, upper, alpha in [(q05, q95, 0.15), (q25, q75, 0.3)]:
+                plot.patch(np.concatenate([xs, xs[::-1]]), np.concatenate([upper, lower[::-1]]),
+                    fill_color=color,
+                    fill_alpha=alpha,
+                    line_alpha=0,
                 )
 
+            plot.line(xs, q50, line_color=color, legend=experiment_index.get_short_uuid(uuid), line_width=2)
+
         plot.legend.location = "top_left"
         plot.legend.click_policy = "hide"
 
         script, div = components(plot)
         plots.append('{}\n{}'.format(script, div))
 
-    return html + '\n\n'.join(plots)
+    return plots
+
+
+def create_timer_breakdowns(uuids, paths):
+    """Shows the sections timed by each experiment (see `Experiment.timer`) as a table with one row per section, 
+    and a chart of the share of the time spent in each section, stacked. The table covers all ranks, and the chart 
+    the lowest rank.
+    """
+    html_parts = []
+
+    for uuid, path in zip(uuids, paths):
+        windows_by_rank = {}
+        for rank, rank_folder in sorted(scalars.get_rank_folders(path / c.TIMERS_FOLDER).items()):
+            timers_path = rank_folder / timers.TIMERS_FILENAME
+            if timers_path.exists():
+                windows_by_rank[rank] = timers.read_timers(timers_path)
+
+        if not any(windows_by_rank.values()):
+            continue
+
+        breakdown = timers.get_breakdown([window for windows in windows_by_rank.values() for window in windows])
+        total = sum(row['total'] for row in breakdown)
+
+        columns = ['Section', 'Calls', 'Total (s)', 'Share', 'Mean (ms)', 'p50 (ms)', 'p95 (ms)', 'Max (ms)']
+        rows = []
+        for row in breakdown:
+            rows.append({
+                'Section': color_circle_and_string(row['section']),
+                'Calls': row['count'],
+                'Total (s)': utils.round_to_significant_digits(row['total'], N_SIGNIFICANT_DIGITS),
+                'Share': '{:.1f}%'.format(100 * row['total'] / total) if total > 0 else N_A,
+                'Mean (ms)': utils.round_to_significant_digits(1000 * row['mean'], N_SIGNIFICANT_DIGITS),
+                'p50 (ms)': utils.round_to_significant_digits(1000 * row['p50'], N_SIGNIFICANT_DIGITS),
+                'p95 (ms)': utils.round_to_significant_digits(1000 * row['p95'], N_SIGNIFICANT_DIGITS),
+                'Max (ms)': utils.round_to_significant_digits(1000 * row['max'], N_SIGNIFICANT_DIGITS),
+            })
+
+        html = '<h5 class="mt-4">Timers {} {}</h5>\n'.format(color_circle(uuid), experiment_index.get_short_uuid(uuid))
+        html += create_table(columns, rows, id='timer-table-{}'.format(uuid))
+        html += '<small class="text-muted">p50 and p95 are from the latest window in which the section was timed.</small>'
+
+        # The shares are stacked as areas, with the sections with the most time at the bottom:
+        rank = min(rank for rank, windows in windows_by_rank.items() if windows)
+        names = [row['section'] for row in breakdown]
+        shares = timers.get_shares_over_time(windows_by_rank[rank], names, MAX_CHART_POINTS)
+        xs = np.array(shares['time'])
+
+        plot = figure(
+            tools=['reset', 'pan', 'wheel_zoom', 'box_zoom'], 
+            title='Share of the time per section' + (' (rank {})'.format(rank) if len(windows_by_rank) > 1 else ''),
+            x_axis_label='Seconds',
+            width=FIGURE_WIDTH,
+            height=FIGURE_HEIGHT,
+        )
+
+        bottom = np.zeros(len(xs))
+        for name, name_shares in zip(names, shares['shares']):
+            top = bottom + np.array(name_shares)
+            plot.patch(np.concatenate([xs, xs[::-1]]), np.concatenate([top, bottom[::-1]]),
+                fill_color=bokeh.colors.RGB(*colorhash.ColorHash(name).rgb),
+                fill_alpha=0.7,
+                line_alpha=0,
+                legend=name,
+            )
+            bottom = top
+
+        plot.legend.location = "top_left"
+        plot.legend.click_policy = "hide"
+
+        script, div = components(plot)
+        html_parts.append('{}\n{}\n{}'.format(html, script, div))
+
+    return html_parts
 
 
 def get_all_scalar_names(paths):
     scalar_names = set()
     for path in paths:
-        scalars_folder = path / c.SCALARS_FOLDER
-
-        scalar_paths = scalars_folder.glob('*.csv')
-        scalar_names.update(scalar_path.stem for scalar_path in scalar_paths)
+        scalar_names.update(scalars.get_all_rank_scalar_names(path / c.SCALARS_FOLDER))
     
     scalar_names = sorted(list(scalar_names))
 
@@ -237,7 +406,7 @@ def create_parameters(uuids):
     experiment_json_by_uuid = {uuid: utils.load_experiment_json(uuid) for uuid in uuids}
 
     params_by_uuid = {uuid: experiment_json['parameters'] for uuid, experiment_json in experiment_json_by_uuid.items()}
-    params_by_uuid = {utils.get_short_uuid(uuid): params for uuid, params in params_by_uuid.items()}
+    params_by_uuid = {experiment_index.get_short_uuid(uuid): params for uuid, params in params_by_uuid.items()}
 
     all_params = set()
     for params in params_by_uuid.values():
@@ -260,8 +429,118 @@ def create_parameters(uuids):
     return create_table(['Parameter', *params_by_uuid.keys()], rows, id='parameter-table', attrs=attrs)
 
 
+def create_profile(uuid):
+    path = Path(c.DEFAULT_PARENT_FOLDER)/uuid
+    count_by_stack = profiler.read_experiment_profile(path)
+    if not count_by_stack:
+        return 'No profile. Run the experiment with <code>profile=True</code> to record one.'
+
+    experiment_json = utils.load_experiment_json(uuid)
+    html = ''
+    if 'profile' in experiment_json:
+        html += '<p>{} samples, one every {} ms. Hover over a function to see its share of the samples.</p>'.format(
+            experiment_json['profile']['nSamples'], 1000 * experiment_json['profile']['intervalSeconds'])
+
+    return html + create_flamegraph(count_by_stack)
+
+
+def create_profile_diff(uuid1, uuid2):
+    """Compares the profiles of two experiments: a table of the functions whose share of the samples changed the 
+    most, and the second experiment's flamegraph, colored by how much each function's share changed.
+    """
+    count_by_stack1, count_by_stack2 = [profiler.read_experiment_profile(Path(c.DEFAULT_PARENT_FOLDER)/uuid) 
+        for uuid in (uuid1, uuid2)]
+    if not count_by_stack1 or not count_by_stack2:
+        return 'Both experiments need a profile. Run them with <code>profile=True</code> to record one.'
+
+    rows = profiler.diff_profiles(count_by_stack1, count_by_stack2)
+
+    name1, name2 = circle_with_short_uuid(uuid1), circle_with_short_uuid(uuid2)
+    columns = ['Function', 'Total ' + name1, 'Total ' + name2, 'Change', 'Self ' + name1, 'Self ' + name2]
+    item_by_column_list = []
+    for row in rows[:N_PROFILE_DIFF_ROWS]:
+        change = row['inclusive2'] - row['inclusive1']
+        item_by_column_list.append({
+            'Function': escape(row['function']),
+            'Total ' + name1: '{:.1f}%'.format(100 * row['inclusive1']),
+            'Total ' + name2: '{:.1f}%'.format(100 * row['inclusive2']),
+            'Change': '<span class="{}">{:+.1f}%</span>'.format('text-danger' if change > 0 else 'text-primary', 100 * change),
+            'Self ' + name1: '{:.1f}%'.format(100 * row['self1']),
+            'Self ' + name2: '{:.1f}%'.format(100 * row['self2']),
+        })
+
+    html = '<h5>{} <i class="material-icons">compare_arrows</i> {}</h5>'.format(name1, name2)
+    html += '<p>Shares of the samples in which each function was on the stack (total) or at the top of it (self). '
+    html += 'Functions that take a larger share in {} are red in its flamegraph, and those that take a smaller share are blue.</p>'.format(name2)
+    html += create_table(columns, item_by_column_list, id='profile-diff-table', attrs=[[('style', 'width: 100%;')]] + [[]]*5)
+
+    change_by_function = {row['function']: row['inclusive2'] - row['inclusive1'] for row in rows}
+    html += create_flamegraph(count_by_stack2, change_by_function)
+
+    return html
+
+
+def create_flamegraph(count_by_stack, change_by_function=None):
+    """Draws stacks as a flamegraph in plain html, with the roots (the threads) at the top. Each frame is a div 
+    whose width is its share of the samples. Frames are colored by their function's name, or, if 
+    `change_by_function` is given, by the change in the function's share: red if it grew and blue if it shrank. 
+    """
+    tree = profiler.build_tree(count_by_stack)
+    n_samples = tree['value']
+
+    divs = []
+    max_depth = 0
+
+    # Depth-first, with each frame's children from left to right:
+    nodes = [(tree, 0, 0.0)]
+    while nodes:
+        node, depth, left = nodes.pop()
+        width = node['value'] / n_samples
+        if width < MIN_FLAMEGRAPH_WIDTH:
+            continue
+        max_depth = max(max_depth, depth)
+
+        title = '{}\n{} samples ({:.1f}%)'.format(node['name'], node['value'], 100 * width)
+        if change_by_function is None:
+            color = get_flamegraph_color(node['name'])
+        else:
+            change = change_by_function.get(node['name'], 0.0)
+            color = get_flamegraph_change_color(change)
+            title += '\nChange: {:+.1f}%'.format(100 * change)
+
+        divs.append(
+            '<div title="{title}" style="position: absolute; left: {left:.4f}%; width: {width:.4f}%; top: {top}px; '
+            'height: {height}px; background: {color}; border: 1px solid white; overflow: hidden; white-space: nowrap; '
+            'text-overflow: ellipsis; font-size: 11px; line-height: {height}px; padding-left: 2px;">{name}</div>'.format(
+                title=escape(title), left=100 * left, width=100 * width, top=depth * FLAMEGRAPH_ROW_HEIGHT, 
+                height=FLAMEGRAPH_ROW_HEIGHT, color=color, name=escape(node['name'])))
+
+        child_left = left
+        children = []
+        for child in sorted(node['children'].values(), key=lambda child: child['name']):
+            children.append((child, depth + 1, child_left))
+            child_left += child['value'] / n_samples
+        nodes.extend(reversed(children))
+
+    return '<div style="position: relative; width: 100%; height: {}px;">{}</div>'.format(
+        (max_depth + 1) * FLAMEGRAPH_ROW_HEIGHT, '\n'.join(divs))
+
+
+def get_flamegraph_color(name):
+    # Warm colors, from red to yellow, which are stable for each function:
+    hue = zlib.crc32(name.encode()) % 60
+    return 'hsl({}, 80%, 65%)'.format(hue)
+
+
+def get_flamegraph_change_color(change):
+    # A change of 5% of the samples or more gets the strongest color:
+    intensity = min(abs(change) / 0.05, 1.0)
+    hue = 0 if change > 0 else 220
+    return 'hsl({}, {:.0f}%, {:.0f}%)'.format(hue, 80 * intensity, 92 - 30 * intensity)
+
+
 def circle_with_short_uuid(uuid):
-    return '{} {}'.format(color_circle(uuid), utils.get_short_uuid(uuid))
+    return '{} {}'.format(color_circle(uuid), experiment_index.get_short_uuid(uuid))
 
 
 def same_line(html):
@@ -0,0 +1,126 @@
+import os
+import queue
+import threading
+import traceback
+from pathlib import Path
+
+import attr
+
+
+DEFAULT_N_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 16
+
+BLOCK = 'block'
+DROP = 'drop'
+
+PNG_FORMAT = 'png'
+JPEG_FORMAT = 'jpeg'
+WEBP_FORMAT = 'webp'
+
+EXTENSION_BY_FORMAT = {
+    PNG_FORMAT: '.png',
+    JPEG_FORMAT: '.jpg',
+    WEBP_FORMAT: '.webp',
+}
+
+# For png, `quality` is the zlib compression level (0-9). For jpeg and webp, it is the quality (0-100).
+DEFAULT_QUALITY_BY_FORMAT = {
+    PNG_FORMAT: 6,
+    JPEG_FORMAT: 90,
+    WEBP_FORMAT: 80,
+}
+
+_STOP = object()
+
+
+@attr.s
+class ImageWriter:
+    """Encodes and writes images on a pool of background threads.
+
+    Images are put on a bounded queue. When the queue is full, `add` either blocks until there is room
+    (`when_full='block'`) or drops the image (`when_full='drop'`). With `n_workers=0`, images are encoded
+    synchronously in `add`. `close` waits until all queued images are written.
+    """
+    folder = attr.ib()
+    n_workers = attr.ib(default=DEFAULT_N_WORKERS)
+    queue_size = attr.ib(default=DEFAULT_QUEUE_SIZE)
+    when_full = attr.ib(default=BLOCK)
+    format = attr.ib(default=PNG_FORMAT)
+    quality = attr.ib(default=None)
+
+    def __attrs_post_init__(self):
+        if self.format not in EXTENSION_BY_FORMAT:
+            raise ValueError("Unknown image format '{}'. Valid formats: {}".format(self.format, list(EXTENSION_BY_FORMAT)))
+        if self.when_full not in (BLOCK, DROP):
+            raise ValueError("'when_full' must be '{}' or '{}', not '{}'.".format(BLOCK, DROP, self.when_full))
+
+        if self.quality is None:
+            self.quality = DEFAULT_QUALITY_BY_FORMAT[self.format]
+
+        self.folder = Path(self.folder)
+        self.n_dropped = 0
+        self._n_dropped_lock = threading.Lock()
+
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._threads = [threading.Thread(target=self._work, name='exprec-image-writer', daemon=True)
+                         for _ in range(self.n_workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def add(self, name, image, step):
+        # The image is copied, since the caller may reuse its buffer for the next step:
+        item = (name, image.copy(), step)
+
+        if not self._threads:
+            self._write(*item)
+        elif self.when_full == BLOCK:
+            self._queue.put(item)
+        else:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                with self._n_dropped_lock:  # `add` may be called from several threads
+                    self.n_dropped += 1
+
+    def close(self):
+        for _ in self._threads:
+            self._queue.put(_STOP)
+
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+
+            try:
+                self._write(*item)
+            except Exception:
+                traceback.print_exc()
+
+    def _write(self, name, image, step):
+        # Pillow (and numpy) are imported when the first image is written, to keep `import exprec` fast:
+        from PIL import Image
+
+        if not isinstance(image, Image.Image):
+            image = Image.fromarray(image)
+
+        if self.format == JPEG_FORMAT and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        image_folder = self.folder/name
+        image_folder.mkdir(exist_ok=True, parents=True)
+
+        image_path = image_folder / '{}{}'.format(step, EXTENSION_BY_FORMAT[self.format])
+        temp_path = image_path.with_name(image_path.name + '.tmp')
+
+        if self.format == PNG_FORMAT:
+            image.save(str(temp_path), format=self.format, compress_level=self.quality)
+        else:
+            image.save(str(temp_path), format=self.format, quality=self.quality)
+
+        # The image is renamed when it is completely written, so the dashboard never reads a partial image:
+        os.replace(str(temp_path), str(image_path))
@@ -0,0 +1,211 @@
+import collections
+import os
+import threading
+import time
+from pathlib import Path
+
+import attr
+
+
+DEFAULT_FLUSH_INTERVAL = 1.0  # Seconds
+DRAIN_INTERVAL = 0.1  # Seconds
+MAX_PENDING_WRITES = 10000  # The writer thread is woken up early when this many writes are pending
+ROTATED_SUFFIX = '.1'
+
+
+@attr.s
+class ThreadedLogWriter:
+    """Writes strings to log files on a background thread.
+
+    `write` only appends the string to a deque, which doesn't take a lock. The writer thread drains the deque every
+    `DRAIN_INTERVAL` seconds (or earlier if many writes are pending) into block-buffered files, which are flushed
+    every `flush_interval` seconds and when the writer is closed. See `LogFile` for `collapse_carriage_returns`
+    and `max_bytes`.
+
+    If writing the files fails, e.g. since the disk is full, the writer thread stops, and the error is raised by the
+    next call to `write` or `close`. Later writes are dropped instead of buffered.
+    """
+    folder = attr.ib()
+    filenames = attr.ib()
+    collapse_carriage_returns = attr.ib(default=False)
+    max_bytes = attr.ib(default=None)
+    flush_interval = attr.ib(default=DEFAULT_FLUSH_INTERVAL)
+
+    def __attrs_post_init__(self):
+        self._log_file_by_filename = {
+            filename: LogFile(Path(self.folder)/filename, self.collapse_carriage_returns, self.max_bytes)
+            for filename in self.filenames
+        }
+
+        self._pending_writes = collections.deque()
+        self._wake_up = threading.Event()
+        self._is_closing = False
+        self._error = None
+        self._is_error_raised = False
+
+        self._thread = threading.Thread(target=self._run, name='exprec-log-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, string, filenames):
+        if self._error is not None:
+            self._raise_error()
+            return
+
+        self._pending_writes.append((string, filenames))
+
+        if len(self._pending_writes) >= MAX_PENDING_WRITES:
+            self._wake_up.set()
+
+    def close(self):
+        self._is_closing = True
+        self._wake_up.set()
+        self._thread.join()
+
+        if self._error is not None:
+            self._raise_error()
+
+    def _raise_error(self):
+        # Raised once, so that e.g. the traceback of the error can still be printed through the tee streams:
+        if not self._is_error_raised:
+            self._is_error_raised = True
+            raise self._error
+
+    def _run(self):
+        try:
+            self._write_until_closed()
+        except Exception as error:
+            self._error = error
+            self._pending_writes.clear()
+
+            for log_file in self._log_file_by_filename.values():
+                try:
+                    log_file.close()
+                except Exception:
+                    pass
+
+    def _write_until_closed(self):
+        last_flush_time = time.time()
+
+        while not self._is_closing:
+            self._wake_up.wait(DRAIN_INTERVAL)
+            self._wake_up.clear()
+
+            self._drain()
+
+            if time.time() - last_flush_time >= self.flush_interval:
+                for log_file in self._log_file_by_filename.values():
+                    log_file.flush()
+                last_flush_time = time.time()
+
+        self._drain()
+        for log_file in self._log_file_by_filename.values():
+            log_file.close()
+
+    def _drain(self):
+        # Consecutive writes to the same files are joined, so each file gets one write per run of writes:
+        runs = []
+        for _ in range(len(self._pending_writes)):
+            string, filenames = self._pending_writes.popleft()
+            if runs and runs[-1][0] is filenames:
+                runs[-1][1].append(string)
+            else:
+                runs.append((filenames, [string]))
+
+        for filenames, strings in runs:
+            string = ''.join(strings)
+            for filename in filenames:
+                self._log_file_by_filename[filename].write(string)
+
+
+@attr.s
+class LogFile:
+    """A block-buffered log file.
+
+    With `collapse_carriage_returns`, only the text after the last carriage return of each line is written, so a
+    progress bar that redraws its line is persisted in its final state only. The current (unfinished) line is
+    kept in memory until it ends or the file is closed.
+
+    With `max_bytes`, the file is rotated when it would grow beyond `max_bytes` bytes (unless a single write is
+    larger): it is renamed with the suffix '.1' (replacing any earlier rotated file) and a new, empty file is started.
+    The file is encoded as utf-8, and the size is counted in encoded bytes.
+    """
+    path = attr.ib()
+    collapse_carriage_returns = attr.ib(default=False)
+    max_bytes = attr.ib(default=None)
+
+    def __attrs_post_init__(self):
+        self.path = Path(self.path)
+        self._fp = self.path.open('wb')
+        self._n_bytes = 0
+        self._current_line = ''
+
+    def write(self, string):
+        if not self.collapse_carriage_returns:
+            self._write(string)
+            return
+
+        text = (self._current_line + string).replace('\r\n', '\n')
+        *lines, self._current_line = text.split('\n')
+
+        if lines:
+            self._write(''.join(collapse_line(line) + '\n' for line in lines))
+
+        # A trailing carriage return is kept, since it may be the first half of a '\r\n' split between two writes:
+        if self._current_line.endswith('\r'):
+            self._current_line = collapse_line(self._current_line[:-1]) + '\r'
+        else:
+            self._current_line = collapse_line(self._current_line)
+
+    def flush(self):
+        self._fp.flush()
+
+    def close(self):
+        if self._current_line:
+            self._write(collapse_line(self._current_line.rstrip('\r')))
+            self._current_line = ''
+
+        self._fp.close()
+
+    def _write(self, string):
+        data = string.encode('utf-8', 'replace')
+
+        if self.max_bytes is not None and self._n_bytes + len(data) > self.max_bytes and self._n_bytes > 0:
+            self._rotate()
+
+        self._fp.write(data)
+        self._n_bytes += len(data)
+
+    def _rotate(self):
+        self._fp.close()
+        os.replace(str(self.path), str(self.path) + ROTATED_SUFFIX)
+
+        self._fp = self.path.open('wb')
+        self._n_bytes = 0
+
+
+def collapse_line(line):
+    return line.rpartition('\r')[2]
+
+
+@attr.s
+class TeeStream:
+    """A replacement for `sys.stdout` or `sys.stderr`, which writes to the original stream synchronously and
+    to the log writer's files asynchronously. Other attributes (e.g. `isatty` and `encoding`) are taken from
+    the original stream.
+    """
+    stream = attr.ib()
+    log_writer = attr.ib()
+    filenames = attr.ib()
+
+    def write(self, string):
+        self.stream.write(string)
+        self.log_writer.write(string, self.filenames)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        if name == 'stream':  # Not set yet, e.g. while unpickling
+            raise AttributeError(name)
+
+        return getattr(self.stream, name)
@@ -0,0 +1,78 @@
+import hashlib
+import os
+import sys
+from pathlib import Path
+
+from exprec import utils
+
+
+CACHE_FILENAME_PREFIX = 'packages-'
+
+
+def get_installed_packages(cache_folder):
+    """Returns a sorted list of the installed packages, formatted as `name==version` like `pip freeze`.
+
+    The list is cached in `cache_folder`, keyed by a fingerprint of the directories on `sys.path`, so it is only
+    recomputed when packages have been installed or removed.
+    """
+    cache_folder = Path(cache_folder)
+    cache_path = cache_folder / '{}{}.txt'.format(CACHE_FILENAME_PREFIX, get_environment_fingerprint())
+
+    try:
+        with cache_path.open() as fp:
+            return fp.read().split('\n')
+    except FileNotFoundError:
+        pass  # Not cached yet, or removed by another process that is replacing it
+
+    installed_packages_list = list_installed_packages()
+
+    # Other processes may be updating the cache at the same time:
+    cache_folder.mkdir(exist_ok=True, parents=True)
+    for old_cache_path in cache_folder.glob(CACHE_FILENAME_PREFIX + '*.txt'):
+        if old_cache_path != cache_path:
+            try:
+                os.remove(str(old_cache_path))
+            except FileNotFoundError:
+                pass
+
+    utils.write_text_atomically('\n'.join(installed_packages_list), cache_path)
+
+    return installed_packages_list
+
+
+def get_environment_fingerprint():
+    """Returns a hash of the python executable and the paths and modification times of the directories on `sys.path`.
+
+    Installing or removing a package adds or removes a directory in site-packages, which changes its modification time.
+    The script's directory and the working directory are left out, since their modification times change whenever an
+    experiment is recorded in them.
+    """
+    hasher = hashlib.sha1(sys.executable.encode('utf-8'))
+
+    excluded_paths = {os.getcwd()}
+    if sys.argv and sys.argv[0]:
+        excluded_paths.add(os.path.dirname(os.path.abspath(sys.argv[0])))
+
+    for path in sys.path:
+        path = os.path.abspath(path or '.')
+        if path not in excluded_paths and os.path.isdir(path):
+            hasher.update('{}:{}\n'.format(path, os.stat(path).st_mtime_ns).encode('utf-8'))
+
+    return hasher.hexdigest()[:16]
+
+
+def list_installed_packages():
+    try:
+        from importlib import metadata
+        distributions = [(dist.metadata['Name'], dist.version) for dist in metadata.distributions()]
+    except ImportError:  # Python < 3.8
+        import pkg_resources
+        distributions = [(dist.project_name, dist.version) for dist in pkg_resources.working_set]
+
+    # A distribution can be found in several directories on sys.path. As for imports, the first one is used:
+    version_by_name = {}
+    for name, version in distributions:
+        if name and name.lower() not in version_by_name:
+            version_by_name[name.lower()] = '{}=={}'.format(name, version)
+
+    return sorted(version_by_name.values())
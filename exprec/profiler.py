@@ -0,0 +1,190 @@
+import os
+import sys
+import threading
+import traceback
+from pathlib import Path
+
+import attr
+
+
+DEFAULT_INTERVAL = 0.01  # Seconds between samples
+PROFILE_FILENAME = 'profile.collapsed'  # Next to the log files
+INTERNAL_THREAD_PREFIX = 'exprec-'  # Exprec's own threads aren't sampled
+MAX_DEPTH = 256  # Stacks are cut off at this many frames from the root
+
+
+@attr.s
+class SamplingProfiler:
+    """Samples the stacks of all threads every `interval` seconds on a daemon thread.
+
+    The stacks are counted in memory, keyed by the ids of their code objects, so a sample only walks the frames. When
+    the profiler is closed, the counts are written in the collapsed-stack format of flamegraph tools: one line per stack, with the
+    thread's name and the stack's functions from the root, separated by semicolons, followed by a space and the number
+    of samples.
+    """
+    path = attr.ib()
+    interval = attr.ib(default=DEFAULT_INTERVAL)
+
+    def __attrs_post_init__(self):
+        self.path = Path(self.path)
+        self.n_samples = 0
+
+        self._count_by_stack = {}
+        self._code_by_id = {}
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=INTERNAL_THREAD_PREFIX + 'profiler', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self._sample()
+            except Exception:
+                traceback.print_exc()
+                return
+
+    def _sample(self):
+        name_by_thread_id = {thread.ident: thread.name for thread in threading.enumerate()}
+        count_by_stack = self._count_by_stack
+
+        for thread_id, frame in sys._current_frames().items():
+            thread_name = name_by_thread_id.get(thread_id, 'Thread-{}'.format(thread_id))
+            if thread_name.startswith(INTERNAL_THREAD_PREFIX):
+                continue
+
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            codes = codes[:-MAX_DEPTH - 1:-1]  # From the root
+
+            # Stacks are keyed by the ids of their code objects, since hashing code objects is slow. The code objects
+            # are kept, so that their ids aren't reused:
+            stack = (thread_name, *map(id, codes))
+            count = count_by_stack.get(stack)
+            if count is None:
+                for code in codes:
+                    self._code_by_id[id(code)] = code
+                count = 0
+            count_by_stack[stack] = count + 1
+
+        self.n_samples += 1
+
+    def close(self):
+        self._stop_event.set()
+        self._thread.join()
+
+        label_by_code_id = {}
+        lines = []
+        for (thread_name, *code_ids), count in self._count_by_stack.items():
+            for code_id in code_ids:
+                if code_id not in label_by_code_id:
+                    label_by_code_id[code_id] = get_label(self._code_by_id[code_id])
+
+            labels = [label_by_code_id[code_id] for code_id in code_ids]
+            lines.append('{} {}\n'.format(';'.join([sanitize(thread_name), *labels]), count))
+
+        with self.path.open('w') as fp:
+            fp.write(''.join(sorted(lines)))
+
+
+def get_label(code):
+    """Returns e.g. 'train (models/train.py:12)', with the line where the function is defined, and the path relative
+    to the working directory when the file is in it.
+    """
+    filename = code.co_filename
+    if os.path.isabs(filename):
+        relative_filename = os.path.relpath(filename)
+        if not relative_filename.startswith('..'):
+            filename = relative_filename
+
+    return sanitize('{} ({}:{})'.format(code.co_name, filename, code.co_firstlineno))
+
+
+def sanitize(label):
+    # Semicolons separate the frames, and the count follows the last space
+    return label.replace(';', ':').replace('\n', ' ')
+
+
+def read_profile(path):
+    """Returns a dict that maps each stack in a collapsed-stack file (as a tuple of frames from the root) to its number
+    of samples.
+    """
+    count_by_stack = {}
+
+    with Path(path).open() as fp:
+        for line in fp:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack:
+                frames = tuple(stack.split(';'))
+                count_by_stack[frames] = count_by_stack.get(frames, 0) + int(count)
+
+    return count_by_stack
+
+
+def read_experiment_profile(experiment_path):
+    """Returns the merged profiles of all ranks of an experiment (see `read_profile`), or None if it wasn't profiled."""
+    stem, suffix = os.path.splitext(PROFILE_FILENAME)
+    paths = sorted(Path(experiment_path).glob(stem + '*' + suffix))
+    if not paths:
+        return None
+
+    count_by_stack = {}
+    for path in paths:
+        for stack, count in read_profile(path).items():
+            count_by_stack[stack] = count_by_stack.get(stack, 0) + count
+
+    return count_by_stack
+
+
+def build_tree(count_by_stack):
+    """Merges the stacks into a tree of nested dicts, each with the frame's 'name', its number of samples ('value',
+    including its children's) and its 'children' by name.
+    """
+    root = {'name': 'all', 'value': 0, 'children': {}}
+
+    for stack, count in count_by_stack.items():
+        node = root
+        node['value'] += count
+        for frame in stack:
+            node = node['children'].setdefault(frame, {'name': frame, 'value': 0, 'children': {}})
+            node['value'] += count
+
+    return root
+
+
+def get_function_shares(count_by_stack):
+    """Returns a dict that maps each function to its share of the samples, as a tuple of the share of samples in which
+    it was on the stack (inclusive) and in which it was at the top of the stack (self).
+    """
+    n_samples = sum(count_by_stack.values())
+    inclusive_by_function = {}
+    self_by_function = {}
+
+    for stack, count in count_by_stack.items():
+        for function in set(stack[1:]):  # Recursive functions are counted once per sample
+            inclusive_by_function[function] = inclusive_by_function.get(function, 0) + count
+        if len(stack) > 1:
+            self_by_function[stack[-1]] = self_by_function.get(stack[-1], 0) + count
+
+    return {
+        function: (inclusive / n_samples, self_by_function.get(function, 0) / n_samples)
+        for function, inclusive in inclusive_by_function.items()
+    }
+
+
+def diff_profiles(count_by_stack1, count_by_stack2):
+    """Compares the shares of the samples of each function in two profiles (see `get_function_shares`). Returns a list
+    of dicts with the 'function' and its 'inclusive1', 'inclusive2', 'self1' and 'self2' shares, sorted by the largest
+    change in inclusive share first.
+    """
+    shares1 = get_function_shares(count_by_stack1)
+    shares2 = get_function_shares(count_by_stack2)
+
+    rows = []
+    for function in set(shares1) | set(shares2):
+        inclusive1, self1 = shares1.get(function, (0.0, 0.0))
+        inclusive2, self2 = shares2.get(function, (0.0, 0.0))
+        rows.append({'function': function, 'inclusive1': inclusive1, 'inclusive2': inclusive2, 'self1': self1, 'self2': self2})
+
+    return sorted(rows, key=lambda row: abs(row['inclusive2'] - row['inclusive1']), reverse=True)
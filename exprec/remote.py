@@ -0,0 +1,471 @@
+import gzip
+import hashlib
+import http.client
+import http.server
+import json
+import os
+import shutil
+import socketserver
+import struct
+import threading
+import urllib.parse
+import zlib
+from pathlib import Path, PurePosixPath
+
+import attr
+
+from exprec import constants as c
+from exprec import experiment_index
+from exprec import source_store
+from exprec import utils
+
+
+INGEST_PATH = '/ingest'
+
+DEFAULT_SYNC_INTERVAL = 2.0  # Seconds
+MAX_BATCH_BYTES = 4 * 2**20  # Uncompressed
+MAX_RECORD_BYTES = 2**20  # Larger files are sent in several records, so a batch never holds a whole checkpoint
+CONNECTION_TIMEOUT = 10  # Seconds
+
+SPOOL_FOLDER = 'spool'
+SPOOL_SUFFIX = '.spool'
+REJECTED_SUFFIX = '.rejected'  # Batches that the collector rejected are kept here instead of being resent
+SPOOL_LENGTH = struct.Struct('<Q')  # Each spooled batch is prefixed with its length
+
+# Record modes. An append record writes its data at an offset of the file, so sending it twice has no effect.
+APPEND_MODE = 'append'
+WRITE_MODE = 'write'
+BLOB_MODE = 'blob'
+DELETE_MODE = 'delete'
+
+LOG_FILENAME_PREFIXES = ('stdout', 'stderr', 'stdcombined')
+TEMP_SUFFIX = '.tmp'
+PARTIAL_SUFFIX = '.partial' + TEMP_SUFFIX  # A file whose records are still being received
+
+
+@attr.s
+class ExperimentSink:
+    """Mirrors an experiment's folder to a collector (see `serve_collector`) on a background thread.
+
+    Every `interval` seconds, new and changed files are sent in gzipped batches over a persistent HTTP connection.
+    Scalar and log files are append-only, so only their new bytes are sent. Other files (e.g. `experiment.json` and
+    images) are sent whole when they change. Files are read and sent in records of at most `MAX_RECORD_BYTES`, so
+    large files are streamed over several batches. Deleted files are deleted in the collector's store too. The source
+    code blobs listed in the experiment's manifest are sent once.
+
+    If the collector is unavailable, batches are appended to a spool file in `.exprec/.cache/spool/`, which is sent
+    before any new batch once the collector is available again. Batches that the collector rejects are kept in a
+    separate `.rejected` file next to it.
+    """
+    url = attr.ib()
+    experiment_path = attr.ib()
+    interval = attr.ib(default=DEFAULT_SYNC_INTERVAL)
+
+    def __attrs_post_init__(self):
+        self.experiment_path = Path(self.experiment_path)
+        self.uuid = self.experiment_path.name
+
+        self.spool_path = get_spool_folder(self.experiment_path.parent)/(self.uuid + SPOOL_SUFFIX)
+        self.rejected_path = get_rejected_path(self.spool_path)
+        self._client = CollectorClient(self.url)
+
+        self._state_by_path = {}  # Relative path -> (inode, size, mtime, number of bytes sent)
+        self._sent_hashes = set()
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='exprec-sink', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sync()
+
+    def close(self):
+        """Sends the remaining changes. Returns whether everything was delivered, i.e. the spool is empty."""
+        self._stop.set()
+        self._thread.join()
+
+        is_delivered = self.sync()
+        self._client.close()
+
+        return is_delivered
+
+    def sync(self):
+        """Sends all changes since the last sync. Returns whether everything was delivered."""
+        is_delivered = send_spool(self._client, self.spool_path)
+
+        for batch in self._create_batches():
+            if is_delivered:
+                is_delivered = self._client.post(batch, self.rejected_path)
+            if not is_delivered:
+                spool_batch(self.spool_path, batch)
+
+        return is_delivered
+
+    def _create_batches(self):
+        records = []
+        n_bytes = 0
+
+        for record in self._create_records():
+            if records and n_bytes + len(record[1]) > MAX_BATCH_BYTES:
+                yield encode_batch(records)
+                records = []
+                n_bytes = 0
+
+            records.append(record)
+            n_bytes += len(record[1])
+
+        if records:
+            yield encode_batch(records)
+
+    def _create_records(self):
+        relative_paths = set()
+
+        for folder, _, filenames in os.walk(str(self.experiment_path)):
+            for filename in sorted(filenames):
+                if filename.endswith(TEMP_SUFFIX):
+                    continue
+
+                path = Path(folder)/filename
+                relative_path = path.relative_to(self.experiment_path).as_posix()
+                relative_paths.add(relative_path)
+
+                try:
+                    yield from self._create_file_records(path, relative_path)
+                except FileNotFoundError:
+                    pass  # Removed while syncing, e.g. a rotated log file
+
+        for relative_path in sorted(self._state_by_path.keys() - relative_paths):
+            yield {'mode': DELETE_MODE, 'path': '{}/{}'.format(self.uuid, relative_path)}, b''
+            del self._state_by_path[relative_path]
+
+    def _create_file_records(self, path, relative_path):
+        stat = path.stat()
+        inode, size, n_bytes_sent = stat.st_ino, stat.st_size, 0
+
+        state = self._state_by_path.get(relative_path)
+        if state is not None:
+            if state[:3] == (inode, size, stat.st_mtime_ns):
+                return
+            if state[0] == inode and size >= state[3] and is_append_only(relative_path):
+                n_bytes_sent = state[3]
+
+        # The records of a rewritten file are assembled by the collector, which replaces the file with the last one:
+        mode = APPEND_MODE if n_bytes_sent > 0 else WRITE_MODE
+        offset = n_bytes_sent
+
+        with path.open('rb') as fp:
+            fp.seek(offset)
+
+            while True:
+                data = fp.read(min(size - offset, MAX_RECORD_BYTES))
+                if not data and offset < size:
+                    return  # Truncated while reading, so it's sent again by the next sync
+
+                yield {'mode': mode, 'path': '{}/{}'.format(self.uuid, relative_path), 'offset': offset, 'size': size}, data
+
+                offset += len(data)
+                if offset >= size:
+                    break
+
+        self._state_by_path[relative_path] = (inode, size, stat.st_mtime_ns, offset)
+
+        if relative_path == c.SOURCE_MANIFEST_FILENAME:
+            yield from self._create_blob_records(json.loads(path.read_text()))
+
+    def _create_blob_records(self, manifest):
+        for file_hash in sorted(set(manifest.values()) - self._sent_hashes):
+            blob_path = source_store.get_blob_path(file_hash, self.experiment_path.parent)
+            yield {'mode': BLOB_MODE, 'hash': file_hash}, blob_path.read_bytes()
+
+            self._sent_hashes.add(file_hash)
+
+
+def is_append_only(relative_path):
+    path = PurePosixPath(relative_path)
+
+    if path.parts[0] == c.SCALARS_FOLDER:
+        return path.suffix in ('.csv', '.bin')  # The summaries' tail files (.json) are rewritten
+    if path.parts[0] in (c.HISTOGRAMS_FOLDER, c.TIMERS_FOLDER):
+        return True
+
+    return len(path.parts) == 1 and path.suffix == '.txt' and path.name.startswith(LOG_FILENAME_PREFIXES)
+
+
+@attr.s
+class CollectorClient:
+    """Posts batches to a collector over a persistent connection, which is reopened after errors."""
+    url = attr.ib()
+
+    def __attrs_post_init__(self):
+        url = urllib.parse.urlsplit(self.url)
+        self.host = url.hostname
+        self.port = url.port
+        self._connection = None
+
+    def post(self, batch, rejected_path):
+        """Returns whether the batch was delivered. A batch that the collector rejects is appended to `rejected_path`."""
+        try:
+            if self._connection is None:
+                self._connection = http.client.HTTPConnection(self.host, self.port, timeout=CONNECTION_TIMEOUT)
+
+            self._connection.request('POST', INGEST_PATH, body=batch, headers={'Content-Type': 'application/octet-stream'})
+            response = self._connection.getresponse()
+            message = response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            return False
+
+        if response.status >= 500:
+            return False
+        if response.status != 200:
+            # The collector can never accept this batch, so retrying wouldn't help. It's kept for inspection:
+            spool_batch(rejected_path, batch)
+            print("The collector at {} rejected a batch, which is kept in {}: {}".format(
+                self.url, rejected_path, message.decode('utf-8', 'replace')))
+
+        return True
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def encode_batch(records):
+    """Encodes a list of (header, data) records. Each record is a json header line followed by the data."""
+    chunks = []
+    for header, data in records:
+        header = dict(header, length=len(data))
+        chunks.append(json.dumps(header).encode('utf-8') + b'\n' + data)
+
+    return gzip.compress(b''.join(chunks))
+
+
+def decode_batch(batch):
+    data = gzip.decompress(batch)
+
+    offset = 0
+    while offset < len(data):
+        end = data.index(b'\n', offset)
+        header = json.loads(data[offset:end].decode('utf-8'))
+
+        start = end + 1
+        offset = start + header['length']
+        yield header, data[start:offset]
+
+
+def spool_batch(spool_path, batch):
+    spool_path.parent.mkdir(exist_ok=True, parents=True)
+
+    with spool_path.open('ab') as fp:
+        fp.write(SPOOL_LENGTH.pack(len(batch)) + batch)
+
+
+def send_spool(client, spool_path):
+    """Sends the spooled batches in order. Returns whether all were delivered. Undelivered batches stay spooled."""
+    try:
+        fp = spool_path.open('rb')
+    except FileNotFoundError:
+        return True
+
+    with fp:
+        while True:
+            offset = fp.tell()
+            length_bytes = fp.read(SPOOL_LENGTH.size)
+            if len(length_bytes) < SPOOL_LENGTH.size:
+                break
+
+            length, = SPOOL_LENGTH.unpack(length_bytes)
+            if not client.post(fp.read(length), get_rejected_path(spool_path)):
+                fp.seek(offset)
+                _write_remainder(fp, spool_path)
+                return False
+
+    os.remove(str(spool_path))
+    return True
+
+
+def _write_remainder(fp, spool_path):
+    temp_path = '{}{}'.format(spool_path, TEMP_SUFFIX)
+    with open(temp_path, 'wb') as temp_fp:
+        shutil.copyfileobj(fp, temp_fp)
+
+    os.replace(temp_path, str(spool_path))
+
+
+def send_spools(url, parent_folder=c.DEFAULT_PARENT_FOLDER):
+    """Sends all spooled batches in the given folder to the collector at `url`. Returns the number of undelivered spools."""
+    client = CollectorClient(url)
+
+    n_undelivered = 0
+    for spool_path in sorted(get_spool_folder(parent_folder).glob('*' + SPOOL_SUFFIX)):
+        if not send_spool(client, spool_path):
+            n_undelivered += 1
+
+    client.close()
+
+    return n_undelivered
+
+
+def get_spool_folder(parent_folder=c.DEFAULT_PARENT_FOLDER):
+    return Path(parent_folder)/c.CACHE_FOLDER/SPOOL_FOLDER
+
+
+def get_rejected_path(spool_path):
+    return spool_path.with_suffix(REJECTED_SUFFIX)
+
+
+def apply_batch(batch, parent_folder=c.DEFAULT_PARENT_FOLDER):
+    """Writes the records of a batch into the store in `parent_folder`. Returns the number of records.
+
+    Experiment folders are created through the store's index, so that a dashboard in `parent_folder` doesn't need to
+    rebuild it. Raises a ValueError for a malformed batch and an OSError if the store can't be written.
+    """
+    try:
+        records = list(decode_batch(batch))
+    except (OSError, EOFError, zlib.error) as e:
+        # Raised by gzip for a malformed batch. Other OSErrors are failed writes into the store:
+        raise ValueError('The batch is not valid gzip data: {}'.format(e))
+
+    n_records = 0
+
+    for header, data in records:
+        if header['mode'] == BLOB_MODE:
+            if hashlib.sha256(data).hexdigest() != header['hash']:
+                raise ValueError("The content of blob '{}' doesn't match its hash.".format(header['hash']))
+            source_store.write_blob(header['hash'], data, parent_folder)
+        else:
+            path = get_record_path(parent_folder, header['path'])
+            create_experiment_folder(parent_folder, PurePosixPath(header['path']).parts[0])
+
+            if header['mode'] == DELETE_MODE:
+                try:
+                    os.remove(str(path))
+                except FileNotFoundError:
+                    pass
+            else:
+                path.parent.mkdir(exist_ok=True, parents=True)
+
+                if header['mode'] == APPEND_MODE:
+                    with path.open('r+b' if path.exists() else 'wb') as fp:
+                        fp.seek(header['offset'])
+                        fp.write(data)
+                elif header['mode'] == WRITE_MODE:
+                    write_record(path, header['offset'], header.get('size', header['offset'] + len(data)), data)
+                else:
+                    raise ValueError("Unknown record mode '{}'.".format(header['mode']))
+
+                if header['path'].count('/') == 1 and path.name == c.METADATA_JSON_FILENAME and path.exists():
+                    register_name(parent_folder, path)
+
+        n_records += 1
+
+    return n_records
+
+
+def create_experiment_folder(parent_folder, uuid):
+    if (Path(parent_folder)/uuid).exists():
+        return
+
+    try:
+        experiment_index.create_experiment_folder(uuid, '', parent_folder)
+    except FileExistsError:
+        pass  # Created by a concurrent batch
+
+
+def register_name(parent_folder, metadata_json_path):
+    try:
+        name = utils.load_json(str(metadata_json_path))['name']
+    except (ValueError, KeyError):
+        return
+
+    if name:
+        experiment_index.set_experiment_name(metadata_json_path.parent.name, name, parent_folder)
+
+
+def write_record(path, offset, size, data):
+    """Writes one record of a rewritten file into a partial file, which replaces the file once it's complete."""
+    partial_path = Path('{}{}'.format(path, PARTIAL_SUFFIX))
+
+    if offset == 0:
+        fp = partial_path.open('wb')
+    else:
+        try:
+            fp = partial_path.open('r+b')
+        except FileNotFoundError:
+            if path.exists() and path.stat().st_size == size:
+                return  # The last record was sent again, e.g. from the spool after a timeout
+            raise ValueError("Record at offset {} of '{}' arrived before the previous ones.".format(offset, path))
+
+    with fp:
+        # A record that was sent again overwrites its previous copy:
+        if fp.seek(0, os.SEEK_END) < offset:
+            raise ValueError("Record at offset {} of '{}' arrived before the previous ones.".format(offset, path))
+        fp.seek(offset)
+        fp.truncate()
+        fp.write(data)
+
+    if offset + len(data) >= size:
+        os.replace(str(partial_path), str(path))
+
+
+def get_record_path(parent_folder, relative_path):
+    """Returns the path of a file inside an experiment folder. Raises a ValueError for any other path."""
+    relative_path = PurePosixPath(relative_path)
+
+    if relative_path.is_absolute() or '..' in relative_path.parts or len(relative_path.parts) < 2 \
+            or utils.is_hidden_path(Path(relative_path.parts[0])):
+        raise ValueError("Invalid record path '{}'.".format(relative_path))
+
+    return Path(parent_folder)/relative_path
+
+
+class CollectorRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keeps connections open between batches
+    parent_folder = c.DEFAULT_PARENT_FOLDER
+
+    def do_POST(self):
+        if self.path != INGEST_PATH:
+            self._respond(404, 'Unknown path.')
+            return
+
+        batch = self.rfile.read(int(self.headers['Content-Length']))
+
+        try:
+            n_records = apply_batch(batch, self.parent_folder)
+        except (ValueError, KeyError, zlib.error) as e:
+            self._respond(400, str(e))
+            return
+        except OSError as e:
+            # E.g. a full disk. The sink spools the batch and sends it again later:
+            self._respond(503, str(e))
+            return
+
+        self._respond(200, '{} record(s) written.'.format(n_records))
+
+    def _respond(self, status, message):
+        body = message.encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # A request is made every few seconds by every running experiment
+
+
+class CollectorServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def serve_collector(host, port, parent_folder=c.DEFAULT_PARENT_FOLDER):
+    """Returns a collector server that writes received experiments into `parent_folder`. Call `serve_forever()` to
+    start it. With `port=0`, a free port is chosen, which is available in `server.server_address`.
+    """
+    Path(parent_folder).mkdir(exist_ok=True, parents=True)
+
+    handler_class = type('Handler', (CollectorRequestHandler,), {'parent_folder': parent_folder})
+    return CollectorServer((host, port), handler_class)
@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+import traceback
+
+import attr
+import psutil
+
+from exprec import scalars
+from exprec import constants as c
+
+
+BYTES_PER_MB = 2**20
+
+
+@attr.s
+class ResourceMonitor:
+    """Samples the resource usage of the process and the system on a daemon thread, every `interval` seconds.
+
+    The samples are recorded as scalars named `system.<metric>` (see `c.SYSTEM_SCALAR_PREFIX`), with the milliseconds
+    since the monitor started as the step. They're written by a scalar writer of their own, so that sampling never
+    waits for the experiment's scalar writer.
+
+    Metrics that psutil doesn't support on the platform are skipped. Each sample reads a few files in /proc on Linux,
+    which takes well under a millisecond.
+    """
+    folder = attr.ib()
+    interval = attr.ib()
+    scalar_format = attr.ib(default=scalars.CSV_FORMAT)
+
+    def __attrs_post_init__(self):
+        if self.interval <= 0:
+            raise ValueError("The resource monitor's interval must be positive, not {}.".format(self.interval))
+
+        self._writer = scalars.ScalarWriter(self.folder, format=self.scalar_format)
+        self._process = psutil.Process(os.getpid())
+        self._stop_event = threading.Event()
+
+        self._start_time = time.perf_counter()
+        self._last_time = self._start_time
+        self._last_counters = self._read_counters()
+
+        # The first call only sets the reference point of the CPU percentages:
+        self._process.cpu_percent(interval=None)
+        psutil.cpu_times_percent(interval=None)
+
+        self._thread = threading.Thread(target=self._run, name='exprec-resource-monitor', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        # Samples are taken on a fixed schedule, so that the steps of all ranks line up, and the time spent
+        # sampling doesn't accumulate:
+        n_samples = 0
+        while True:
+            n_samples += 1
+            if self._stop_event.wait(max(self._start_time + n_samples * self.interval - time.perf_counter(), 0)):
+                return
+
+            try:
+                self._sample(step=int(round(n_samples * self.interval * 1000)))
+            except Exception:
+                traceback.print_exc()
+                return
+
+    def _sample(self, step):
+        now = time.perf_counter()
+        value_by_name = {}
+
+        with self._process.oneshot():
+            value_by_name['cpu.process_percent'] = self._process.cpu_percent(interval=None)
+            value_by_name['memory.rss_mb'] = self._process.memory_info().rss / BYTES_PER_MB
+            value_by_name['open_files'] = get_n_open_files(self._process)
+
+        cpu_times = psutil.cpu_times_percent(interval=None)
+        iowait = getattr(cpu_times, 'iowait', 0.0)  # Only on Linux
+        value_by_name['cpu.system_percent'] = 100.0 - cpu_times.idle - iowait
+        if hasattr(cpu_times, 'iowait'):
+            value_by_name['cpu.iowait_percent'] = iowait
+
+        value_by_name['memory.system_percent'] = psutil.virtual_memory().percent
+
+        # Byte counters are recorded as rates since the previous sample:
+        counters = self._read_counters()
+        seconds = max(now - self._last_time, 1e-9)
+        for name, count in counters.items():
+            if name in self._last_counters:
+                value_by_name[name] = (count - self._last_counters[name]) / BYTES_PER_MB / seconds
+        self._last_counters, self._last_time = counters, now
+
+        self._writer.add_many({c.SYSTEM_SCALAR_PREFIX + name: value for name, value in value_by_name.items()}, step)
+
+    def _read_counters(self):
+        counters = {}
+
+        try:
+            io_counters = self._process.io_counters()  # Not supported on macOS
+            counters['disk.read_mb_per_s'] = io_counters.read_bytes
+            counters['disk.write_mb_per_s'] = io_counters.write_bytes
+        except (AttributeError, psutil.Error):
+            pass
+
+        net_io_counters = psutil.net_io_counters()
+        if net_io_counters is not None:
+            counters['network.sent_mb_per_s'] = net_io_counters.bytes_sent
+            counters['network.received_mb_per_s'] = net_io_counters.bytes_recv
+
+        return counters
+
+    def close(self):
+        self._stop_event.set()
+        self._thread.join()
+        self._writer.close()
+
+
+def get_n_open_files(process):
+    # The number of file descriptors is much cheaper to get than the list of open files
+    if hasattr(process, 'num_fds'):
+        return process.num_fds()
+
+    return process.num_handles()  # Windows
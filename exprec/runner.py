@@ -3,26 +3,48 @@ import uuid
 from pathlib import Path
 import sys
 import datetime
-import json
-import shutil
-import logging
-import subprocess
 import traceback
 import platform
 import os
-import numpy as np
-from PIL import Image
-import git
+import threading
+import time
 import re
 
 from exprec import utils
+from exprec import scalars
+from exprec import image_writer
+from exprec import histograms
+from exprec import timers
+from exprec import profiler
+from exprec import artifact_store
+from exprec import packages
+from exprec import source_store
+from exprec import experiment_index
+from exprec import log_writer
+from exprec import git_info
+from exprec import call_queue
 from exprec import constants as c
 
 METADATA_JSON_FILENAME = 'experiment.json'
 PACKAGES_FILENAME = 'pip_freeze.txt'
 FILES_FOLDER = 'files'
+ARRAY_EXTENSION = '.npy'
 
-SHORT_GIT_SHA_LENGTH = 7
+DEFAULT_METADATA_WRITE_INTERVAL = 1.0  # Seconds
+
+SYNC_LOG_MODE = 'sync'
+THREADED_LOG_MODE = 'threaded'
+
+STDOUT_FILENAME = 'stdout.txt'
+STDERR_FILENAME = 'stderr.txt'
+STDCOMBINED_FILENAME = 'stdcombined.txt'
+
+# Set by the launcher of a multi-process job, so that all processes join the same experiment:
+UUID_ENVIRONMENT_VARIABLE = 'EXPREC_UUID'
+SINK_URL_ENVIRONMENT_VARIABLE = 'EXPREC_SINK_URL'
+RANK_ENVIRONMENT_VARIABLES = ['EXPREC_RANK', 'RANK']  # RANK is set by e.g. torch.distributed's launchers
+RANK_SUFFIX = '.rank-{}'  # Added to the metadata, log and image names of ranks other than 0
+JOIN_TIMEOUT = 300  # Seconds that a rank other than 0 waits for rank 0 to create the experiment
 
 
 @attr.s
@@ -32,49 +54,193 @@ class Experiment:
     verbose = attr.ib(default=True)
     exceptions_to_ignore = attr.ib(default=[KeyboardInterrupt])
     name = attr.ib(default='')
+    scalar_buffer_size = attr.ib(default=scalars.DEFAULT_BUFFER_SIZE)
+    scalar_flush_interval = attr.ib(default=scalars.DEFAULT_FLUSH_INTERVAL)
+    scalar_format = attr.ib(default=scalars.CSV_FORMAT)
+    scalar_lod = attr.ib(default=True)
+    image_workers = attr.ib(default=image_writer.DEFAULT_N_WORKERS)
+    image_queue_size = attr.ib(default=image_writer.DEFAULT_QUEUE_SIZE)
+    image_when_full = attr.ib(default=image_writer.BLOCK)
+    image_format = attr.ib(default=image_writer.PNG_FORMAT)
+    image_quality = attr.ib(default=None)
+    metadata_write_interval = attr.ib(default=DEFAULT_METADATA_WRITE_INTERVAL)
+    background_setup = attr.ib(default=False)
+    log_mode = attr.ib(default=SYNC_LOG_MODE)
+    collapse_carriage_returns = attr.ib(default=False)
+    max_log_bytes = attr.ib(default=None)
+    save_git_patch = attr.ib(default=False)
+    uuid = attr.ib(default=None)
+    rank = attr.ib(default=None)
+    thread_safe = attr.ib(default=False)
+    sink_url = attr.ib(default=None)
+    deduplicate_files = attr.ib(default=False)
+    monitor_resources = attr.ib(default=None)
+    timer_window = attr.ib(default=timers.DEFAULT_WINDOW)
+    profile = attr.ib(default=False)
+    profile_interval = attr.ib(default=profiler.DEFAULT_INTERVAL)
 
     def __attrs_post_init__(self):
         self.name = self.name.strip()
         self.title = self.title.strip()
 
-        self.uuid = str(uuid.uuid1())  # Time UUID
+        if self.rank is None:
+            self.rank = get_rank_from_environment()
+
+        # The uuid is only shared by the processes of a multi-process launch, so that a variable left over in the
+        # shell doesn't make a later run reuse the uuid of another experiment:
+        if self.uuid is None and self.rank is not None:
+            self.uuid = os.environ.get(UUID_ENVIRONMENT_VARIABLE)
+
+        if self.uuid is None:
+            self.uuid = str(uuid.uuid1())  # Time UUID
+            self.rank = 0
+        elif self.rank is None:
+            self.rank = 0
+
+        self.is_primary = self.rank == 0
+
+        if self.sink_url is None:
+            self.sink_url = os.environ.get(SINK_URL_ENVIRONMENT_VARIABLE)
         self.path = Path(c.DEFAULT_PARENT_FOLDER) / self.uuid
 
         pattern = re.compile(c.TAG_REGEX_PATTERN)
         if not all(pattern.match(tag) for tag in self.tags):
             raise ValueError("Invalid tag(s). A tag can only include lower case ascii, 0-9 and hyphens.")
 
+        if self.log_mode not in (SYNC_LOG_MODE, THREADED_LOG_MODE):
+            raise ValueError("'log_mode' must be '{}' or '{}', not '{}'.".format(SYNC_LOG_MODE, THREADED_LOG_MODE, self.log_mode))
+
     def __enter__(self):
-        Path(c.DEFAULT_PARENT_FOLDER).mkdir(exist_ok=True)
+        setup_start_time = time.perf_counter()
+
+        if not self.is_primary:
+            return self._join(setup_start_time)
 
-        if not is_name_available(self.name, c.DEFAULT_PARENT_FOLDER):
-            raise ValueError("Name '{}' is already occupied.".format(self.name))
+        Path(c.DEFAULT_PARENT_FOLDER).mkdir(exist_ok=True)
 
-        self.path.mkdir(exist_ok=False)
+        experiment_index.create_experiment_folder(self.uuid, self.name)
 
         if self.verbose:
-            string = 'Running experiment ' + utils.get_short_uuid(self.uuid)
+            string = 'Running experiment ' + experiment_index.get_short_uuid(self.uuid)
             if self.name:
                 string += " (alias '{}')".format(self.name)
             if self.title:
                 string += ': ' + self.title
             print(string)
         
-        setup_procedure(self.path, self.name, self.title, self.tags)
+        self._metadata = create_metadata_json(self.path, self.name, self.title, self.tags, self.metadata_write_interval)
+        source_store.snapshot_source_code(source_path='.', experiment_path=self.path)
 
-        self._create_streams()
+        # The commit, dirty flag and patch describe the code that runs, so they're recorded before it can change:
+        record_git_metadata(self.path, self._metadata, self.save_git_patch)
+
+        if self.background_setup:
+            self._setup_thread = threading.Thread(target=self._run_background_setup, name='exprec-setup', daemon=True)
+            self._setup_thread.start()
+        else:
+            self._setup_thread = None
+            create_pip_freeze_file(self.path)
+
+        self._create_writers()
+
+        # With ranks, rank 0 mirrors the whole experiment folder, including the other ranks' files:
+        if self.sink_url:
+            from exprec import remote  # Imported here, since the http modules are slow to import
+            self._sink = remote.ExperimentSink(self.sink_url, self.path)
+        else:
+            self._sink = None
+
+        with self._metadata as metadata:
+            metadata['setupSeconds']['blocking'] = time.perf_counter() - setup_start_time
+        self._update_catalog()
 
         return self
 
-    def _create_streams(self):
-        self.stdout_logfile = (self.path/'stdout.txt').open('w')
-        self.stderr_logfile = (self.path/'stderr.txt').open('w')
-        self.stdcombined_logfile = (self.path/'stdcombined.txt').open('w')
+    def _join(self, setup_start_time):
+        # Ranks other than 0 join the experiment created by rank 0. They skip the setup, and write their own metadata,
+        # logs, images and scalar shard, so that no files are shared between processes.
+        wait_for_file(self.path/METADATA_JSON_FILENAME, JOIN_TIMEOUT)
+
+        self._metadata = create_rank_metadata_json(self.path, self.rank, self.metadata_write_interval)
+        self._setup_thread = None
+        self._sink = None
 
+        self._create_writers()
+
+        with self._metadata as metadata:
+            metadata['setupSeconds']['blocking'] = time.perf_counter() - setup_start_time
+
+        return self
+
+    def _create_writers(self):
+        self._call_queue = call_queue.CallQueue() if self.thread_safe else None
+        self._deduplicator = artifact_store.ArtifactDeduplicator(self.path) if self.deduplicate_files else None
+
+        self._scalar_writer = scalars.ScalarWriter(scalars.get_rank_folder(self.path/c.SCALARS_FOLDER, self.rank), 
+            buffer_size=self.scalar_buffer_size, flush_interval=self.scalar_flush_interval, format=self.scalar_format, 
+            lod=self.scalar_lod)
+        self._histogram_writer = histograms.HistogramWriter(scalars.get_rank_folder(self.path/c.HISTOGRAMS_FOLDER, self.rank), 
+            flush_interval=self.scalar_flush_interval)
+        self._timers = timers.SectionTimers(scalars.get_rank_folder(self.path/c.TIMERS_FOLDER, self.rank), window=self.timer_window)
+        self._image_writer = image_writer.ImageWriter(self.path/c.IMAGE_FOLDER, n_workers=self.image_workers, 
+            queue_size=self.image_queue_size, when_full=self.image_when_full, format=self.image_format, quality=self.image_quality)
+
+        if self.monitor_resources:
+            from exprec import resource_monitor  # Imported here, since psutil is slow to import
+            self._resource_monitor = resource_monitor.ResourceMonitor(
+                scalars.get_rank_folder(self.path/c.SCALARS_FOLDER, self.rank), self.monitor_resources, 
+                scalar_format=self.scalar_format)
+        else:
+            self._resource_monitor = None
+
+        self._create_streams()
+
+        if self.profile:
+            profile_filename = self._get_rank_name(Path(profiler.PROFILE_FILENAME).stem) + Path(profiler.PROFILE_FILENAME).suffix
+            self._profiler = profiler.SamplingProfiler(self.path/profile_filename, interval=self.profile_interval)
+        else:
+            self._profiler = None
+
+    def _update_catalog(self):
+        # The catalog is only a cache for the dashboard, which reconciles it with the experiment folders, so it's
+        # updated on a daemon thread that never delays or fails the experiment. An update that is skipped, e.g. since
+        # the dashboard holds the catalog's lock, or that is overtaken by a later one, is repaired by the dashboard,
+        # which compares the cataloged metadata file's mtime.
+        threading.Thread(target=update_catalog, args=(self.uuid,), name='exprec-catalog', daemon=True).start()
+
+    def _get_rank_name(self, name):
+        return name if self.is_primary else name + RANK_SUFFIX.format(self.rank)
+
+    def _run_background_setup(self):
+        start_time = time.perf_counter()
+
+        try:
+            create_pip_freeze_file(self.path)
+        except Exception:
+            traceback.print_exc()
+
+        with self._metadata as metadata:
+            metadata['setupSeconds']['background'] = time.perf_counter() - start_time
+
+    def _create_streams(self):
         self.stdout = sys.stdout
         self.stderr = sys.stderr
-        stdout_stream = MultiStream([sys.stdout, self.stdout_logfile, self.stdcombined_logfile])
-        stderr_stream = MultiStream([sys.stderr, self.stderr_logfile, self.stdcombined_logfile])
+
+        stdout_filename, stderr_filename, stdcombined_filename = [self._get_rank_name(Path(filename).stem) + Path(filename).suffix 
+            for filename in (STDOUT_FILENAME, STDERR_FILENAME, STDCOMBINED_FILENAME)]
+
+        if self.log_mode == THREADED_LOG_MODE:
+            self._log_writer = log_writer.ThreadedLogWriter(self.path, [stdout_filename, stderr_filename, stdcombined_filename], 
+                collapse_carriage_returns=self.collapse_carriage_returns, max_bytes=self.max_log_bytes)
+            stdout_stream = log_writer.TeeStream(sys.stdout, self._log_writer, [stdout_filename, stdcombined_filename])
+            stderr_stream = log_writer.TeeStream(sys.stderr, self._log_writer, [stderr_filename, stdcombined_filename])
+        else:
+            self.stdout_logfile = (self.path/stdout_filename).open('w')
+            self.stderr_logfile = (self.path/stderr_filename).open('w')
+            self.stdcombined_logfile = (self.path/stdcombined_filename).open('w')
+
+            stdout_stream = MultiStream([sys.stdout, self.stdout_logfile, self.stdcombined_logfile])
+            stderr_stream = MultiStream([sys.stderr, self.stderr_logfile, self.stdcombined_logfile])
 
         sys.stdout = stdout_stream
         sys.stderr = stderr_stream
@@ -84,15 +250,73 @@ class Experiment:
         if reraise_exception:
             traceback.print_exception(exc_type, exc_value, tb)
 
-        self._close_streams()
+        if self._profiler is not None:
+            self._profiler.close()
 
-        with utils.UpdateJsonFile(str(self.path/METADATA_JSON_FILENAME)) as metadata:
-            metadata['status'] = 'failed' if reraise_exception else 'succeeded'
+        if self._setup_thread is not None:
+            self._setup_thread.join()
+
+        # A write that failed on the writer thread or the log writer's thread fails the experiment, after everything
+        # else has been closed:
+        writer_error = None
+        if self._call_queue is not None:
+            try:
+                self._call_queue.close()
+            except Exception as error:
+                writer_error = error
+
+        self._image_writer.close()
+
+        try:
+            self._close_streams()
+        except Exception as error:
+            writer_error = writer_error or error
+
+        self._scalar_writer.close()
+        self._histogram_writer.close()
+        self._timers.close()
+
+        if self._resource_monitor is not None:
+            self._resource_monitor.close()
+
+        if self._deduplicator is not None:
+            self._deduplicator.close()
+
+        if self._image_writer.n_dropped > 0 and self.verbose:
+            print('{} image(s) were dropped since the image queue was full.'.format(self._image_writer.n_dropped))
+
+        with self._metadata as metadata:
+            metadata['status'] = 'failed' if reraise_exception or writer_error is not None else 'succeeded'
             metadata['endedDatetime'] = datetime.datetime.now().isoformat()
 
+            # The experiment failed if any rank failed. Ranks that are still running can't be taken into account.
+            if self.is_primary:
+                rank_statuses = get_rank_statuses(self.path)
+                if rank_statuses:
+                    metadata['rankStatuses'] = {str(rank): status for rank, status in rank_statuses.items()}
+                if 'failed' in rank_statuses.values():
+                    metadata['status'] = 'failed'
+
+            if self._profiler is not None:
+                metadata['profile'] = {'intervalSeconds': self.profile_interval, 'nSamples': self._profiler.n_samples}
+
             if reraise_exception:
                 metadata['exceptionType'] = exc_type.__name__
                 metadata['exceptionValue'] = str(exc_value)
+            elif writer_error is not None:
+                metadata['exceptionType'] = type(writer_error).__name__
+                metadata['exceptionValue'] = str(writer_error)
+        self._metadata.close()
+
+        if self.is_primary:
+            self._update_catalog()
+
+        if self._sink is not None and not self._sink.close():
+            print("The collector at {} is unavailable. The remaining data is spooled in '{}'. "
+                "Send it with `exprec --send-spool {}`.".format(self.sink_url, self._sink.spool_path, self.sink_url))
+
+        if writer_error is not None and not reraise_exception:
+            raise writer_error
 
         if exc_type is not None:
             return not reraise_exception
@@ -101,51 +325,131 @@ class Experiment:
         sys.stdout = self.stdout
         sys.stderr = self.stderr
 
-        self.stdout_logfile.close()
-        self.stderr_logfile.close()
-        self.stdcombined_logfile.close()
+        if self.log_mode == THREADED_LOG_MODE:
+            self._log_writer.close()
+        else:
+            self.stdout_logfile.close()
+            self.stderr_logfile.close()
+            self.stdcombined_logfile.close()
     
     def set_parameter(self, name, value):
         """Sets the parameter to the given value. 
 
         Only one value can be recorded per parameter. You can overwrite a previously set parameter. 
+        Parameters are kept in memory and written to disk at most once per `metadata_write_interval` seconds. 
+        """
+        self._write(self._update_parameters, {name: value})
+
+    def set_parameters(self, value_by_name):
+        """Sets several parameters at once, e.g. `experiment.set_parameters({'learning_rate': 0.1, 'batch_size': 32})`. 
+
+        See `set_parameter`. 
         """
-        json_path = self.path / METADATA_JSON_FILENAME
-        with utils.UpdateJsonFile(str(json_path)) as metadata_json:
-            metadata_json['parameters'][name] = value
+        self._write(self._update_parameters, dict(value_by_name))
+
+    def _update_parameters(self, value_by_name):
+        with self._metadata as metadata:
+            metadata['parameters'].update(value_by_name)
 
     def add_scalar(self, name, value, step=None):
         """Records the scalar's value at a given step. 
 
         The timestamp for setting this value is recorded as well, which can be accessed from the dashboard. 
+        Values are buffered in memory and written to disk in batches (see `scalar_buffer_size` and 
+        `scalar_flush_interval`). All buffered values are written when the experiment exits. 
         """
-        scalar_folder_path = self.path / c.SCALARS_FOLDER
-        scalar_folder_path.mkdir(exist_ok=True)
-        scalar_filepath = scalar_folder_path / '{}.csv'.format(name)
+        check_scalar_name(name)
+        self._write(self._scalar_writer.add, name, value, step, time.time())
 
-        if not scalar_filepath.exists():
-            with scalar_filepath.open('w') as fp:
-                fp.write(','.join(c.SCALARS_HEADER_FIELDS) + '\n')
-        
-        with scalar_filepath.open('a') as fp:
-            fp.write('{},{},{}\n'.format(step if step is not None else '', value, datetime.datetime.now().isoformat()))
+    def add_scalars(self, value_by_name, step=None):
+        """Records the values of several scalars at a given step. 
+
+        Args:
+            value_by_name (dict): Maps scalar names to values, e.g. `{'loss': 0.3, 'accuracy': 0.9}`
+            step (int, None)
+        """
+        for name in value_by_name:
+            check_scalar_name(name)
+        self._write(self._scalar_writer.add_many, dict(value_by_name), step, time.time())
+
+    def add_scalar_series(self, name, values, steps=None):
+        """Records a whole series of values for a scalar in one write. 
+
+        Args:
+            name (str): The name of the scalar
+            values: A sequence of values, e.g. a 1-d numpy array
+            steps: A sequence of steps with the same length as `values`. Defaults to `0, 1, ..., len(values) - 1`. 
+        """
+        check_scalar_name(name)
+        if steps is None:
+            steps = range(len(values))
+        elif len(values) != len(steps):
+            # Checked here, since in thread-safe mode the series is written on another thread:
+            raise ValueError("'values' and 'steps' must have the same length ({} != {}).".format(len(values), len(steps)))
+
+        if self._call_queue is not None:
+            # The series is written later, so it's copied in case the caller modifies it in the meantime:
+            values, steps = copy_sequence(values), copy_sequence(steps)
+
+        self._write(self._scalar_writer.add_series, name, values, steps, time.time())
+
+    def _write(self, function, *args):
+        # In thread-safe mode, all writes are made by the call queue's thread. Otherwise, they're made directly.
+        if self._call_queue is not None:
+            self._call_queue.put(function, *args)
+        else:
+            function(*args)
+
+    def add_histogram(self, name, array, step, n_bins=histograms.DEFAULT_N_BINS):
+        """Records the distribution of an array's values at a given step, e.g. of a layer's weights or gradients. 
+
+        The array is reduced to a fixed-size summary on the calling thread: its count, min, max, mean and standard 
+        deviation, `n_bins` equal-width bins between the min and max, and a quantile sketch with a relative accuracy 
+        of 1% (or coarser, for values that span more than about 4 orders of magnitude). Non-finite values are only 
+        counted. 
+
+        Args:
+            name (str): The name of the histogram
+            array: A numpy array (or anything that can be converted to one) of any shape
+            step (int)
+            n_bins (int)
+        """
+        self._write(self._histogram_writer.add, name, histograms.summarize(array, n_bins), step)
+
+    def timer(self, name):
+        """Times a section of code, e.g. data loading or a forward pass. Use it as a context manager: 
+
+            with experiment.timer('data'):
+                batch = next(loader)
+
+        or as a decorator: 
+
+            @experiment.timer('evaluate')
+            def evaluate(model): 
+                ...
+
+        The durations are aggregated in memory, and the count, total, mean, p50, p95 and max of each section are 
+        written once per `timer_window` seconds, so timing a section costs about a microsecond. 
+
+        Args:
+            name (str): The name of the section
+        Returns:
+            A context manager that can be used as a decorator as well. A new one is returned on each call. 
+        """
+        return self._timers.section(name)
 
     def add_image(self, name, image, step):
         """Adds an image at a given step. 
 
+        The image is encoded and written on a background thread (see `image_workers`, `image_queue_size`, 
+        `image_when_full`, `image_format` and `image_quality`). All queued images are written when the experiment exits. 
+
         Args:
             name (str): The name of the image
             image: The image to save. Should either be a Pillow image, or a numpy array which can be converted to a Pillow image. 
             step (int)
         """
-        if type(image) == np.ndarray:
-            image = Image.fromarray(image)
-        
-        image_folder = self.path/c.IMAGE_FOLDER/name
-        image_folder.mkdir(exist_ok=True, parents=True)
-
-        image_path = image_folder / '{}.png'.format(step)
-        image.save(image_path)
+        self._image_writer.add(self._get_rank_name(name), image, step)
 
     def open(self, filename, mode='r', uuid=None):
         """Opens a file in the experiment's folder. 
@@ -165,37 +469,103 @@ class Experiment:
         if uuid is None:
             filepath = self.path/FILES_FOLDER/filename
             filepath.parent.mkdir(exist_ok=True)
+
+            if self._deduplicator is not None and mode != 'r' and mode != 'rb':
+                # A deduplicated file is shared with the store, so it gets its own copy before it's modified:
+                self._deduplicator.wait(filepath)
+                artifact_store.break_link(filepath)
+                return TrackedFile(open(str(filepath), mode), on_close=lambda: self._deduplicator.add(filepath))
         else:
             assert 'r' in mode, mode
-            filepath = Path(c.DEFAULT_PARENT_FOLDER)/uuid/FILES_FOLDER/filename
-            
-            if not filepath.exists():
-                raise FileNotFoundError("File '{}' doesn't exist.".format(str(filepath)))
-            
-            other_experiment_metadata_json = utils.load_json(str(Path(c.DEFAULT_PARENT_FOLDER)/uuid/METADATA_JSON_FILENAME))
-            if other_experiment_metadata_json['status'] == 'running':
-                raise ValueError("Loading from a running experiment is not allowed. Other experiment's UUID: {}".format(uuid))
-
-            with utils.UpdateJsonFile(str(self.path/METADATA_JSON_FILENAME)) as metadata:
-                if uuid not in metadata['fileDependencies']:
-                    metadata['fileDependencies'][uuid] = []
-
-                if filename not in metadata['fileDependencies'][uuid]:
-                    metadata['fileDependencies'][uuid].append(filename)
+            filepath = self._get_dependency_path(filename, uuid)
 
         return open(str(filepath), mode)
 
+    def _get_dependency_path(self, filename, uuid):
+        # Returns the path of a file saved by a finished experiment, and records it as a dependency of this experiment.
+        filepath = Path(c.DEFAULT_PARENT_FOLDER)/uuid/FILES_FOLDER/filename
+        
+        if not filepath.exists():
+            raise FileNotFoundError("File '{}' doesn't exist.".format(str(filepath)))
+        
+        other_experiment_metadata_json = utils.load_json(str(Path(c.DEFAULT_PARENT_FOLDER)/uuid/METADATA_JSON_FILENAME))
+        if other_experiment_metadata_json['status'] == 'running':
+            raise ValueError("Loading from a running experiment is not allowed. Other experiment's UUID: {}".format(uuid))
 
-def is_name_available(name, folder):
-    if name == '':
-        return True
+        with self._metadata as metadata:
+            if uuid not in metadata['fileDependencies']:
+                metadata['fileDependencies'][uuid] = []
 
-    for metadata_json_path in Path(folder).glob('*/' + METADATA_JSON_FILENAME):
-        metadata_json = utils.load_json(str(metadata_json_path))
-        if metadata_json['name'] == name:
-            return False
-    
-    return True
+            if filename not in metadata['fileDependencies'][uuid]:
+                metadata['fileDependencies'][uuid].append(filename)
+
+        return filepath
+
+    def save_array(self, name, array):
+        """Saves a numpy array as `<name>.npy` in the experiment's files. 
+
+        Args:
+            name (str): A filename or path to a filename. The extension `.npy` is added if it's missing. 
+            array: A numpy array (or anything that can be converted to one). Arrays of Python objects aren't supported. 
+        """
+        import numpy as np
+
+        with self.open(get_array_filename(name), 'wb') as fp:
+            np.save(fp, np.asarray(array), allow_pickle=False)
+
+    def load_array(self, name, uuid=None):
+        """Loads an array saved with `save_array`, without reading it into memory. 
+
+        The array is memory-mapped read-only, so its data is read from disk when it's accessed, and experiments that 
+        load the same array share it in the page cache. 
+
+        Args:
+            name (str): The name that the array was saved with
+            uuid (str, None): A previous experiment's id. If given, the array is loaded from the previous experiment's 
+                saved files, and the file is recorded as a dependency, as with `open()`. 
+        Returns:
+            A read-only `numpy.memmap`
+        """
+        import numpy as np
+
+        assert uuid != self.uuid, "'uuid' may not be the same as this experiment's uuid. Set `uuid=None` to load an array saved by this experiment."
+
+        filename = get_array_filename(name)
+        assert '..' not in filename, filename
+
+        if uuid is None:
+            filepath = self.path/FILES_FOLDER/filename
+        else:
+            filepath = self._get_dependency_path(filename, uuid)
+
+        return np.load(str(filepath), mmap_mode='r', allow_pickle=False)
+
+
+@attr.s
+class TrackedFile:
+    """A file object that calls `on_close` when it has been closed. Other attributes are taken from the file."""
+    fp = attr.ib()
+    on_close = attr.ib()
+
+    def close(self):
+        if not self.fp.closed:
+            self.fp.close()
+            self.on_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __iter__(self):
+        return iter(self.fp)
+
+    def __getattr__(self, name):
+        if name == 'fp':  # Not set yet, e.g. while unpickling
+            raise AttributeError(name)
+
+        return getattr(self.fp, name)
 
 
 @attr.s
@@ -211,15 +581,30 @@ class MultiStream:
             stream.flush()
 
 
-def setup_procedure(path, name, title, tags):
-    create_metadata_json(path, name, title, tags)
-    create_pip_freeze_file(path)
-    utils.copy_source_code(source_path='.', target_path=path/c.SOURCE_CODE_FOLDER)
+def is_name_available(name, folder=c.DEFAULT_PARENT_FOLDER):
+    return experiment_index.is_name_available(name, folder)
 
 
-def create_metadata_json(path, name, title, tags):
-    filename = sys.argv[0]
+def update_catalog(uuid):
+    from exprec import catalog  # Imported here, since sqlite3 is slow to import
 
+    try:
+        catalog.update_experiment(uuid, timeout=catalog.UPDATE_TIMEOUT)
+    except Exception:
+        pass
+
+
+def record_git_metadata(path, metadata_json_file, save_git_patch=False):
+    git_metadata = git_info.get_git_metadata(patch_folder=path if save_git_patch else None)
+    with metadata_json_file as metadata:
+        metadata['git'] = git_metadata
+
+
+def create_metadata_json(path, name, title, tags, write_interval):
+    """Creates the experiment's metadata json file. Returns a `utils.DebouncedJsonFile` for updating it.
+
+    The git metadata is added by `record_git_metadata`.
+    """
     metadata = {
         'name': name,
         'tags': sorted(tags),
@@ -238,15 +623,94 @@ def create_metadata_json(path, name, title, tags):
         'description': '',
         'conclusion': '',
         'pid': os.getpid(),
-        'git': get_git_metadata(),
+        'git': None,
+        'setupSeconds': {
+            'blocking': None,
+            'background': None,
+        },
     }   
 
-    utils.dump_json(metadata, str(path/METADATA_JSON_FILENAME))
+    metadata_json_file = utils.DebouncedJsonFile(str(path/METADATA_JSON_FILENAME), metadata, 
+        interval=write_interval, fields_owned_by_file=c.DASHBOARD_EDITABLE_FIELDS)
+    metadata_json_file.flush()
+
+    return metadata_json_file
+
+
+def copy_sequence(sequence):
+    return sequence.copy() if hasattr(sequence, 'copy') else list(sequence)
+
+
+def create_rank_metadata_json(path, rank, write_interval):
+    """Creates the metadata json file of a rank other than 0, e.g. `experiment.rank-1.json`. Returns a 
+    `utils.DebouncedJsonFile` for updating it.
+    """
+    metadata = {
+        'rank': rank,
+        'status': 'running',
+        'startedDatetime': datetime.datetime.now().isoformat(),
+        'endedDatetime': None,
+        'parameters': {},
+        'fileDependencies': {},
+        'exceptionType': None,
+        'exceptionValue': None,
+        'pid': os.getpid(),
+        'setupSeconds': {
+            'blocking': None,
+        },
+    }
+
+    filename = Path(METADATA_JSON_FILENAME).stem + RANK_SUFFIX.format(rank) + Path(METADATA_JSON_FILENAME).suffix
+    metadata_json_file = utils.DebouncedJsonFile(str(path/filename), metadata, interval=write_interval)
+    metadata_json_file.flush()
+
+    return metadata_json_file
+
+
+def check_scalar_name(name):
+    if name.startswith(c.SYSTEM_SCALAR_PREFIX):
+        raise ValueError("Scalar names starting with '{}' are reserved for the resource monitor: '{}'".format(c.SYSTEM_SCALAR_PREFIX, name))
+
+
+def get_array_filename(name):
+    return name if name.endswith(ARRAY_EXTENSION) else name + ARRAY_EXTENSION
+
+
+def get_rank_from_environment():
+    """Returns the rank set by the launcher, or None outside of multi-process launches."""
+    for name in RANK_ENVIRONMENT_VARIABLES:
+        if name in os.environ:
+            return int(os.environ[name])
+
+    return None
+
+
+def get_rank_statuses(path):
+    """Returns the statuses of the ranks other than 0 by rank, from their metadata files."""
+    statuses = {}
+    pattern = Path(METADATA_JSON_FILENAME).stem + RANK_SUFFIX.format('*') + Path(METADATA_JSON_FILENAME).suffix
+
+    for metadata_path in path.glob(pattern):
+        try:
+            metadata = utils.load_json(str(metadata_path))
+        except (OSError, ValueError):
+            continue
+        statuses[metadata['rank']] = metadata['status']
+
+    return {rank: statuses[rank] for rank in sorted(statuses)}
+
+
+def wait_for_file(path, timeout):
+    end_time = time.time() + timeout
+
+    while not path.exists():
+        if time.time() > end_time:
+            raise TimeoutError("'{}' wasn't created within {} seconds. Has the experiment been started by rank 0?".format(path, timeout))
+        time.sleep(0.1)
 
 
 def create_pip_freeze_file(path):
-    installed_packages_list = subprocess.check_output([sys.executable, '-m', 'pip', 'freeze']).decode('utf-8').split('\n')
-    installed_packages_list = sorted(installed_packages_list)
+    installed_packages_list = packages.get_installed_packages(Path(c.DEFAULT_PARENT_FOLDER)/c.CACHE_FOLDER)
 
     with open(str(path/PACKAGES_FILENAME), 'w') as fp:
         fp.write('\n'.join(installed_packages_list))
@@ -256,16 +720,3 @@ def uuid1_to_datetime(uuid1):
     import datetime
     return datetime.datetime.fromtimestamp((uuid1.time - 0x01b21dd213814000)*100/1e9)    
 
-
-def get_git_metadata():
-    try:
-        repo = git.Repo(search_parent_directories=True)
-        sha = repo.head.object.hexsha
-        short = repo.git.rev_parse(sha, short=SHORT_GIT_SHA_LENGTH)
-        return {
-            'sha': sha,
-            'short': short,
-        }
-    except git.exc.InvalidGitRepositoryError:
-        return None
-
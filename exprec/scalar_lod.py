@@ -0,0 +1,240 @@
+import json
+import math
+import os
+import struct
+from pathlib import Path
+
+import attr
+
+
+LOD_FOLDER = 'lod'  # In the scalars folder
+LOD_FACTORS = [10, 100, 1000]
+BRANCHING_FACTOR = 10  # Each level's buckets combine this many buckets of the level below
+
+LOD_RECORD = struct.Struct('<qqddd')  # first step, last step, min, max, mean
+LOD_FIELDS = [('firstStep', '<i8'), ('lastStep', '<i8'), ('min', '<f8'), ('max', '<f8'), ('mean', '<f8')]
+LOD_EXTENSION = '.bin'
+TAIL_EXTENSION = '.json'
+
+DEFAULT_MAX_POINTS = 2000  # About twice the width of a chart in pixels
+
+# Buckets are handled as tuples of (first step, last step, min, max, sum, count), where NaN values aren't counted:
+FIRST_STEP, LAST_STEP, MIN, MAX, SUM, COUNT = range(6)
+
+
+@attr.s
+class LodWriter:
+    """Maintains a pyramid of downsampled levels of one scalar while it is written.
+
+    Level `i` has one bucket per `LOD_FACTORS[i]` rows, with the bucket's first and last step and the min, max and
+    mean of its values (NaN values are ignored). Complete buckets are appended to `lod/<name>.<factor>.bin` as
+    fixed-width records. The rows after the last complete bucket of each level are summarized in `lod/<name>.json`,
+    which is rewritten on every flush, so that a chart includes the most recent values as well.
+    """
+    folder = attr.ib()
+    name = attr.ib()
+
+    def __attrs_post_init__(self):
+        self.folder = Path(self.folder)/LOD_FOLDER
+
+        self.n_rows = 0
+        self._pending_buckets = [[] for _ in LOD_FACTORS]  # The incomplete buckets of the level below each level
+        self._fp_by_level = {}
+
+    def add(self, steps, values):
+        """Adds rows. Steps that are None are replaced by the row's index."""
+        buckets = []
+        for i, (step, value) in enumerate(zip(steps, values)):
+            if step is None:
+                step = self.n_rows + i
+            buckets.append(to_bucket(step, value))
+
+        self.n_rows += len(buckets)
+        self._add_buckets(0, buckets)
+
+    def add_series(self, steps, values):
+        """Adds many rows at once, with the buckets computed by numpy."""
+        import numpy as np
+
+        values = np.asarray(values, dtype=np.float64)
+        steps = np.asarray(steps, dtype=np.int64)
+        is_valid = ~np.isnan(values)
+
+        # Each row is a bucket of its own:
+        rows = [steps, steps, np.where(is_valid, values, np.inf), np.where(is_valid, values, -np.inf),
+                np.where(is_valid, values, 0.0), is_valid.astype(np.int64)]
+
+        self.n_rows += len(values)
+        self._add_bucket_arrays(0, rows)
+
+    def _add_buckets(self, level, buckets):
+        # Adds buckets of the level below `level`, and writes the buckets of `level` that are completed by them.
+        if level == len(LOD_FACTORS):
+            return
+
+        pending_buckets = self._pending_buckets[level]
+        pending_buckets.extend(buckets)
+
+        n_complete = len(pending_buckets) // BRANCHING_FACTOR * BRANCHING_FACTOR
+        if n_complete == 0:
+            return
+
+        complete_buckets = [combine_buckets(pending_buckets[i:i + BRANCHING_FACTOR])
+                            for i in range(0, n_complete, BRANCHING_FACTOR)]
+        del pending_buckets[:n_complete]
+
+        self._add_complete_buckets(level, complete_buckets)
+
+    def _add_complete_buckets(self, level, buckets):
+        self._get_file(level).write(b''.join(LOD_RECORD.pack(*to_record(bucket)) for bucket in buckets))
+
+        self._add_buckets(level + 1, buckets)
+
+    def _add_bucket_arrays(self, level, arrays):
+        # The same as `_add_buckets`, for buckets given as one numpy array per bucket field.
+        if level == len(LOD_FACTORS):
+            return
+
+        # The pending buckets are completed one by one, so that the rest of the buckets are aligned:
+        n_buckets = len(arrays[0])
+        n_head = min(n_buckets, (-len(self._pending_buckets[level])) % BRANCHING_FACTOR)
+        n_body = (n_buckets - n_head) // BRANCHING_FACTOR * BRANCHING_FACTOR
+
+        self._add_buckets(level, list(zip(*(array[:n_head].tolist() for array in arrays))))
+
+        if n_body > 0:
+            self._add_complete_bucket_arrays(level, combine_bucket_arrays([array[n_head:n_head + n_body] for array in arrays]))
+
+        self._add_buckets(level, list(zip(*(array[n_head + n_body:].tolist() for array in arrays))))
+
+    def _add_complete_bucket_arrays(self, level, arrays):
+        import numpy as np
+
+        has_values = arrays[COUNT] > 0
+
+        records = np.empty(len(arrays[0]), dtype=LOD_FIELDS)
+        records['firstStep'] = arrays[FIRST_STEP]
+        records['lastStep'] = arrays[LAST_STEP]
+        records['min'] = np.where(has_values, arrays[MIN], np.nan)
+        records['max'] = np.where(has_values, arrays[MAX], np.nan)
+        records['mean'] = np.where(has_values, arrays[SUM] / np.maximum(arrays[COUNT], 1), np.nan)
+        self._get_file(level).write(records.tobytes())
+
+        self._add_bucket_arrays(level + 1, arrays)
+
+    def flush(self):
+        for fp in self._fp_by_level.values():
+            fp.flush()
+
+        # The tail of each level covers all rows after its last complete bucket, i.e. the pending buckets of
+        # that level and of all levels below it:
+        tails = {}
+        buckets = []
+        for factor, pending_buckets in zip(LOD_FACTORS, self._pending_buckets):
+            buckets = pending_buckets + buckets
+            tails[factor] = to_record(combine_buckets(buckets)) if buckets else None
+
+        self.folder.mkdir(exist_ok=True, parents=True)
+        tail_path = get_tail_path(self.folder.parent, self.name)
+        temp_path = '{}.{}.tmp'.format(tail_path, os.getpid())
+        with open(temp_path, 'w') as fp:
+            json.dump({'nRows': self.n_rows, 'tails': tails}, fp)
+        os.replace(temp_path, str(tail_path))
+
+    def close(self):
+        self.flush()
+
+        for fp in self._fp_by_level.values():
+            fp.close()
+        self._fp_by_level = {}
+
+    def _get_file(self, level):
+        if level not in self._fp_by_level:
+            self.folder.mkdir(exist_ok=True, parents=True)
+            self._fp_by_level[level] = get_level_path(self.folder.parent, self.name, LOD_FACTORS[level]).open('ab')
+
+        return self._fp_by_level[level]
+
+
+def to_bucket(step, value):
+    if value != value:  # NaN
+        return (step, step, math.inf, -math.inf, 0.0, 0)
+
+    return (step, step, value, value, value, 1)
+
+
+def combine_buckets(buckets):
+    return (
+        buckets[0][FIRST_STEP],
+        buckets[-1][LAST_STEP],
+        min(bucket[MIN] for bucket in buckets),
+        max(bucket[MAX] for bucket in buckets),
+        sum(bucket[SUM] for bucket in buckets),
+        sum(bucket[COUNT] for bucket in buckets),
+    )
+
+
+def combine_bucket_arrays(arrays):
+    """Combines each run of `BRANCHING_FACTOR` buckets, given as one numpy array per bucket field."""
+    first_steps, last_steps, minimums, maximums, sums, counts = [array.reshape(-1, BRANCHING_FACTOR) for array in arrays]
+
+    return [first_steps[:, 0], last_steps[:, -1], minimums.min(axis=1), maximums.max(axis=1), sums.sum(axis=1), counts.sum(axis=1)]
+
+
+def to_record(bucket):
+    """Returns the (first step, last step, min, max, mean) record of a bucket."""
+    if bucket[COUNT] == 0:
+        return (int(bucket[FIRST_STEP]), int(bucket[LAST_STEP]), math.nan, math.nan, math.nan)
+
+    return (int(bucket[FIRST_STEP]), int(bucket[LAST_STEP]), bucket[MIN], bucket[MAX], bucket[SUM] / bucket[COUNT])
+
+
+def get_level_path(scalars_folder, name, factor):
+    return Path(scalars_folder)/LOD_FOLDER/'{}.{}{}'.format(name, factor, LOD_EXTENSION)
+
+
+def get_tail_path(scalars_folder, name):
+    return Path(scalars_folder)/LOD_FOLDER/(name + TAIL_EXTENSION)
+
+
+def read_level(scalars_folder, name, factor):
+    """Returns the level's records (including the tail) as a dict with the numpy arrays 'step' (the first step of
+    each bucket), 'min', 'max' and 'mean'. Returns None if the scalar has no summaries.
+    """
+    import numpy as np
+
+    tail_path = get_tail_path(scalars_folder, name)
+    level_path = get_level_path(scalars_folder, name, factor)
+
+    try:
+        with tail_path.open() as fp:
+            tail = json.load(fp)['tails'][str(factor)]
+    except (OSError, ValueError):
+        return None
+
+    # Only complete records are read, since the writer may be appending to the file:
+    n_records = level_path.stat().st_size // LOD_RECORD.size if level_path.exists() else 0
+    records = np.fromfile(str(level_path), dtype=LOD_FIELDS, count=n_records) if n_records > 0 \
+        else np.empty(0, dtype=LOD_FIELDS)
+
+    if tail is not None:
+        records = np.concatenate([records, np.array([tuple(tail)], dtype=LOD_FIELDS)])
+
+    return {'step': records['firstStep'], 'min': records['min'], 'max': records['max'], 'mean': records['mean']}
+
+
+def get_n_rows(scalars_folder, name):
+    """Returns the number of rows summarized when the tail was last written, or None if the scalar has no summaries."""
+    try:
+        with get_tail_path(scalars_folder, name).open() as fp:
+            return json.load(fp)['nRows']
+    except (OSError, ValueError):
+        return None
+
+
+def choose_factor(n_rows, max_points=DEFAULT_MAX_POINTS):
+    """Returns the largest factor whose level still has at least `max_points` points, or None if the raw series
+    is needed for that resolution.
+    """
+    factors = [factor for factor in LOD_FACTORS if n_rows // factor >= max_points]
+    return max(factors) if factors else None
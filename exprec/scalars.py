@@ -0,0 +1,567 @@
+import collections
+import datetime
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+
+import attr
+
+from exprec import constants as c
+from exprec import scalar_lod
+from exprec import utils
+
+
+DEFAULT_BUFFER_SIZE = 1000
+DEFAULT_FLUSH_INTERVAL = 1.0  # Seconds
+
+CSV_FORMAT = 'csv'
+BINARY_FORMAT = 'binary'
+EXTENSION_BY_FORMAT = {
+    CSV_FORMAT: '.csv',
+    BINARY_FORMAT: '.bin',
+}
+
+# Binary scalar files are a sequence of fixed-width little-endian records:
+# int64 step, float64 value, int64 timestamp (microseconds since the epoch).
+BINARY_RECORD = struct.Struct('<qdq')
+BINARY_FIELDS = [('step', '<i8'), ('value', '<f8'), ('timestamp', '<i8')]  # The numpy dtype of a record
+MISSING_STEP = -2**63  # Stored when a scalar is added without a step
+
+RANK_FOLDER_PREFIX = 'rank-'  # Ranks other than 0 write their scalars to a subfolder, e.g. `scalars/rank-1/`
+
+READ_BLOCK_SIZE = 4096  # Bytes read at a time when searching backwards for the last line of a csv file
+MAX_CACHED_LAST_VALUES = 100000  # The least recently read files are evicted first
+
+# Path -> ((size, mtime), last value), in the order they were last read, see `read_last_value`:
+_last_value_by_path = collections.OrderedDict()
+_last_value_lock = threading.Lock()  # The dashboard reads scalars from several request threads
+
+
+@attr.s
+class ScalarWriter:
+    """Appends scalar values to one file per scalar in the given folder.
+
+    Rows are buffered in memory and written in batches: when the buffer holds `buffer_size` rows, when
+    `flush_interval` seconds have passed since the last flush (by a timer thread, so rows reach the disk even if no
+    more values are added), or when the writer is closed. One file handle is kept open per scalar until the writer
+    is closed.
+
+    `format` is either 'csv' (a text file with the columns step,value,datetime) or 'binary' (fixed-width records,
+    see `BINARY_RECORD`). With `lod=True`, downsampled summaries are maintained as well (see `scalar_lod.LodWriter`).
+    """
+    folder = attr.ib()
+    buffer_size = attr.ib(default=DEFAULT_BUFFER_SIZE)
+    flush_interval = attr.ib(default=DEFAULT_FLUSH_INTERVAL)
+    format = attr.ib(default=CSV_FORMAT)
+    lod = attr.ib(default=True)
+
+    def __attrs_post_init__(self):
+        if self.format not in EXTENSION_BY_FORMAT:
+            raise ValueError("Unknown scalar format '{}'. Valid formats: {}".format(self.format, list(EXTENSION_BY_FORMAT)))
+
+        self.folder = Path(self.folder)
+        self._rows = []
+        self._fp_by_name = {}
+        self._lod_writer_by_name = {}
+        self._unflushed_lod_names = set()
+        self._last_flush_time = time.time()
+        self._last_lod_flush_time = time.time()
+        self._lock = threading.RLock()  # The timer flushes from its own thread
+        self._timer = None
+
+    def add(self, name, value, step=None, timestamp=None):
+        now = time.time()
+        with self._lock:
+            self._rows.append((name, step, value, timestamp if timestamp is not None else now))
+            self._flush_if_needed(now)
+
+    def add_many(self, value_by_name, step=None, timestamp=None):
+        now = time.time()
+        if timestamp is None:
+            timestamp = now
+        with self._lock:
+            self._rows.extend((name, step, value, timestamp) for name, value in value_by_name.items())
+            self._flush_if_needed(now)
+
+    def add_series(self, name, values, steps, timestamp=None):
+        """Writes a whole series of values at once, bypassing the row buffer.
+
+        `values` and `steps` are sequences (e.g. numpy arrays) of equal length. All rows share the same timestamp,
+        which defaults to the current time.
+        """
+        if len(values) != len(steps):
+            raise ValueError("'values' and 'steps' must have the same length ({} != {}).".format(len(values), len(steps)))
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self._lock:
+            # Buffered rows are written first, so rows stay in the order they were added:
+            self.flush()
+            self._write_series(name, values, steps, timestamp)
+
+    def _write_series(self, name, values, steps, timestamp):
+        fp = self._get_file(name)
+
+        if self.format == BINARY_FORMAT:
+            import numpy as np
+
+            records = np.empty(len(values), dtype=BINARY_FIELDS)
+            records['step'] = steps
+            records['value'] = values
+            records['timestamp'] = to_timestamp(timestamp)
+            fp.write(records.tobytes())
+        else:
+            line_format = '{},{},' + datetime.datetime.fromtimestamp(timestamp).isoformat() + '\n'
+            fp.write(''.join(map(line_format.format, _to_list(steps), _to_list(values))))
+
+        fp.flush()
+
+        if self.lod:
+            self._get_lod_writer(name).add_series(steps, values)
+            self._flush_lod(name)
+
+    def _flush_if_needed(self, now):
+        if len(self._rows) >= self.buffer_size or now - self._last_flush_time >= self.flush_interval:
+            self.flush()
+        else:
+            self._schedule_flush(self._last_flush_time + self.flush_interval - now)
+
+    def _schedule_flush(self, delay):
+        if self._timer is not None:
+            return
+
+        self._timer = threading.Timer(delay, self._flush_on_timer)
+        self._timer.name = 'exprec-scalars'
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._flush(force_lod=True)
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def flush(self):
+        with self._lock:
+            self._cancel_timer()
+            self._flush()
+
+    def _flush(self, force_lod=False):
+        rows, self._rows = self._rows, []
+        self._last_flush_time = time.time()
+
+        if self.format == BINARY_FORMAT:
+            encode_row, separator = encode_binary_row, b''
+        else:
+            encode_row, separator = encode_csv_row, ''
+
+        chunks_by_name = {}
+        for name, step, value, timestamp in rows:
+            chunks_by_name.setdefault(name, []).append(encode_row(step, value, timestamp))
+
+        for name, chunks in chunks_by_name.items():
+            fp = self._get_file(name)
+            fp.write(separator.join(chunks))
+            fp.flush()
+
+        rows_by_name = {}
+        if self.lod:
+            for name, step, value, _ in rows:
+                rows_by_name.setdefault(name, []).append((step, value))
+
+            for name, name_rows in rows_by_name.items():
+                self._get_lod_writer(name).add(*zip(*name_rows))
+        self._flush_lod(*rows_by_name, force=force_lod)
+
+    def _flush_lod(self, *names, force=False):
+        # The summaries' tail files are rewritten at most once per `flush_interval`, even with a small buffer:
+        self._unflushed_lod_names.update(names)
+
+        if force or time.time() - self._last_lod_flush_time >= self.flush_interval:
+            for name in self._unflushed_lod_names:
+                self._lod_writer_by_name[name].flush()
+
+            self._unflushed_lod_names = set()
+            self._last_lod_flush_time = time.time()
+        elif self._unflushed_lod_names:
+            self._schedule_flush(self._last_lod_flush_time + self.flush_interval - time.time())
+
+    def close(self):
+        with self._lock:
+            self._cancel_timer()
+            self._flush()
+
+            for fp in self._fp_by_name.values():
+                fp.close()
+            self._fp_by_name = {}
+
+            for lod_writer in self._lod_writer_by_name.values():
+                lod_writer.close()
+            self._lod_writer_by_name = {}
+            self._unflushed_lod_names = set()
+
+    def _get_lod_writer(self, name):
+        if name not in self._lod_writer_by_name:
+            self._lod_writer_by_name[name] = scalar_lod.LodWriter(self.folder, name)
+
+        return self._lod_writer_by_name[name]
+
+    def _get_file(self, name):
+        if name not in self._fp_by_name:
+            self.folder.mkdir(exist_ok=True, parents=True)
+            filepath = self.folder / (name + EXTENSION_BY_FORMAT[self.format])
+
+            if self.format == BINARY_FORMAT:
+                fp = filepath.open('ab')
+            else:
+                write_header = not filepath.exists()
+                fp = filepath.open('a')
+                if write_header:
+                    fp.write(','.join(c.SCALARS_HEADER_FIELDS) + '\n')
+
+            self._fp_by_name[name] = fp
+
+        return self._fp_by_name[name]
+
+
+def encode_csv_row(step, value, timestamp):
+    return '{},{},{}\n'.format(step if step is not None else '', value, datetime.datetime.fromtimestamp(timestamp).isoformat())
+
+
+def encode_binary_row(step, value, timestamp):
+    return BINARY_RECORD.pack(step if step is not None else MISSING_STEP, value, to_timestamp(timestamp))
+
+
+def to_timestamp(time_in_seconds):
+    return int(time_in_seconds * 1e6)
+
+
+def parse_datetime(string):
+    # isoformat() leaves out the microseconds when they're 0
+    try:
+        return datetime.datetime.strptime(string, "%Y-%m-%dT%H:%M:%S.%f")
+    except ValueError:
+        return datetime.datetime.strptime(string, "%Y-%m-%dT%H:%M:%S")
+
+
+def _to_list(sequence):
+    # numpy arrays are converted to python scalars in one vectorized call.
+    if hasattr(sequence, 'tolist'):
+        return sequence.tolist()
+
+    return list(sequence)
+
+
+def get_scalar_names(folder):
+    """Returns the sorted names of all scalars in the given scalars folder, in any format."""
+    folder = Path(folder)
+    if not folder.is_dir():
+        return []
+
+    extensions = set(EXTENSION_BY_FORMAT.values())
+    return sorted(set(path.stem for path in folder.iterdir() if path.suffix in extensions))
+
+
+def get_scalar_path(folder, name):
+    """Returns the path to the scalar's file, or None if the scalar doesn't exist.
+
+    The binary file is preferred if both formats exist.
+    """
+    for format in (BINARY_FORMAT, CSV_FORMAT):
+        path = Path(folder) / (name + EXTENSION_BY_FORMAT[format])
+        if path.is_file():
+            return path
+
+    return None
+
+
+def read_scalar(path):
+    """Reads a scalar file into a dict with the numpy arrays 'step' and 'value'.
+
+    Binary files are memory-mapped, so no data is copied unless some steps are missing (which are returned as NaN).
+    """
+    import numpy as np
+
+    path = Path(path)
+
+    if path.suffix == EXTENSION_BY_FORMAT[BINARY_FORMAT]:
+        records = read_binary_records(path)
+        steps = records['step']
+        if (steps == MISSING_STEP).any():
+            steps = np.where(steps == MISSING_STEP, np.nan, steps)
+
+        return {'step': steps, 'value': records['value']}
+
+    import pandas as pd
+
+    df = pd.read_csv(str(path))
+    return {'step': df['step'].values, 'value': df['value'].values}
+
+
+def read_scalar_for_chart(folder, name, max_points=scalar_lod.DEFAULT_MAX_POINTS):
+    """Reads a scalar at the resolution needed for a chart with `max_points` points. Returns a dict with the numpy
+    arrays 'step' and 'value', and 'min' and 'max' if the values are bucket means from a downsampled level. 
+    
+    The coarsest level with at least `max_points` buckets is used, so the raw series is only read if it is short.
+    Returns None if the scalar doesn't exist.
+    """
+    n_rows = scalar_lod.get_n_rows(folder, name)
+    factor = scalar_lod.choose_factor(n_rows, max_points) if n_rows is not None else None
+
+    if factor is not None:
+        level = scalar_lod.read_level(folder, name, factor)
+        if level is not None:
+            return {'step': level['step'], 'value': level['mean'], 'min': level['min'], 'max': level['max']}
+
+    path = get_scalar_path(folder, name)
+    return read_scalar(path) if path is not None else None
+
+
+def get_rank_folder(folder, rank):
+    """Returns the folder that the given rank writes its scalars to."""
+    if rank == 0:
+        return Path(folder)
+
+    return Path(folder) / '{}{}'.format(RANK_FOLDER_PREFIX, rank)
+
+
+def get_rank_folders(folder):
+    """Returns a dict that maps each rank with a scalar shard in the given scalars folder to the shard's folder."""
+    folder = Path(folder)
+    if not folder.is_dir():
+        return {}
+
+    folder_by_rank = {0: folder}
+    for path in folder.iterdir():
+        rank = path.name[len(RANK_FOLDER_PREFIX):]
+        if path.is_dir() and path.name.startswith(RANK_FOLDER_PREFIX) and rank.isdigit():
+            folder_by_rank[int(rank)] = path
+
+    return folder_by_rank
+
+
+def get_all_rank_scalar_names(folder):
+    """Returns the sorted names of all scalars written by any rank."""
+    names = set()
+    for rank_folder in get_rank_folders(folder).values():
+        names.update(get_scalar_names(rank_folder))
+
+    return sorted(names)
+
+
+def read_scalar_shards(folder, name, max_points=None):
+    """Returns a dict that maps each rank that has written the scalar to the scalar's data (see `read_scalar`).
+
+    If `max_points` is given, the data is read at the resolution needed for that many points 
+    (see `read_scalar_for_chart`).
+    """
+    scalar_by_rank = {}
+    for rank, rank_folder in sorted(get_rank_folders(folder).items()):
+        if max_points is not None:
+            scalar = read_scalar_for_chart(rank_folder, name, max_points)
+        else:
+            path = get_scalar_path(rank_folder, name)
+            scalar = read_scalar(path) if path is not None else None
+
+        if scalar is not None:
+            scalar_by_rank[rank] = scalar
+
+    return scalar_by_rank
+
+
+def merge_shards(scalar_by_rank):
+    """Merges the scalar shards of several ranks by step. Returns a dict with the numpy arrays 'step' (sorted and
+    unique), 'mean', 'min', 'max' and 'count' (the number of values at each step).
+
+    Values without a step are placed at their row index.
+    """
+    import numpy as np
+
+    steps = []
+    values = []
+    for scalar in scalar_by_rank.values():
+        rank_steps = np.asarray(scalar['step'], dtype=np.float64)
+        steps.append(np.where(np.isnan(rank_steps), np.arange(len(rank_steps)), rank_steps))
+        values.append(np.asarray(scalar['value'], dtype=np.float64))
+
+    steps = np.concatenate(steps)
+    values = np.concatenate(values)
+
+    unique_steps, inverse = np.unique(steps, return_inverse=True)
+
+    count = np.bincount(inverse, minlength=len(unique_steps))
+    mean = np.bincount(inverse, weights=values, minlength=len(unique_steps)) / count
+
+    minimum = np.full(len(unique_steps), np.inf)
+    np.minimum.at(minimum, inverse, values)
+    maximum = np.full(len(unique_steps), -np.inf)
+    np.maximum.at(maximum, inverse, values)
+
+    return {'step': unique_steps, 'mean': mean, 'min': minimum, 'max': maximum, 'count': count}
+
+
+def read_binary_records(path):
+    """Memory-maps the complete records in a binary scalar file. A partially written last record is ignored."""
+    import numpy as np
+
+    n_records = os.path.getsize(str(path)) // BINARY_RECORD.size
+    if n_records == 0:
+        return np.empty(0, dtype=BINARY_FIELDS)
+
+    return np.memmap(str(path), dtype=BINARY_FIELDS, mode='r', shape=(n_records,))
+
+
+def read_last_binary_value(path):
+    """Returns the last complete value in a binary scalar file, or None if the file has no complete record."""
+    size = os.path.getsize(str(path))
+    n_records = size // BINARY_RECORD.size
+    if n_records == 0:
+        return None
+
+    with open(str(path), 'rb') as fp:
+        fp.seek((n_records - 1) * BINARY_RECORD.size)
+        _, value, _ = BINARY_RECORD.unpack(fp.read(BINARY_RECORD.size))
+
+    return value
+
+
+def read_last_csv_value(path):
+    """Returns the value on the last complete line of a csv scalar file, or None if the file has no complete values.
+    A partially written last line is ignored. The file is read backwards from the end, one block at a time, until
+    the last complete line has been found.
+    """
+    with open(str(path), 'rb') as fp:
+        end = fp.seek(0, os.SEEK_END)
+        data = b''
+
+        while end > 0:
+            start = max(end - READ_BLOCK_SIZE, 0)
+            fp.seek(start)
+            data = fp.read(end - start) + data
+            end = start
+
+            line_end = data.rfind(b'\n')
+            if line_end == -1:
+                continue
+            line_start = data.rfind(b'\n', 0, line_end) + 1
+            if line_start > 0 or start == 0:
+                break
+        else:
+            return None
+
+    _, value, _ = data[line_start:line_end].decode('utf-8').strip().split(',')
+    if value == 'value':
+        return None  # Only the header
+
+    return float(value)
+
+
+def read_last_value(path):
+    """Returns the last value in a scalar file of any format, or None if the file has no values.
+
+    The values are cached by the file's path, size and modification time, so a file that hasn't changed is only
+    stat'ed. At most `MAX_CACHED_LAST_VALUES` files are cached.
+    """
+    path = Path(path)
+    stat = os.stat(str(path))
+    key = (stat.st_size, stat.st_mtime_ns)
+
+    with _last_value_lock:
+        cached = _last_value_by_path.get(path)
+        if cached is not None and cached[0] == key:
+            _last_value_by_path.move_to_end(path)
+            return cached[1]
+
+    if path.suffix == EXTENSION_BY_FORMAT[BINARY_FORMAT]:
+        value = read_last_binary_value(path)
+    else:
+        value = read_last_csv_value(path)
+
+    with _last_value_lock:
+        _last_value_by_path[path] = (key, value)
+        _last_value_by_path.move_to_end(path)
+        if len(_last_value_by_path) > MAX_CACHED_LAST_VALUES:
+            _last_value_by_path.popitem(last=False)
+
+    return value
+
+
+def convert_to_binary(folder):
+    """Converts all csv scalar files in the given scalars folder to the binary format.
+
+    Each csv file is removed once its binary file has been written, so the experiment mustn't be running. Returns
+    the number of converted files.
+    """
+    import numpy as np
+    import pandas as pd
+
+    n_converted = 0
+
+    for csv_path in sorted(Path(folder).glob('*' + EXTENSION_BY_FORMAT[CSV_FORMAT])):
+        binary_path = csv_path.with_suffix(EXTENSION_BY_FORMAT[BINARY_FORMAT])
+        if binary_path.exists():
+            continue
+
+        df = pd.read_csv(str(csv_path))
+
+        records = np.empty(len(df), dtype=BINARY_FIELDS)
+        records['step'] = df['step'].fillna(MISSING_STEP).values
+        records['value'] = df['value'].values
+        records['timestamp'] = [to_timestamp(parse_datetime(string).timestamp()) for string in df['datetime']]
+
+        temp_path = binary_path.with_suffix('.tmp')
+        records.tofile(str(temp_path))
+        os.replace(str(temp_path), str(binary_path))
+        os.remove(str(csv_path))
+
+        n_converted += 1
+
+    return n_converted
+
+
+def convert_store_to_binary(parent_folder):
+    """Converts the csv scalar files of all experiments in the given folder to the binary format. Experiments that
+    are still running are skipped, since their writers append to the csv files.
+
+    Returns the number of converted files and the sorted uuids of the skipped experiments.
+    """
+    n_converted = 0
+    skipped_uuids = []
+
+    for experiment_path in sorted(Path(parent_folder).iterdir()):
+        if not experiment_path.is_dir() or utils.is_hidden_path(Path(experiment_path.name)):
+            continue
+
+        if is_running(experiment_path):
+            skipped_uuids.append(experiment_path.name)
+            continue
+
+        for rank_folder in get_rank_folders(experiment_path / c.SCALARS_FOLDER).values():
+            n_converted += convert_to_binary(rank_folder)
+
+    return n_converted, skipped_uuids
+
+
+def is_running(experiment_path):
+    """Returns whether any rank of the experiment is running, according to its metadata files. An experiment without
+    a metadata file, e.g. one that is still being received by a collector, counts as running.
+    """
+    metadata_path = experiment_path / c.METADATA_JSON_FILENAME
+    if not metadata_path.exists():
+        return True
+
+    for path in [metadata_path] + sorted(experiment_path.glob(metadata_path.stem + '.rank-*' + metadata_path.suffix)):
+        try:
+            if utils.load_json(str(path))['status'] == 'running':
+                return True
+        except (OSError, ValueError):
+            return True  # Being written or deleted
+
+    return False
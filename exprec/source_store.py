@@ -0,0 +1,185 @@
+import hashlib
+import os
+import shutil
+import threading
+from pathlib import Path
+
+from exprec import constants as c
+from exprec import utils
+
+
+BLOBS_FOLDER = 'blobs'
+HASH_CACHE_FILENAME = 'source-hashes.json'
+MATERIALIZE_FOLDER = 'materialize'  # In the cache folder. Holds `src/` folders while they're being materialized.
+DEFAULT_EXTENSION = '*.py'
+
+
+def snapshot_source_code(source_path, experiment_path, extension=DEFAULT_EXTENSION):
+    """Stores the source files under `source_path` in the blob store and writes the experiment's manifest.
+
+    Each file is stored once as a read-only blob in `.exprec/.cache/blobs/`, named by the sha256 hash of its content.
+    The manifest (`src.json`) maps each file's relative path to its hash. Files whose size and modification time are
+    unchanged since they were last hashed aren't read again, and blobs that already exist are never rewritten.
+    """
+    source_path = Path(source_path)
+    cache_folder = get_cache_folder()
+    cache_folder.mkdir(exist_ok=True, parents=True)
+
+    hash_cache_path = cache_folder/HASH_CACHE_FILENAME
+    hash_cache = _load_hash_cache(hash_cache_path)
+
+    manifest = {}
+    for relative_path in list_source_files(source_path, extension):
+        file_path = source_path/relative_path
+        stat = file_path.stat()
+        cache_key = str(file_path.resolve())
+
+        cached = hash_cache.get(cache_key)
+        if cached is not None and cached[:2] == [stat.st_size, stat.st_mtime_ns] and get_blob_path(cached[2]).exists():
+            file_hash = cached[2]
+        else:
+            content = file_path.read_bytes()
+            file_hash = hashlib.sha256(content).hexdigest()
+            write_blob(file_hash, content)
+            hash_cache[cache_key] = [stat.st_size, stat.st_mtime_ns, file_hash]
+
+        manifest[relative_path.as_posix()] = file_hash
+
+    utils.dump_json(hash_cache, str(hash_cache_path))
+    utils.dump_json(manifest, str(Path(experiment_path)/c.SOURCE_MANIFEST_FILENAME))
+
+    return manifest
+
+
+def list_source_files(source_path, extension=DEFAULT_EXTENSION):
+    """Returns the paths, relative to `source_path`, of all non-hidden files matching `extension`."""
+    source_path = Path(source_path)
+
+    relative_paths = (path.relative_to(source_path) for path in source_path.glob('**/' + extension))
+    return sorted(path for path in relative_paths if not utils.is_hidden_path(path))
+
+
+def get_source_files(experiment_path):
+    """Returns a dict that maps the relative path (as a posix string) of each of the experiment's source files
+    to the path of a file with its content.
+
+    Experiments recorded before the blob store existed have their source code in a `src/` folder instead of a manifest.
+    """
+    experiment_path = Path(experiment_path)
+    manifest_path = experiment_path/c.SOURCE_MANIFEST_FILENAME
+
+    if manifest_path.exists():
+        manifest = utils.load_json(str(manifest_path))
+        return {relative_path: get_blob_path(file_hash) for relative_path, file_hash in manifest.items()}
+
+    source_folder = experiment_path/c.SOURCE_CODE_FOLDER
+    return {relative_path.as_posix(): source_folder/relative_path
+            for relative_path in list_source_files(source_folder, extension='*')
+            if (source_folder/relative_path).is_file()}
+
+
+def restore_source_code(uuid, extension=DEFAULT_EXTENSION):
+    """Replaces the source files in the current folder with the experiment's source files."""
+    experiment_path = Path(c.DEFAULT_PARENT_FOLDER)/uuid
+    source_files = get_source_files(experiment_path)
+    assert source_files, experiment_path
+
+    for relative_path in list_source_files('.', extension):
+        os.remove(str(relative_path))
+
+    # Files are copied rather than linked, since the restored files will be edited:
+    materialize_source_code(experiment_path, '.', link=False)
+
+
+def get_source_folder(experiment_path):
+    """Returns the experiment's `src/` folder, materializing it from the blob store (with hardlinks where possible)
+    if it doesn't exist yet.
+
+    The folder is materialized in a temporary folder in the cache, which then replaces it, so an interrupted
+    materialization leaves no partial `src/` folder behind. A folder whose files don't match the manifest, e.g.
+    one that was interrupted before, is materialized again.
+    """
+    experiment_path = Path(experiment_path)
+    source_folder = experiment_path/c.SOURCE_CODE_FOLDER
+    if source_folder.exists() and _matches_manifest(experiment_path, source_folder):
+        return source_folder
+
+    temp_folder = get_cache_folder(experiment_path.parent)/MATERIALIZE_FOLDER/'{}.{}.{}'.format(
+        experiment_path.name, os.getpid(), threading.get_ident())
+    shutil.rmtree(str(temp_folder), ignore_errors=True)  # Left behind by an interrupted materialization
+    temp_folder.mkdir(parents=True)
+    materialize_source_code(experiment_path, temp_folder, link=True)
+
+    if source_folder.exists():
+        shutil.rmtree(str(source_folder), ignore_errors=True)
+
+    try:
+        os.replace(str(temp_folder), str(source_folder))
+    except OSError:
+        shutil.rmtree(str(temp_folder))
+        if not source_folder.exists():
+            raise
+        # Materialized by another request in the meantime
+
+    return source_folder
+
+
+def _matches_manifest(experiment_path, source_folder):
+    manifest_path = experiment_path/c.SOURCE_MANIFEST_FILENAME
+    if not manifest_path.exists():
+        return True  # Recorded before the blob store existed, so `src/` is the original
+
+    relative_paths = {path.relative_to(source_folder).as_posix() for path in source_folder.glob('**/*') if path.is_file()}
+    return relative_paths == set(utils.load_json(str(manifest_path)))
+
+
+def materialize_source_code(experiment_path, target_path, link=False):
+    """Writes the experiment's source files to `target_path`.
+
+    With `link=True`, files are hardlinked to the read-only blobs when the filesystem allows it. Links must only be
+    used for files that are never modified, since a change to a linked file would change the blob.
+    """
+    target_path = Path(target_path)
+
+    for relative_path, content_path in get_source_files(experiment_path).items():
+        target_file_path = target_path/relative_path
+        target_file_path.parent.mkdir(exist_ok=True, parents=True)
+
+        if link:
+            try:
+                os.link(str(content_path), str(target_file_path))
+                continue
+            except OSError:
+                pass  # E.g. a filesystem without hardlinks, or a blob store on another device
+
+        shutil.copyfile(str(content_path), str(target_file_path))
+
+
+def get_cache_folder(parent_folder=c.DEFAULT_PARENT_FOLDER):
+    return Path(parent_folder)/c.CACHE_FOLDER
+
+
+def get_blob_path(file_hash, parent_folder=c.DEFAULT_PARENT_FOLDER):
+    return get_cache_folder(parent_folder)/BLOBS_FOLDER/file_hash[:2]/file_hash[2:]
+
+
+def write_blob(file_hash, content, parent_folder=c.DEFAULT_PARENT_FOLDER):
+    blob_path = get_blob_path(file_hash, parent_folder)
+    if blob_path.exists():
+        return
+
+    blob_path.parent.mkdir(exist_ok=True, parents=True)
+
+    temp_path = '{}.{}.{}.tmp'.format(blob_path, os.getpid(), threading.get_ident())
+    with open(temp_path, 'wb') as fp:
+        fp.write(content)
+    os.chmod(temp_path, 0o444)  # Blobs are shared between experiments and must never be modified
+
+    os.replace(temp_path, str(blob_path))
+
+
+def _load_hash_cache(path):
+    try:
+        return utils.load_json(str(path))
+    except (OSError, ValueError):
+        return {}
@@ -1,13 +1,17 @@
 import datetime
+import threading
 from pathlib import Path
-import subprocess
+import attr
 import markdown
 import psutil
 import cgi
 
 from exprec import utils
+from exprec import experiment_index
 from exprec import html_utils
 from exprec import constants as c
+from exprec import catalog
+from exprec import change_watcher
 from exprec.html_utils import same_line
 
 N_SIGNIFICANT_DIGITS = 4
@@ -61,22 +65,85 @@ CLASSES_BY_COLUMN = {
 }
 
 
-def create_table_from_uuids(uuids, path, filters):
-    path = Path(c.DEFAULT_PARENT_FOLDER)
-    uuids = utils.get_uuids(path)
-    all_scalars = utils.get_all_scalars(uuids)
-    all_params = utils.get_all_parameters(uuids)    
+@attr.s
+class TableCache:
+    """Keeps the experiment table's rows between requests, and only recreates the rows of the experiments that a
+    `change_watcher.ChangeWatcher` reports as changed. Without a watcher, every row is recreated on each request.
+
+    The rows of running experiments are always recreated, since their duration changes.
+    """
+    watcher = attr.ib(default=None)
+
+    def __attrs_post_init__(self):
+        self.lock = threading.Lock()
+        self._changes = self.watcher.subscribe() if self.watcher is not None else None
+        self._item_by_column_by_uuid = {}
+        self._columns = None  # The scalar and parameter columns of the cached rows
+
+    def reconcile(self, connection):
+        """Brings the catalog up to date with the changes since the last call, and drops their cached rows. Must be
+        called with the lock held.
+        """
+        changes = self._changes.drain() if self._changes is not None else None
+        catalog.reconcile(connection, changes)
+
+        if changes is None:
+            self._item_by_column_by_uuid = {}
+        else:
+            for uuid in changes:
+                self._item_by_column_by_uuid.pop(uuid, None)
+
+    def mark_changed(self, uuid):
+        """Reports a change that the dashboard made itself, so that it's seen by the next request even if the watcher
+        hasn't seen it yet.
+        """
+        if self._changes is not None:
+            self._changes.add({uuid: {change_watcher.METADATA_CHANGE, change_watcher.FILES_CHANGE}})
+
+    def get_row(self, uuid, columns):
+        if columns != self._columns:
+            self._item_by_column_by_uuid = {}
+            self._columns = columns
+
+        return self._item_by_column_by_uuid.get(uuid)
 
-    procedure_item_by_column_list = []
-    for uuid in uuids:
-        metadata_json_path = path/uuid/METADATA_JSON_FILENAME
-        metadata = utils.load_json(str(metadata_json_path))
+    def set_row(self, uuid, procedure_item_by_column):
+        self._item_by_column_by_uuid[uuid] = procedure_item_by_column
 
-        if not show_experiment(metadata, filters):
-            continue
 
-        procedure_item_by_column = create_procedure_item_by_column(uuid, path/uuid, metadata, all_scalars, all_params)
-        procedure_item_by_column_list.append(procedure_item_by_column)
+def create_table(filters, cache=None):
+    """Creates the experiment table from the catalog, which is brought up to date first (see `catalog.reconcile`)."""
+    path = Path(c.DEFAULT_PARENT_FOLDER)
+    if cache is None:
+        cache = TableCache()
+
+    with cache.lock:
+        connection = catalog.connect()
+        try:
+            cache.reconcile(connection)
+
+            experiments = catalog.get_experiments(connection, filters)
+            all_scalars = catalog.get_all_scalar_names(connection)
+            all_params = catalog.get_all_parameter_names(connection)
+            value_by_scalar_name_by_uuid = catalog.get_last_scalar_values(connection, [uuid for uuid, *_ in experiments])
+        finally:
+            connection.close()
+
+        pids = set(psutil.pids())
+
+        procedure_item_by_column_list = []
+        for uuid, metadata, logical_size, physical_size in experiments:
+            procedure_item_by_column = cache.get_row(uuid, (tuple(all_scalars), tuple(all_params)))
+
+            if procedure_item_by_column is None or metadata['status'] == 'running':
+                file_space = utils.format_file_space(logical_size, physical_size)
+                procedure_item_by_column = create_procedure_item_by_column(uuid, path/uuid, metadata, all_scalars, all_params, 
+                    value_by_scalar_name_by_uuid[uuid], file_space, pids)
+                cache.set_row(uuid, procedure_item_by_column)
+            else:
+                procedure_item_by_column = {**procedure_item_by_column, 'PID': create_pid_item(metadata, pids)}
+
+            procedure_item_by_column_list.append(procedure_item_by_column)
     
     classes_by_dynamic_columns = {column: ['toggle', 'hidden-column'] for column in all_scalars + all_params}
     classes_by_column = {**CLASSES_BY_COLUMN, **classes_by_dynamic_columns}
@@ -89,22 +156,7 @@ def create_table_from_uuids(uuids, path, filters):
     return html
 
 
-def show_experiment(metadata, filters):
-    tags = metadata['tags']
-
-    blacklist = filters['blacklist']
-    whitelist = filters['whitelist']
-
-    if any(tag in blacklist for tag in tags):
-        return False
-
-    if len(whitelist) == 0:
-        return True
-    
-    return any(tag in whitelist for tag in tags)
-
-
-def create_procedure_item_by_column(uuid, path, metadata, all_scalars, all_params):
+def create_procedure_item_by_column(uuid, path, metadata, all_scalars, all_params, value_by_scalar_name, file_space, pids):
     name = metadata['name']
     start = datetime.datetime.strptime(metadata['startedDatetime'], "%Y-%m-%dT%H:%M:%S.%f")
     end = None if metadata['endedDatetime'] is None else datetime.datetime.strptime(metadata['endedDatetime'], "%Y-%m-%dT%H:%M:%S.%f")
@@ -118,12 +170,6 @@ def create_procedure_item_by_column(uuid, path, metadata, all_scalars, all_param
     status = metadata['status']
     tags = sorted(metadata['tags'])
 
-    file_space = utils.get_file_space_representation(str(path/c.FILES_FOLDER))
-
-    experiment_pid = int(metadata['pid'])
-    pids = psutil.pids()
-    pid_icon_name = 'fas fa-play text-success' if experiment_pid in pids else 'fas fa-stop text-danger'
-
     # Set lightbulb class:
     if metadata['status'] == 'running':
         lightbulb_class = 'text-{}'.format('primary' if metadata['conclusion'] else 'secondary')
@@ -144,7 +190,7 @@ def create_procedure_item_by_column(uuid, path, metadata, all_scalars, all_param
             html_utils.icon('fas fa-info-circle {}'.format(infoicon_class)), 
             html_utils.icon('fas fa-lightbulb {}'.format(lightbulb_class)),
         )),
-        'PID': same_line(html_utils.fa_icon(pid_icon_name) + ' ' + str(experiment_pid)),
+        'PID': create_pid_item(metadata, pids),
         'Name': name if len(name) > 0 else None,
         'Title': cgi.escape(metadata['title']) if metadata['title'] else None,
         'Filename': same_line(html_utils.color_circle_and_string(metadata['filename'])),
@@ -153,8 +199,8 @@ def create_procedure_item_by_column(uuid, path, metadata, all_scalars, all_param
         'End': end.strftime('%Y-%m-%d %H:%M:%S') if end is not None else None,
         'Tags': ' '.join([html_utils.badge(tag) for tag in tags]),
         'File space': file_space,
-        'ID': same_line("""<button class='btn btn-light btn-xs' onclick="copyToClipboard('{}')">{}</button>""".format(utils.get_short_uuid(uuid), html_utils.fa_icon('copy')) \
-            + ' ' + html_utils.color_circle(uuid) + ' ' + utils.get_short_uuid(uuid)),
+        'ID': same_line("""<button class='btn btn-light btn-xs' onclick="copyToClipboard('{}')">{}</button>""".format(experiment_index.get_short_uuid(uuid), html_utils.fa_icon('copy')) \
+            + ' ' + html_utils.color_circle(uuid) + ' ' + experiment_index.get_short_uuid(uuid)),
         'Git commit': same_line(html_utils.color_circle_and_string(metadata['git']['short'])) if metadata['git'] is not None else None,
         'Description': markdown.markdown(cgi.escape(metadata['description'])),
         'Conclusion': markdown.markdown(cgi.escape(metadata['conclusion'])),
@@ -164,7 +210,7 @@ def create_procedure_item_by_column(uuid, path, metadata, all_scalars, all_param
     }
 
     for scalar_name in all_scalars:
-        value = get_scalar_value(path, scalar_name)
+        value = value_by_scalar_name.get(scalar_name)
         if value is not None:
             value = str(utils.round_to_significant_digits(value, N_SIGNIFICANT_DIGITS))
         procedure_item_by_column[scalar_name] = value
@@ -184,6 +230,13 @@ def create_procedure_item_by_column(uuid, path, metadata, all_scalars, all_param
     return procedure_item_by_column
 
 
+def create_pid_item(metadata, pids):
+    experiment_pid = int(metadata['pid'])
+    pid_icon_name = 'fas fa-play text-success' if experiment_pid in pids else 'fas fa-stop text-danger'
+
+    return same_line(html_utils.fa_icon(pid_icon_name) + ' ' + str(experiment_pid))
+
+
 def list_join(lst, item):
     n = len(lst)
     lists = zip(lst, [item] * n)
@@ -193,23 +246,3 @@ def list_join(lst, item):
 
 def flatten(lst):
     return sum(lst, [])
-
-
-def get_scalar_value(path, scalar_name):
-    scalar_folder_path = path/c.SCALARS_FOLDER
-    scalar_path = scalar_folder_path / '{}.csv'.format(scalar_name)
-
-    if not scalar_path.exists():
-        return None
-
-    last_line = get_last_line_in_file(str(scalar_path))
-    _, value, _ = last_line.strip().split(',')
-    if value == 'value':
-        return None
-    
-    return float(value)
-
-
-def get_last_line_in_file(filepath):
-    return subprocess.check_output(['tail', '-1', filepath]).decode('utf-8')
-
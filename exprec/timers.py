@@ -0,0 +1,241 @@
+import functools
+import json
+import math
+import random
+import threading
+import time
+from pathlib import Path
+
+import attr
+
+
+DEFAULT_WINDOW = 10.0  # Seconds
+MAX_SAMPLES = 1024  # Durations kept per section and window for the quantiles
+TIMERS_FILENAME = 'timers.jsonl'
+
+
+@attr.s
+class SectionTimers:
+    """Aggregates the durations of timed sections in memory, in windows of `window` seconds.
+
+    Each call only updates the section's count, total and max, and keeps its duration in a reservoir sample of at
+    most `MAX_SAMPLES` durations, so memory and time per call are bounded. When a window has ended, one line with
+    the count, total, mean, p50, p95 and max of each section in the window is appended to `timers.jsonl` in the
+    given folder, by a timer thread if no section ends after the window. Sections can be timed from any thread; the
+    file is written outside the lock they take.
+    """
+    folder = attr.ib()
+    window = attr.ib(default=DEFAULT_WINDOW)
+
+    def __attrs_post_init__(self):
+        self.folder = Path(self.folder)
+
+        self._lock = threading.Lock()
+        self._stats_by_name = {}
+        self._start_time = time.perf_counter()
+        self._window_start_time = self._start_time
+        self._timer = None
+
+        self._write_lock = threading.Lock()  # Keeps the lines in order without blocking the timed sections
+        self._fp = None
+
+    def section(self, name):
+        return Section(self, name)
+
+    def add(self, name, start_time, end_time):
+        stats_by_name = None
+
+        with self._lock:
+            stats = self._stats_by_name.get(name)
+            if stats is None:
+                stats = self._stats_by_name[name] = SectionStats()
+            stats.add(end_time - start_time)
+
+            if end_time - self._window_start_time >= self.window:
+                stats_by_name, window_start_time = self._end_window(end_time)
+            elif self._timer is None:
+                self._schedule_flush(self._window_start_time + self.window - end_time)
+
+        if stats_by_name:
+            self._write(stats_by_name, window_start_time, end_time)
+
+    def _end_window(self, now):
+        # Must be called with the lock held. Returns the window's stats and start time.
+        stats_by_name, self._stats_by_name = self._stats_by_name, {}
+        window_start_time, self._window_start_time = self._window_start_time, now
+
+        return stats_by_name, window_start_time
+
+    def _schedule_flush(self, delay):
+        self._timer = threading.Timer(delay, self._flush_on_timer)
+        self._timer.name = 'exprec-timers'
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_on_timer(self):
+        stats_by_name = None
+
+        with self._lock:
+            self._timer = None
+
+            now = time.perf_counter()
+            if now - self._window_start_time >= self.window:
+                stats_by_name, window_start_time = self._end_window(now)
+            elif self._stats_by_name:
+                # A section ended the previous window after this timer was started:
+                self._schedule_flush(self._window_start_time + self.window - now)
+
+        if stats_by_name:
+            self._write(stats_by_name, window_start_time, now)
+
+    def _write(self, stats_by_name, window_start_time, now):
+        line = {
+            'time': now - self._start_time,  # Seconds since the timers were created, at the end of the window
+            'window': now - window_start_time,
+            'timestamp': time.time(),
+            'sections': {name: stats.summarize() for name, stats in stats_by_name.items()},
+        }
+
+        with self._write_lock:
+            if self._fp is None:
+                self.folder.mkdir(exist_ok=True, parents=True)
+                self._fp = (self.folder/TIMERS_FILENAME).open('a')
+
+            self._fp.write(json.dumps(line) + '\n')
+            self._fp.flush()
+
+    def close(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            now = time.perf_counter()
+            stats_by_name, window_start_time = self._end_window(now)
+
+        if stats_by_name:
+            self._write(stats_by_name, window_start_time, now)
+
+        with self._write_lock:
+            if self._fp is not None:
+                self._fp.close()
+                self._fp = None
+
+
+@attr.s(slots=True)
+class Section:
+    """Times a section of code, either as a context manager (`with timers.section('data'):`) or as a decorator."""
+    timers = attr.ib()
+    name = attr.ib()
+    start_time = attr.ib(default=None, init=False)
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.timers.add(self.name, self.start_time, time.perf_counter())
+
+    def __call__(self, function):
+        @functools.wraps(function)
+        def timed_function(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.timers.add(self.name, start_time, time.perf_counter())
+
+        return timed_function
+
+
+class SectionStats:
+    __slots__ = ('count', 'total', 'max', 'samples')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = []
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+
+        # Reservoir sampling: every duration has the same probability of being among the samples
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(duration)
+        else:
+            index = int(random.random() * self.count)
+            if index < MAX_SAMPLES:
+                self.samples[index] = duration
+
+    def summarize(self):
+        samples = sorted(self.samples)
+
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count,
+            'p50': get_quantile(samples, 0.5),
+            'p95': get_quantile(samples, 0.95),
+            'max': self.max,
+        }
+
+
+def get_quantile(sorted_values, quantile):
+    return sorted_values[min(int(quantile * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def read_timers(path):
+    """Returns the list of windows in a timers file. An incomplete last line (which is being written) is skipped."""
+    windows = []
+
+    with Path(path).open() as fp:
+        for line in fp:
+            if line.endswith('\n'):
+                windows.append(json.loads(line))
+
+    return windows
+
+
+def get_breakdown(windows):
+    """Combines the windows into one row per section, with the section's 'count', 'total' and 'mean' duration over
+    all windows, its 'max', and the 'p50' and 'p95' of the latest window in which it was timed. Sorted by total.
+    """
+    row_by_name = {}
+
+    for window in windows:
+        for name, section in window['sections'].items():
+            row = row_by_name.setdefault(name, {'section': name, 'count': 0, 'total': 0.0, 'max': 0.0})
+            row['count'] += section['count']
+            row['total'] += section['total']
+            row['max'] = max(row['max'], section['max'])
+            row['p50'], row['p95'] = section['p50'], section['p95']
+
+    for row in row_by_name.values():
+        row['mean'] = row['total'] / row['count']
+
+    return sorted(row_by_name.values(), key=lambda row: row['total'], reverse=True)
+
+
+def get_shares_over_time(windows, names, max_points):
+    """Returns the share of the wall time that was spent in each section per window, with consecutive windows merged
+    so that there are at most `max_points` of them. Returns a dict with the 'time' at the end of each merged window,
+    and a list of shares per section in 'shares' (in the order of `names`).
+    """
+    group_size = max(1, math.ceil(len(windows) / max_points))
+
+    times = []
+    shares = [[] for _ in names]
+    for start in range(0, len(windows), group_size):
+        group = windows[start:start + group_size]
+        seconds = sum(window['window'] for window in group)
+
+        times.append(group[-1]['time'])
+        for name, name_shares in zip(names, shares):
+            total = sum(window['sections'][name]['total'] for window in group if name in window['sections'])
+            name_shares.append(total / seconds if seconds > 0 else 0.0)
+
+    return {'time': times, 'shares': shares}
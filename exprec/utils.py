@@ -2,17 +2,14 @@ import attr
 import json
 import datetime
 import os
-import humanize
 from pathlib import Path
-import shutil
+import threading
+import time
 import uuid
 
 from exprec import constants as c
 
 
-MINIMUM_SHORT_UUID_LENGTH = 7
-
-
 @attr.s
 class UpdateJsonFile:
     """Updates the json file in the given path
@@ -34,122 +31,145 @@ class UpdateJsonFile:
         dump_json(self.json_data, self.path)
 
 
-def load_json(path):
-    with open(path) as fp:
-        return json.load(fp)
-
-
-def dump_json(json_data, path):
-    with open(path, 'w') as fp:
-        json.dump(json_data, fp, ensure_ascii=False, indent=4)
-
-
-def floor_timedelta(td):
-    return datetime.timedelta(days=td.days, seconds=td.seconds)
-
-
-def get_file_space_representation(root):
-    file_space = get_total_size(root)
-    if file_space > 0:
-        file_space = humanize.naturalsize(file_space)
-    else:
-        file_space = None
-    
-    return file_space
-
-
-def get_total_size(root):
-    total_size = 0
-    for dirpath, dirnames, filenames in os.walk(root):
-        for filename in filenames:
-            filepath = os.path.join(dirpath, filename)
-            total_size += os.path.getsize(filepath)
-
-    return total_size
+@attr.s
+class DebouncedJsonFile:
+    """Keeps json data in memory and writes it to the given path at most once per `interval` seconds.
 
+    Changes are made in a `with` statement. The first change is written immediately; later changes within `interval`
+    seconds are written together when the interval has passed. `flush()` and `close()` write any pending change,
+    including the initial json data. 
+    Fields in `fields_owned_by_file` are reloaded from the file before each write, so changes made to them by 
+    other processes (e.g. the dashboard) aren't overwritten. 
 
-def get_uuids(path):
-    metadata_json_paths = path.glob('*/' + c.METADATA_JSON_FILENAME)
-    return [json_path.parent.parts[-1] for json_path in metadata_json_paths]
+    E.g.
+    >>> json_file = DebouncedJsonFile(path, {'parameters': {}})
+    >>> with json_file as json_data:
+    ...     json_data['parameters']['learning_rate'] = 0.1
+    >>> json_file.close()
+    """
+    path = attr.ib()
+    json_data = attr.ib()
+    interval = attr.ib(default=1.0)
+    fields_owned_by_file = attr.ib(default=())
 
+    def __attrs_post_init__(self):
+        self._lock = threading.RLock()
+        self._timer = None
+        self._is_dirty = True  # The initial json data hasn't been written yet
+        self._last_write_time = -float('inf')
 
-def get_all_tags(uuids):
-    all_tags = []
+    def __enter__(self):
+        self._lock.acquire()
+        return self.json_data
 
-    for uuid in uuids:
-        experiment_json_path = Path(c.DEFAULT_PARENT_FOLDER)/uuid/c.METADATA_JSON_FILENAME
-        experiment_json = load_json(str(experiment_json_path))
+    def __exit__(self, type, value, traceback):
+        try:
+            self._is_dirty = True
+            self._schedule_write()
+        finally:
+            self._lock.release()
+
+        return False
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            if self._is_dirty:
+                self._write()
+
+    def close(self):
+        self.flush()
+
+    def _schedule_write(self):
+        if self._timer is not None:
+            return
+
+        delay = self._last_write_time + self.interval - time.time()
+        if delay <= 0:
+            self._write()
+        else:
+            self._timer = threading.Timer(delay, self.flush)
+            self._timer.name = 'exprec-metadata'
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _write(self):
+        if self.fields_owned_by_file and os.path.exists(self.path):
+            json_data_on_file = load_json(self.path)
+            for field in self.fields_owned_by_file:
+                if field in json_data_on_file:
+                    self.json_data[field] = json_data_on_file[field]
 
-        all_tags += experiment_json['tags']
-    
-    all_tags = sorted(list(set(all_tags)))
+        dump_json(self.json_data, self.path)
 
-    if 'archive' in all_tags:
-        all_tags.remove('archive')
+        self._is_dirty = False
+        self._last_write_time = time.time()
 
-    return all_tags
 
+def write_text_atomically(text, path):
+    """Writes the text to a temporary file which then replaces the file in `path`. Safe to call from several threads."""
+    temp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+    with open(temp_path, 'w') as fp:
+        fp.write(text)
 
-def get_all_scalars(uuids):
-    all_columns = []
+    os.replace(temp_path, str(path))
 
-    for uuid in uuids:
-        scalar_folder = Path(c.DEFAULT_PARENT_FOLDER)/uuid/c.SCALARS_FOLDER
-        if scalar_folder.exists():
-            scalar_filepaths = scalar_folder.glob('*.csv')
-            all_columns += [scalar_filepath.stem for scalar_filepath in scalar_filepaths]
-    
-    all_columns = sorted(list(set(all_columns)))
 
-    return all_columns
+def write_bytes_atomically(data, path):
+    """Writes the data to a temporary file which then replaces the file in `path`. Safe to call from several threads."""
+    temp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+    with open(temp_path, 'wb') as fp:
+        fp.write(data)
 
+    os.replace(temp_path, str(path))
 
-def get_all_parameters(uuids):
-    all_params = []
 
-    for uuid in uuids:
-        experiment_json_path = Path(c.DEFAULT_PARENT_FOLDER)/uuid/c.METADATA_JSON_FILENAME
-        experiment_json = load_json(str(experiment_json_path))
+def load_json(path):
+    with open(path) as fp:
+        return json.load(fp)
 
-        all_params += list(experiment_json['parameters'].keys())
-    
-    all_params = sorted(list(set(all_params)))
 
-    return all_params
+def dump_json(json_data, path):
+    """Writes the json data to a temporary file which then replaces the file in `path`. 
 
+    The file in `path` is therefore always complete, even if the process is killed while writing. Safe to call from
+    several threads.
+    """
+    temp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+    with open(temp_path, 'w') as fp:
+        json.dump(json_data, fp, ensure_ascii=False, indent=4)
 
-def restore_source_code(uuid):
-    experiment_source_path = Path(c.DEFAULT_PARENT_FOLDER)/uuid/c.SOURCE_CODE_FOLDER
-    assert experiment_source_path.exists()
+    os.replace(temp_path, str(path))
 
-    local_python_files = Path('.').glob('**/*.py')
-    local_python_files = remove_hidden_paths(local_python_files)
 
-    for python_file in local_python_files:
-        os.remove(str(python_file))
-    
-    copy_source_code(source_path=experiment_source_path, target_path='.')
+def floor_timedelta(td):
+    return datetime.timedelta(days=td.days, seconds=td.seconds)
 
 
-def copy_source_code(source_path, target_path, extension='*.py'):
-    source_path = Path(source_path)
-    target_path = Path(target_path)
+def get_file_space_representation(root):
+    """Returns the logical size of the files under `root`, followed by their physical size if it is smaller because
+    some files are deduplicated, e.g. '2.0 GB (500.0 MB on disk)'. Returns None if there are no files.
+    """
+    from exprec import artifact_store
 
-    python_files = source_path.glob('**/' + extension)
+    return format_file_space(*artifact_store.get_file_usage(root))
 
-    for source_file_path in python_files:
-        python_file = source_file_path.relative_to(source_path)
-        if is_hidden_path(python_file):
-            continue
 
-        target_file_path = target_path/python_file
+def format_file_space(logical_size, physical_size):
+    """Formats file sizes in bytes as in `get_file_space_representation`."""
+    import humanize
 
-        target_file_path.parent.mkdir(exist_ok=True, parents=True)
-        shutil.copy(str(source_file_path), str(target_file_path))
+    if logical_size == 0:
+        return None
 
+    file_space = humanize.naturalsize(logical_size)
+    if physical_size < logical_size:
+        file_space += ' ({} on disk)'.format(humanize.naturalsize(physical_size))
 
-def remove_hidden_paths(paths):
-    return [path for path in paths if not is_hidden_path(path)]
+    return file_space
 
 
 def is_hidden_path(path):
@@ -166,33 +186,21 @@ def load_experiment_json(uuid):
 
 
 def get_short_uuid(uuid):
-    length = get_short_uuid_length()
-    return uuid[:length]
+    from exprec import experiment_index  # Imported here, since experiment_index imports utils
 
+    return experiment_index.get_short_uuid(uuid)
 
-def get_short_uuid_length():
-    uuids = get_uuids(Path(c.DEFAULT_PARENT_FOLDER))
 
-    if not uuids:
-        return MINIMUM_SHORT_UUID_LENGTH
+def get_short_uuid_length():
+    from exprec import experiment_index
 
-    for length in range(MINIMUM_SHORT_UUID_LENGTH, len(uuids[0])):
-        short_uuids = set(uuid[:length] for uuid in uuids)
-        if len(short_uuids) == len(uuids):
-            return length
-    
-    assert False, "get_uuids() returned two identical uuids."
+    return experiment_index.load_index()['shortUuidLength']
 
 
 def get_full_uuid(short_uuid):
-    uuids = get_uuids(Path(c.DEFAULT_PARENT_FOLDER))
-    uuids = [uuid for uuid in uuids if uuid.startswith(short_uuid)]
-    if not uuids:
-        raise ValueError("No UUID exists corresponding to the short UUID '{}'".format(short_uuid))
-
-    uuid = min(uuids, key=lambda uuid: uuid1_to_datetime(uuid))
+    from exprec import experiment_index
 
-    return uuid
+    return experiment_index.get_full_uuid(short_uuid)
 
 
 def uuid1_to_datetime(uuid1_string):
@@ -9,7 +9,6 @@ requirements = [
     'bokeh==0.12.15',  # Has to be exact version, since this version has to match with the bokeh version in index.html. 
     'humanize>=0.5.1',
     'pandas>=0.22.0',
-    'GitPython>=2.1.10',
     'colorhash>=1.0.2',
     'markdown>=2.6.11',
     'psutil>=5.4.6',
@@ -0,0 +1,40 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+
+class TempFolderTestCase(unittest.TestCase):
+    """Runs each test in a temporary working directory, so that experiments are recorded into its own `.exprec`
+    folder, and restores stdout and stderr afterwards, since experiments replace them.
+    """
+
+    def setUp(self):
+        self.original_folder = os.getcwd()
+        self.folder = tempfile.mkdtemp()
+        os.chdir(self.folder)
+
+        self.stdout, self.stderr = sys.stdout, sys.stderr
+
+    def tearDown(self):
+        sys.stdout, sys.stderr = self.stdout, self.stderr
+
+        # Experiments update the catalog on daemon threads, which may still be writing to the folder:
+        self.join_catalog_updates()
+
+        os.chdir(self.original_folder)
+        shutil.rmtree(self.folder)
+
+    def join_catalog_updates(self):
+        for thread in threading.enumerate():
+            if thread.name == 'exprec-catalog':
+                thread.join()
+
+
+def git(*args):
+    """Runs a git command in the working directory and returns its output."""
+    return subprocess.run(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com'] + list(args), check=True,
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip()
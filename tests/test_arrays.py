@@ -0,0 +1,29 @@
+import unittest
+
+import numpy as np
+
+from exprec import Experiment
+from exprec import utils
+from tests.helpers import TempFolderTestCase
+
+
+class TestArrays(TempFolderTestCase):
+    def test_load_from_parent(self):
+        array = np.arange(12, dtype=np.float32).reshape(3, 4)
+
+        with Experiment(verbose=False) as parent:
+            parent.save_array('features', array)
+
+        with Experiment(verbose=False) as child:
+            loaded = child.load_array('features', uuid=parent.uuid)
+
+            self.assertIsInstance(loaded, np.memmap)
+            self.assertFalse(loaded.flags.writeable)
+            np.testing.assert_array_equal(loaded, array)
+
+        metadata = utils.load_json(str(child.path/'experiment.json'))
+        self.assertEqual(metadata['fileDependencies'], {parent.uuid: ['features.npy']})
+
+
+if __name__ == '__main__':
+    unittest.main()
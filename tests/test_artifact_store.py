@@ -0,0 +1,88 @@
+import hashlib
+import shutil
+import unittest
+from pathlib import Path
+
+from exprec import Experiment
+from exprec import artifact_store
+from exprec import constants as c
+from exprec import experiment_index
+from tests.helpers import TempFolderTestCase
+
+
+CHECKPOINT_SIZE = 10**5
+OVERWRITTEN_SIZE = 2**25
+
+
+class TestArtifactStore(TempFolderTestCase):
+    def record(self, index):
+        with Experiment(verbose=False, deduplicate_files=True) as experiment:
+            with experiment.open('checkpoint.bin', 'wb') as fp:
+                fp.write(b'x' * CHECKPOINT_SIZE)
+            with experiment.open('log.txt', 'w') as fp:
+                fp.write('run {}'.format(index))
+
+        return experiment
+
+    def get_artifact_link_counts(self):
+        artifacts_path = Path(c.DEFAULT_PARENT_FOLDER)/c.CACHE_FOLDER/artifact_store.ARTIFACTS_FOLDER
+        return sorted(path.stat().st_nlink for path in artifacts_path.glob('*/*'))
+
+    def test_deduplication(self):
+        experiments = [self.record(index) for index in range(3)]
+
+        # The checkpoint is stored once and linked from all three experiments. Each log is stored once:
+        self.assertEqual(self.get_artifact_link_counts(), [2, 2, 2, 4])
+
+        logical_size, physical_size = artifact_store.get_file_usage(experiments[0].path/c.FILES_FOLDER)
+        self.assertEqual(logical_size, CHECKPOINT_SIZE + len('run 0'))
+        self.assertEqual(physical_size, CHECKPOINT_SIZE // 3 + len('run 0'))
+
+        # Writing to a deduplicated file doesn't change the other experiments' files:
+        artifact_store.break_link(experiments[0].path/c.FILES_FOLDER/'checkpoint.bin')
+        with (experiments[0].path/c.FILES_FOLDER/'checkpoint.bin').open('wb') as fp:
+            fp.write(b'y')
+        self.assertEqual((experiments[1].path/c.FILES_FOLDER/'checkpoint.bin').read_bytes(), b'x' * CHECKPOINT_SIZE)
+        self.assertEqual(self.get_artifact_link_counts(), [2, 2, 2, 3])
+
+        # Stored files are removed when no experiment links to them anymore:
+        experiment_index.delete_experiment_folder(experiments[1].uuid)
+        self.assertEqual(self.get_artifact_link_counts(), [2, 2, 2])
+
+        artifact_store.delete_experiment_files(experiments[2].path)
+        self.assertEqual(self.get_artifact_link_counts(), [2])
+
+    def test_remove_orphaned_artifacts(self):
+        experiments = [self.record(index) for index in range(2)]
+
+        # Deleted without going through the index, so the stored files aren't removed:
+        shutil.rmtree(str(experiments[0].path))
+        self.assertEqual(self.get_artifact_link_counts(), [1, 2, 2])
+
+        self.assertEqual(artifact_store.remove_orphaned_artifacts(), (1, len('run 0')))
+        self.assertEqual(self.get_artifact_link_counts(), [2, 2])
+        self.assertEqual((experiments[1].path/c.FILES_FOLDER/'checkpoint.bin').read_bytes(), b'x' * CHECKPOINT_SIZE)
+
+    def test_overwrite_while_deduplicating(self):
+        # Large enough that a file is still being hashed when it's opened again:
+        payloads = [bytes([index]) * OVERWRITTEN_SIZE for index in range(2)]
+
+        with Experiment(verbose=False, deduplicate_files=True) as experiment:
+            for index in range(10):
+                with experiment.open('checkpoint.bin', 'wb') as fp:
+                    fp.write(payloads[index % 2])
+
+        self.assertEqual((experiment.path/c.FILES_FOLDER/'checkpoint.bin').read_bytes(), payloads[1])
+
+        # Every stored file has the content of its hash, and both payloads are stored:
+        artifacts_path = Path(c.DEFAULT_PARENT_FOLDER)/c.CACHE_FOLDER/artifact_store.ARTIFACTS_FOLDER
+        hashes = set()
+        for path in artifacts_path.glob('*/*'):
+            file_hash = path.parent.name + path.name
+            self.assertEqual(hashlib.sha256(path.read_bytes()).hexdigest(), file_hash)
+            hashes.add(file_hash)
+        self.assertEqual(hashes, {hashlib.sha256(payload).hexdigest() for payload in payloads})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import sqlite3
+import threading
+import time
+import unittest
+
+from exprec import Experiment
+from exprec import catalog
+from exprec import constants as c
+from exprec import experiment_index
+from exprec import scalars
+from exprec import utils
+from tests.helpers import TempFolderTestCase
+
+
+class TestCatalog(TempFolderTestCase):
+    def record(self, tags, loss):
+        with Experiment(verbose=False, tags=tags) as experiment:
+            experiment.set_parameter('learning_rate', 0.1)
+            experiment.add_scalar('loss', loss)
+
+        return experiment.uuid
+
+    def get_uuids(self, connection, blacklist=(), whitelist=()):
+        experiments = catalog.get_experiments(connection, {'blacklist': list(blacklist), 'whitelist': list(whitelist)})
+        return [uuid for uuid, *_ in experiments]
+
+    def test_catalog(self):
+        uuid1 = self.record(['baseline'], 1.0)
+        uuid2 = self.record([], 2.0)
+        self.join_catalog_updates()
+
+        connection = catalog.connect()
+        catalog.reconcile(connection)
+
+        self.assertEqual(self.get_uuids(connection), sorted([uuid1, uuid2]))
+        self.assertEqual(self.get_uuids(connection, whitelist=['baseline']), [uuid1])
+        self.assertEqual(self.get_uuids(connection, blacklist=['baseline']), [uuid2])
+        self.assertEqual(catalog.get_all_parameter_names(connection), ['learning_rate'])
+        self.assertEqual(catalog.get_last_scalar_values(connection, [uuid1, uuid2]), {uuid1: {'loss': 1.0}, uuid2: {'loss': 2.0}})
+
+        # Changes made outside the recorder, e.g. by the dashboard, are found through the files' modification times:
+        with utils.UpdateJsonFile(str(catalog.get_metadata_path(uuid2))) as metadata:
+            metadata['tags'].append('archive')
+        experiment_index.delete_experiment_folder(uuid1)
+
+        catalog.reconcile(connection)
+
+        self.assertEqual(self.get_uuids(connection), [uuid2])
+        self.assertEqual(catalog.get_all_tags(connection), ['archive'])
+
+        connection.close()
+
+    def test_running_experiment(self):
+        with Experiment(verbose=False) as experiment:
+            writer = scalars.ScalarWriter(experiment.path/c.SCALARS_FOLDER)
+            writer.add_many({'loss': 1.0, c.SYSTEM_SCALAR_PREFIX + 'cpu': 50.0})
+            writer.close()
+
+            path = experiment.path/c.FILES_FOLDER/'checkpoints'/'model.bin'
+            path.parent.mkdir(parents=True)
+            path.write_bytes(b'0' * 10)
+
+            connection = catalog.connect()
+            catalog.reconcile(connection)
+
+            # The resource monitor's scalars aren't columns of the table:
+            self.assertEqual(catalog.get_all_scalar_names(connection), ['loss'])
+            self.assertEqual(catalog.get_experiments(connection)[0][2], 10)
+
+            # A file overwritten in a subfolder doesn't change the mtime of the files folder itself:
+            time.sleep(0.05)
+            path.write_bytes(b'0' * 20)
+            catalog.reconcile(connection)
+            self.assertEqual(catalog.get_experiments(connection)[0][2], 20)
+
+            connection.close()
+
+    def test_locked_catalog(self):
+        self.record([], 1.0)
+
+        # The dashboard holds the catalog's lock, e.g. during a long reconcile:
+        connection = sqlite3.connect(str(catalog.get_catalog_path()))
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            start_time = time.perf_counter()
+            uuid = self.record([], 2.0)
+            self.assertLess(time.perf_counter() - start_time, catalog.TIMEOUT / 2)
+        finally:
+            connection.rollback()
+            connection.close()
+
+        # The skipped update is repaired by the dashboard:
+        connection = catalog.connect()
+        catalog.reconcile(connection)
+        self.assertIn(uuid, self.get_uuids(connection))
+        connection.close()
+
+    def test_concurrent_creation(self):
+        errors = []
+
+        def connect():
+            try:
+                catalog.connect().close()
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=connect) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        connection = catalog.connect()
+        self.assertEqual(connection.execute('PRAGMA user_version').fetchone()[0], catalog.SCHEMA_VERSION)
+        connection.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import shutil
+import sys
+import time
+import unittest
+
+from exprec import Experiment
+from exprec import catalog
+from exprec import change_watcher
+from exprec import constants as c
+from exprec import scalars
+from exprec import utils
+from tests.helpers import TempFolderTestCase
+
+
+class TestChangeWatcher(TempFolderTestCase):
+    def wait_for_changes(self, change_set, uuid, kind, timeout=10):
+        # Returns all changes until the given one has been seen
+        kinds_by_uuid = {}
+        end_time = time.time() + timeout
+        while time.time() < end_time:
+            changes = change_set.drain()
+            self.assertIsNotNone(changes)
+            for changed_uuid, kinds in changes.items():
+                kinds_by_uuid.setdefault(changed_uuid, set()).update(kinds)
+
+            if kind in kinds_by_uuid.get(uuid, ()):
+                return kinds_by_uuid
+            time.sleep(0.01)
+
+        self.fail('{} change to {} not seen: {}'.format(kind, uuid, kinds_by_uuid))
+
+    def check_watcher(self, use_inotify):
+        with Experiment(verbose=False) as experiment:
+            pass
+        finished_uuid = experiment.uuid
+
+        watcher = change_watcher.ChangeWatcher(poll_interval=0.05, use_inotify=use_inotify)
+        try:
+            if use_inotify and sys.platform.startswith('linux'):
+                self.assertEqual(watcher.backend, 'inotify')
+
+            change_set = watcher.subscribe()
+            self.assertIsNone(change_set.drain())  # Everything may have changed
+
+            with Experiment(verbose=False) as experiment:
+                kinds_by_uuid = self.wait_for_changes(change_set, experiment.uuid, change_watcher.EXPERIMENT_CHANGE)
+                self.assertNotIn(finished_uuid, kinds_by_uuid)
+
+                experiment.add_scalar('loss', 1.0)
+                experiment._scalar_writer.flush()
+                self.wait_for_changes(change_set, experiment.uuid, change_watcher.SCALARS_CHANGE)
+
+            self.wait_for_changes(change_set, experiment.uuid, change_watcher.METADATA_CHANGE)
+
+            with utils.UpdateJsonFile(str(catalog.get_metadata_path(finished_uuid))) as metadata:
+                metadata['title'] = 'Edited'
+            self.wait_for_changes(change_set, finished_uuid, change_watcher.METADATA_CHANGE)
+
+            # Files at any depth of the files folder:
+            nested_folder = catalog.get_metadata_path(finished_uuid).parent/'files'/'checkpoints'/'best'
+            nested_folder.mkdir(parents=True)
+            self.wait_for_changes(change_set, finished_uuid, change_watcher.FILES_CHANGE)
+            (nested_folder/'model.bin').write_bytes(b'weights')
+            self.wait_for_changes(change_set, finished_uuid, change_watcher.FILES_CHANGE)
+            time.sleep(0.1)  # The change of the modification time must be seen by the next poll
+            (nested_folder/'model.bin').write_bytes(b'new weights')
+            self.wait_for_changes(change_set, finished_uuid, change_watcher.FILES_CHANGE)
+
+            shutil.rmtree(str(catalog.get_metadata_path(finished_uuid).parent))
+            self.wait_for_changes(change_set, finished_uuid, change_watcher.EXPERIMENT_CHANGE)
+        finally:
+            watcher.close()
+
+    def test_inotify(self):
+        self.check_watcher(use_inotify=True)
+
+    def test_polling(self):
+        self.check_watcher(use_inotify=False)
+
+    def test_running_rank(self):
+        with Experiment(verbose=False) as experiment:
+            pass
+
+        # Rank 0 has exited, but rank 1 is still running:
+        metadata = utils.load_json(str(experiment.path/c.METADATA_JSON_FILENAME))
+        utils.dump_json(dict(metadata, status='running'), str(experiment.path/'experiment.rank-1.json'))
+
+        watcher = change_watcher.ChangeWatcher(poll_interval=0.05, use_inotify=False)
+        try:
+            change_set = watcher.subscribe()
+            self.assertIsNone(change_set.drain())
+
+            # The experiment counts as running, so its scalar files are checked:
+            writer = scalars.ScalarWriter(experiment.path/c.SCALARS_FOLDER)
+            writer.add('loss', 1.0)
+            writer.close()
+            self.wait_for_changes(change_set, experiment.uuid, change_watcher.SCALARS_CHANGE)
+        finally:
+            watcher.close()
+
+    def test_reconcile_changes(self):
+        with Experiment(verbose=False) as experiment:
+            experiment.add_scalar('loss', 1.0)
+        self.join_catalog_updates()  # Otherwise it may record the edit below
+
+        connection = catalog.connect()
+        try:
+            catalog.reconcile(connection)
+
+            with utils.UpdateJsonFile(str(catalog.get_metadata_path(experiment.uuid))) as metadata:
+                metadata['tags'] = ['edited']
+
+            catalog.reconcile(connection, changes={})
+            self.assertEqual(catalog.get_all_tags(connection), [])
+
+            catalog.reconcile(connection, changes={experiment.uuid: {change_watcher.METADATA_CHANGE}})
+            self.assertEqual(catalog.get_all_tags(connection), ['edited'])
+        finally:
+            connection.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from exprec import constants as c
+from exprec import experiment_index
+from exprec import runner
+from exprec import utils
+from tests.helpers import TempFolderTestCase
+
+
+class TestExperimentIndex(TempFolderTestCase):
+    def setUp(self):
+        super().setUp()
+        Path(c.DEFAULT_PARENT_FOLDER).mkdir()
+
+    def test_create_and_delete(self):
+        for uuid, name in [('c000000-1', 'third'), ('a000000-1', ''), ('b000000-1', 'second')]:
+            experiment_index.create_experiment_folder(uuid, name)
+
+        index = experiment_index.load_index()
+        self.assertEqual(index['uuids'], ['a000000-1', 'b000000-1', 'c000000-1'])
+        self.assertEqual(index['uuidByName'], {'second': 'b000000-1', 'third': 'c000000-1'})
+
+        self.assertFalse(experiment_index.is_name_available('second'))
+        self.assertTrue(experiment_index.is_name_available(''))
+        with self.assertRaises(ValueError):
+            experiment_index.create_experiment_folder('d000000-1', 'second')
+        self.assertFalse(Path(c.DEFAULT_PARENT_FOLDER, 'd000000-1').exists())
+
+        experiment_index.delete_experiment_folder('b000000-1')
+        index = experiment_index.load_index()
+        self.assertEqual(index['uuids'], ['a000000-1', 'c000000-1'])
+        self.assertEqual(index['uuidByName'], {'third': 'c000000-1'})
+
+    def test_short_uuid(self):
+        self.assertEqual(experiment_index.compute_short_uuid_length(['abcdefgh', 'abcdefgi', 'b']), 8)
+        self.assertEqual(experiment_index.compute_short_uuid_length(['a', 'b']), experiment_index.MINIMUM_SHORT_UUID_LENGTH)
+
+        experiment_index.create_experiment_folder('0123456789-a', '')
+        self.assertEqual(experiment_index.get_short_uuid('0123456789-a'), '0123456')
+        experiment_index.create_experiment_folder('0123456789-b', '')
+        self.assertEqual(experiment_index.get_short_uuid('0123456789-a'), '0123456789-a')
+
+    def test_full_uuid(self):
+        for uuid in ['0123456789-a', '0123456789-b', 'abcdef0123-c']:
+            experiment_index.create_experiment_folder(uuid, '')
+
+        self.assertEqual(experiment_index.get_full_uuid('abcdef0'), 'abcdef0123-c')
+        self.assertEqual(experiment_index.get_full_uuid('0123456789-b'), '0123456789-b')
+        with self.assertRaises(ValueError):
+            experiment_index.get_full_uuid('0123456')  # Ambiguous
+        with self.assertRaises(ValueError):
+            experiment_index.get_full_uuid('fedcba9')
+        with self.assertRaises(ValueError):
+            experiment_index.get_full_uuid('0123456789-c')
+
+        # The helpers that used to live in utils and runner still work:
+        self.assertEqual(utils.get_full_uuid('abcdef0'), 'abcdef0123-c')
+        self.assertEqual(utils.get_short_uuid_length(), len('0123456789-a'))
+        self.assertEqual(utils.get_short_uuid('abcdef0123-c'), 'abcdef0123-c')
+
+    def test_name_in_other_folder(self):
+        experiment_index.create_experiment_folder('a000000-1', 'first')
+        experiment_index.create_experiment_folder('a000000-1', 'elsewhere', parent_folder='other')
+
+        self.assertFalse(runner.is_name_available('first', c.DEFAULT_PARENT_FOLDER))
+        self.assertTrue(runner.is_name_available('first', 'other'))
+        self.assertFalse(runner.is_name_available('elsewhere', 'other'))
+
+    def test_rebuild(self):
+        experiment_index.create_experiment_folder('a000000-1', 'first')
+        self.assertEqual(experiment_index.load_index()['uuids'], ['a000000-1'])
+
+        # An unchanged index is neither rebuilt nor reread:
+        with mock.patch('exprec.experiment_index._build_index') as build_index, \
+                mock.patch('exprec.experiment_index._read_index') as read_index:
+            experiment_index.load_index()
+            build_index.assert_not_called()
+            read_index.assert_not_called()
+
+        # Folders created or deleted outside the index change the parent folder's mtime:
+        Path(c.DEFAULT_PARENT_FOLDER, 'b000000-1').mkdir()
+        utils.dump_json({'name': 'second'}, str(Path(c.DEFAULT_PARENT_FOLDER, 'b000000-1', c.METADATA_JSON_FILENAME)))
+        os.rmdir(str(Path(c.DEFAULT_PARENT_FOLDER, 'a000000-1')))
+
+        index = experiment_index.load_index()
+        self.assertEqual(index['uuids'], ['b000000-1'])
+        self.assertEqual(index['uuidByName'], {'second': 'b000000-1'})
+        self.assertEqual(utils.load_json(str(experiment_index.get_index_path())), index)
+
+    def test_concurrent_creation(self):
+        n_threads = 16
+        barrier = threading.Barrier(n_threads)
+
+        def create(i):
+            barrier.wait()
+            experiment_index.create_experiment_folder('{:07d}-uuid'.format(i), 'name-{}'.format(i))
+
+        # Without the lock, concurrent read-modify-writes of the index would lose experiments:
+        with mock.patch('exprec.experiment_index._get_mtime', side_effect=lambda path: 0):
+            threads = [threading.Thread(target=create, args=(i,)) for i in range(n_threads)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            index = utils.load_json(str(experiment_index.get_index_path()))
+
+        self.assertEqual(index['uuids'], ['{:07d}-uuid'.format(i) for i in range(n_threads)])
+        self.assertEqual(len(index['uuidByName']), n_threads)
+
+
+if __name__ == '__main__':
+    unittest.main()
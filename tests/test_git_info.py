@@ -0,0 +1,92 @@
+import os
+import unittest
+from pathlib import Path
+
+from exprec import git_info
+from tests.helpers import TempFolderTestCase, git
+
+
+class TestGitInfo(TempFolderTestCase):
+    def setUp(self):
+        super().setUp()
+
+        os.mkdir('repository')
+        os.chdir('repository')
+        git('init', '-q', '-b', 'main')
+        Path('main.py').write_text('print("hello")\n')
+        Path('data.txt').write_text('data\n')
+        git('add', '.')
+        git('commit', '-q', '-m', 'First')
+
+        self.sha = git('rev-parse', 'HEAD')
+
+    def get_metadata(self, start_path='.'):
+        metadata = git_info.get_git_metadata(start_path=start_path)
+        self.assertEqual(metadata['sha'], self.sha)
+        return metadata
+
+    def test_loose_and_packed(self):
+        self.assertTrue(Path('.git/refs/heads/main').exists())
+        self.assertEqual(git_info.read_commit_tree_sha(Path('.git'), self.sha), git('rev-parse', 'HEAD^{tree}'))
+        self.assertEqual(self.get_metadata()['branch'], 'main')
+
+        git('gc', '-q', '--prune=now')
+        self.assertFalse(Path('.git/refs/heads/main').exists())
+        self.assertFalse(Path('.git/objects', self.sha[:2], self.sha[2:]).exists())
+
+        self.assertEqual(git_info.read_commit_tree_sha(Path('.git'), self.sha), git('rev-parse', 'HEAD^{tree}'))
+        metadata = self.get_metadata()
+        self.assertEqual((metadata['branch'], metadata['dirty'], metadata['short']), ('main', False, self.sha[:7]))
+
+    def test_detached_head(self):
+        git('checkout', '-q', '--detach')
+        self.assertIsNone(self.get_metadata()['branch'])
+
+    def test_worktree(self):
+        git('worktree', 'add', '-q', '-b', 'other', '../worktree')
+
+        metadata = self.get_metadata('../worktree')
+        self.assertEqual((metadata['branch'], metadata['dirty']), ('other', False))
+
+        Path('../worktree/main.py').write_text('print("changed")\n')
+        self.assertTrue(self.get_metadata('../worktree')['dirty'])
+        self.assertFalse(self.get_metadata()['dirty'])
+
+    def test_dirty(self):
+        self.assertFalse(self.get_metadata()['dirty'])
+
+        # Untracked files and changed modification times don't count:
+        Path('untracked.txt').write_text('untracked\n')
+        os.utime('main.py', ns=(0, 0))
+        self.assertFalse(self.get_metadata()['dirty'])
+
+        Path('main.py').write_text('print("changed")\n')
+        self.assertTrue(self.get_metadata()['dirty'])
+
+        git('checkout', '-q', 'main.py')
+        os.remove('data.txt')
+        self.assertTrue(self.get_metadata()['dirty'])
+
+    def test_staged(self):
+        Path('main.py').write_text('print("staged")\n')
+        git('add', 'main.py')
+        self.assertTrue(self.get_metadata()['dirty'])
+
+        git('commit', '-q', '-m', 'Second')
+        self.sha = git('rev-parse', 'HEAD')
+        self.assertFalse(self.get_metadata()['dirty'])
+
+    def test_ambiguous_short_sha(self):
+        # Another object shares the first 9 characters. Its content isn't read, so an empty file is enough:
+        other_sha = self.sha[:9] + ('0' if self.sha[9] != '0' else '1') + self.sha[10:]
+        Path('.git/objects', other_sha[:2], other_sha[2:]).touch()
+        self.assertEqual(self.get_metadata()['short'], self.sha[:10])
+
+        git('gc', '-q', '--prune=now')
+        Path('.git/objects', other_sha[:2]).mkdir(exist_ok=True)
+        Path('.git/objects', other_sha[:2], other_sha[2:]).touch()
+        self.assertEqual(self.get_metadata()['short'], self.sha[:10])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import math
+import time
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from exprec import histograms
+from tests.helpers import TempFolderTestCase
+
+
+QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+
+
+def get_relative_accuracy(level):
+    gamma = histograms.GAMMA**(2**level)
+    return (gamma - 1) / (gamma + 1)
+
+
+class TestHistograms(unittest.TestCase):
+    def check_quantiles(self, values):
+        sketch = histograms.create_sketch(values)
+        level = max(sketch['positive']['level'], sketch['negative']['level'])
+
+        # The sketch estimates the value at the rank, which np.quantile interpolates between neighbors:
+        np.testing.assert_allclose(histograms.get_quantiles(sketch, QUANTILES), np.quantile(values, QUANTILES),
+            rtol=get_relative_accuracy(level) + 1e-3)
+
+        return sketch
+
+    def test_quantiles(self):
+        random = np.random.RandomState(0)
+
+        sketch = self.check_quantiles(random.uniform(0.1, 100, size=10**5))
+        self.assertEqual(sketch['positive']['level'], 0)
+
+        self.check_quantiles(random.normal(size=10**5))
+
+        # Magnitudes over about 10 orders of magnitude, with random signs:
+        sketch = self.check_quantiles(random.lognormal(0, 3, size=10**5) * random.choice([-1, 1], size=10**5))
+        self.assertGreater(sketch['positive']['level'], 0)
+
+    def test_collapse(self):
+        values = np.logspace(-20, 20, 10**4)
+        sketch = self.check_quantiles(values)
+
+        store = sketch['positive']
+        self.assertLessEqual(len(store['counts']), histograms.MAX_SKETCH_BUCKETS)
+        self.assertEqual(sum(store['counts']), len(values))
+        self.assertEqual(sketch['negative']['counts'], [])
+
+    def test_merge(self):
+        # A narrow and a wide range, whose sketches have different levels:
+        random = np.random.RandomState(1)
+        parts = [random.normal(1, 0.1, size=1000), -random.lognormal(0, 5, size=1000), np.zeros(10)]
+
+        merged = histograms.merge_sketches([histograms.create_sketch(part) for part in parts])
+        self.assertEqual(merged, histograms.create_sketch(np.concatenate(parts)))
+
+    def test_empty_and_non_finite(self):
+        summary = histograms.summarize([])
+        self.assertEqual(summary['count'], 0)
+        self.assertIsNone(summary['min'])
+        self.assertTrue(all(math.isnan(value) for value in histograms.get_quantiles(summary['sketch'])))
+
+        summary = histograms.summarize([[1.0, np.nan], [np.inf, -np.inf], [2.0, 0.0]])
+        self.assertEqual(summary['count'], 3)
+        self.assertEqual(summary['nNonFinite'], 3)
+        self.assertEqual((summary['min'], summary['max']), (0.0, 2.0))
+        self.assertEqual(summary['sketch']['zero'], 1)
+        self.assertEqual(sum(summary['bins']), 3)
+
+
+class TestHistogramWriter(TempFolderTestCase):
+    def test_flush_timer(self):
+        folder = Path('histograms')
+        writer = histograms.HistogramWriter(folder, flush_interval=0.1)
+        for step in range(2):
+            writer.add('weights', histograms.summarize([step, 2 * step]), step)
+        self.assertFalse(folder.exists())
+
+        # The summaries are written by the timer, without waiting for more summaries to be added:
+        time.sleep(0.5)
+        summaries = histograms.read_histogram(folder/('weights' + histograms.HISTOGRAM_EXTENSION))
+        self.assertEqual([summary['step'] for summary in summaries], [0, 1])
+
+        writer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+from exprec import image_writer
+from tests.helpers import TempFolderTestCase
+
+
+class TestImageWriter(TempFolderTestCase):
+    def get_written_steps(self, folder, name):
+        return sorted(int(path.stem) for path in (Path(folder)/name).glob('*.png'))
+
+    def test_write(self):
+        writer = image_writer.ImageWriter('images')
+        image = np.zeros((4, 4, 3), dtype=np.uint8)
+        for step in range(3):
+            writer.add('sample', image, step)
+            image[:] = 255  # The caller may reuse the buffer
+
+        writer.close()
+        self.assertEqual(self.get_written_steps('images', 'sample'), [0, 1, 2])
+        self.assertEqual(writer.n_dropped, 0)
+
+    def test_drop(self):
+        started, release = threading.Event(), threading.Event()
+        write = image_writer.ImageWriter._write
+
+        def blocking_write(writer, *args):
+            started.set()
+            release.wait()
+            write(writer, *args)
+
+        with mock.patch.object(image_writer.ImageWriter, '_write', blocking_write):
+            writer = image_writer.ImageWriter('images', n_workers=1, queue_size=1, when_full=image_writer.DROP)
+            image = np.zeros((4, 4), dtype=np.uint8)
+
+            # The worker is busy with the first image and the second one fills the queue, so the others are dropped:
+            writer.add('sample', image, 0)
+            started.wait()
+            for step in range(1, 4):
+                writer.add('sample', image, step)
+
+            release.set()
+            writer.close()
+
+        self.assertEqual(writer.n_dropped, 2)
+        self.assertEqual(self.get_written_steps('images', 'sample'), [0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import json
+import subprocess
+import sys
+import unittest
+
+
+# Importing the recorder must stay fast, since it is paid by every script and every process in a sweep:
+IMPORT_TIME_BUDGET = 0.5  # Seconds
+
+HEAVY_MODULES = ['numpy', 'PIL', 'git', 'flask', 'bokeh', 'pandas', 'markdown', 'psutil', 'humanize']
+
+MEASURE_IMPORT_SCRIPT = '''
+import json
+import sys
+import time
+
+start_time = time.perf_counter()
+from exprec import Experiment
+import_time = time.perf_counter() - start_time
+
+print(json.dumps({
+    'importTime': import_time,
+    'heavyModules': [module for module in HEAVY_MODULES if module in sys.modules],
+}))
+'''
+
+
+class TestImport(unittest.TestCase):
+    def measure_import(self):
+        script = 'HEAVY_MODULES = {!r}\n'.format(HEAVY_MODULES) + MEASURE_IMPORT_SCRIPT
+        output = subprocess.check_output([sys.executable, '-c', script])
+        return json.loads(output.decode('utf-8'))
+
+    def test_no_heavy_modules(self):
+        result = self.measure_import()
+        self.assertEqual(result['heavyModules'], [])
+
+    def test_import_time(self):
+        # The fastest of a few runs, to be robust against a busy machine:
+        import_time = min(self.measure_import()['importTime'] for _ in range(3))
+        self.assertLess(import_time, IMPORT_TIME_BUDGET)
+
+
+if __name__ == '__main__':
+    unittest.main()
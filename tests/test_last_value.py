@@ -0,0 +1,73 @@
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from exprec import constants as c
+from exprec import scalars
+from tests.helpers import TempFolderTestCase
+
+
+class TestLastValue(TempFolderTestCase):
+    def write(self, format, values):
+        writer = scalars.ScalarWriter(Path('scalars'), format=format)
+        for step, value in enumerate(values):
+            writer.add('loss', value, step, 0.0)
+        writer.close()
+
+        return scalars.get_scalar_path(Path('scalars'), 'loss')
+
+    def test_csv(self):
+        path = Path('header.csv')
+        path.write_text(','.join(c.SCALARS_HEADER_FIELDS) + '\n')
+        self.assertIsNone(scalars.read_last_csv_value(path))
+
+        path = self.write(scalars.CSV_FORMAT, [i / 7 for i in range(2000)])
+        self.assertEqual(scalars.read_last_csv_value(path), 1999 / 7)
+
+        with path.open('a') as fp:
+            fp.write('2000,0.5,2020-01-')  # Being written
+        self.assertEqual(scalars.read_last_csv_value(path), 1999 / 7)
+
+        with mock.patch('exprec.scalars.READ_BLOCK_SIZE', 7):  # The last lines span several blocks
+            self.assertEqual(scalars.read_last_csv_value(path), 1999 / 7)
+
+        path.write_text('1,0.5')
+        self.assertIsNone(scalars.read_last_csv_value(path))
+
+    def test_cache(self):
+        for format in [scalars.CSV_FORMAT, scalars.BINARY_FORMAT]:
+            path = self.write(format, [1.0, 2.0])
+
+            with mock.patch('exprec.scalars.read_last_csv_value', wraps=scalars.read_last_csv_value) as read_csv, \
+                    mock.patch('exprec.scalars.read_last_binary_value', wraps=scalars.read_last_binary_value) as read_binary:
+                self.assertEqual(scalars.read_last_value(path), 2.0)
+                self.assertEqual(scalars.read_last_value(path), 2.0)
+                self.assertEqual(read_csv.call_count + read_binary.call_count, 1)
+
+                with path.open('ab') as fp:
+                    fp.write(scalars.encode_csv_row(2, 3.0, 0.0).encode('utf-8') if format == scalars.CSV_FORMAT
+                        else scalars.encode_binary_row(2, 3.0, 0.0))
+                self.assertEqual(scalars.read_last_value(path), 3.0)
+                self.assertEqual(read_csv.call_count + read_binary.call_count, 2)
+
+    def test_cache_size(self):
+        paths = []
+        for i in range(5):
+            path = Path('value-{}.bin'.format(i))
+            path.write_bytes(scalars.encode_binary_row(0, float(i), 0.0))
+            paths.append(path)
+
+        with mock.patch('exprec.scalars.MAX_CACHED_LAST_VALUES', 3), \
+                mock.patch.dict('exprec.scalars._last_value_by_path', clear=True):
+            for path in paths[:3]:
+                scalars.read_last_value(path)
+            scalars.read_last_value(paths[0])  # Now the most recently read
+
+            for path in paths[3:]:
+                self.assertEqual(scalars.read_last_value(path), float(paths.index(path)))
+
+            self.assertEqual(list(scalars._last_value_by_path), [paths[0], paths[3], paths[4]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import io
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from exprec import Experiment
+from exprec import log_writer
+from exprec import utils
+from tests.helpers import TempFolderTestCase
+
+
+class TestLogWriter(TempFolderTestCase):
+    def test_tee(self):
+        writer = log_writer.ThreadedLogWriter('.', ['stdout.txt', 'stdcombined.txt'])
+        stream = io.StringIO()
+        tee = log_writer.TeeStream(stream, writer, ['stdout.txt', 'stdcombined.txt'])
+
+        for i in range(1000):
+            print(i, file=tee)
+        tee.flush()
+        writer.close()
+
+        expected = ''.join('{}\n'.format(i) for i in range(1000))
+        self.assertEqual(stream.getvalue(), expected)
+        self.assertEqual(Path('stdout.txt').read_text(), expected)
+        self.assertEqual(Path('stdcombined.txt').read_text(), expected)
+
+    def test_collapse_carriage_returns(self):
+        log_file = log_writer.LogFile('log.txt', collapse_carriage_returns=True)
+        for string in ['epoch 1: 10%', '\r', 'epoch 1: 100%\r', '\n', 'done\r\nlast: 1%\rlast: 50%']:
+            log_file.write(string)
+        log_file.close()
+
+        self.assertEqual(Path('log.txt').read_bytes(), b'epoch 1: 100%\ndone\nlast: 50%')
+
+    def test_rotation(self):
+        # Sizes are counted in encoded bytes: each line is 4 characters, but 7 bytes.
+        log_file = log_writer.LogFile('log.txt', max_bytes=20)
+        for _ in range(5):
+            log_file.write('ééé\n')
+        log_file.close()
+
+        self.assertEqual(Path('log.txt.1').read_bytes(), 'ééé\n'.encode('utf-8') * 2)
+        self.assertEqual(Path('log.txt').read_bytes(), 'ééé\n'.encode('utf-8'))
+
+    def test_writer_error(self):
+        with mock.patch.object(log_writer.LogFile, 'write', side_effect=OSError('No space left on device')):
+            writer = log_writer.ThreadedLogWriter('.', ['stdout.txt'])
+            writer.write('lost\n', ['stdout.txt'])
+            writer._wake_up.set()
+            writer._thread.join()
+
+        with self.assertRaises(OSError):
+            writer.write('raised\n', ['stdout.txt'])
+        writer.write('dropped\n', ['stdout.txt'])
+        self.assertEqual(len(writer._pending_writes), 0)
+        writer.close()  # Already raised
+
+    def test_experiment_with_failed_log_writer(self):
+        sys_stdout = io.StringIO()
+        with mock.patch('sys.stdout', sys_stdout), \
+                mock.patch.object(log_writer.LogFile, 'write', side_effect=OSError('No space left on device')), \
+                self.assertRaises(OSError):
+            with Experiment(verbose=False, log_mode='threaded') as experiment:
+                print('written to the terminal only')
+
+        self.assertEqual(sys_stdout.getvalue(), 'written to the terminal only\n')
+        metadata = utils.load_json(str(experiment.path/'experiment.json'))
+        self.assertEqual((metadata['status'], metadata['exceptionType']), ('failed', 'OSError'))
+
+
+if __name__ == '__main__':
+    unittest.main()
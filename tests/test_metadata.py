@@ -0,0 +1,63 @@
+import threading
+import unittest
+
+from exprec import Experiment
+from exprec import constants as c
+from exprec import utils
+from tests.helpers import TempFolderTestCase
+
+
+class TestMetadata(TempFolderTestCase):
+    def test_debounced_writes(self):
+        json_file = utils.DebouncedJsonFile('experiment.json', {'parameters': {}}, interval=60)
+
+        # The first change is written immediately, later ones when the file is flushed:
+        with json_file as json_data:
+            json_data['parameters']['learning_rate'] = 0.1
+        with json_file as json_data:
+            json_data['parameters']['batch_size'] = 32
+        self.assertEqual(utils.load_json('experiment.json'), {'parameters': {'learning_rate': 0.1}})
+
+        json_file.close()
+        self.assertEqual(utils.load_json('experiment.json'), {'parameters': {'learning_rate': 0.1, 'batch_size': 32}})
+
+    def test_dashboard_edit(self):
+        with Experiment(verbose=False, title='Original', metadata_write_interval=60) as experiment:
+            experiment.set_parameter('learning_rate', 0.1)
+
+            # The dashboard edits the title while the experiment's writes are debounced:
+            path = str(experiment.path/c.METADATA_JSON_FILENAME)
+            with utils.UpdateJsonFile(path) as metadata:
+                metadata['title'] = 'Edited'
+
+            experiment.set_parameter('learning_rate', 0.2)
+
+        metadata = utils.load_json(path)
+        self.assertEqual(metadata['title'], 'Edited')
+        self.assertEqual(metadata['parameters'], {'learning_rate': 0.2})
+        self.assertEqual(metadata['status'], 'succeeded')
+
+    def test_concurrent_writes(self):
+        errors = []
+
+        def write(index):
+            try:
+                for _ in range(100):
+                    utils.dump_json({'index': index}, 'experiment.json')
+                    utils.write_text_atomically(str(index), 'stdout.txt')
+            except OSError as e:
+                errors.append(e)
+
+        # Each thread writes its own temporary file, so none is replaced by another thread's:
+        threads = [threading.Thread(target=write, args=(index,)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertIn(utils.load_json('experiment.json')['index'], range(4))
+
+
+if __name__ == '__main__':
+    unittest.main()
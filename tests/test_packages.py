@@ -0,0 +1,35 @@
+import os
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import attr
+
+from exprec import packages
+from tests.helpers import TempFolderTestCase
+
+
+class TestPackages(TempFolderTestCase):
+    def test_fingerprint_ignores_working_directory(self):
+        with mock.patch.object(sys, 'path', [''] + sys.path):
+            fingerprint = packages.get_environment_fingerprint()
+            os.mkdir('.exprec')  # Changes the working directory's modification time
+            self.assertEqual(packages.get_environment_fingerprint(), fingerprint)
+
+    def test_cache(self):
+        Path('cache').mkdir()
+        Path('cache', packages.CACHE_FILENAME_PREFIX + 'old.txt').write_text('old==1.0')
+
+        installed_packages = packages.get_installed_packages('cache')
+        self.assertIn('attrs=={}'.format(attr.__version__), installed_packages)
+        self.assertEqual([path.name for path in Path('cache').iterdir()],
+            [packages.CACHE_FILENAME_PREFIX + packages.get_environment_fingerprint() + '.txt'])
+
+        with mock.patch('exprec.packages.list_installed_packages') as list_installed_packages:
+            self.assertEqual(packages.get_installed_packages('cache'), installed_packages)
+            list_installed_packages.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
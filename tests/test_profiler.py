@@ -0,0 +1,51 @@
+import time
+import unittest
+
+from exprec import Experiment
+from exprec import profiler
+from exprec import utils
+from tests.helpers import TempFolderTestCase
+
+
+def busy_wait(seconds):
+    start_time = time.perf_counter()
+    while time.perf_counter() - start_time < seconds:
+        pass
+
+
+class TestProfiler(TempFolderTestCase):
+    def record(self, seconds):
+        with Experiment(verbose=False, profile=True, profile_interval=0.005) as experiment:
+            busy_wait(seconds)
+
+        return experiment
+
+    def test_profile(self):
+        experiment = self.record(0.3)
+
+        count_by_stack = profiler.read_experiment_profile(experiment.path)
+        busy_wait_stacks = [stack for stack in count_by_stack if stack[-1].startswith('busy_wait ')]
+        self.assertTrue(busy_wait_stacks)
+        self.assertTrue(all(stack[0] == 'MainThread' for stack in busy_wait_stacks))
+
+        # Exprec's own threads aren't sampled:
+        self.assertFalse(any(stack[0].startswith(profiler.INTERNAL_THREAD_PREFIX) for stack in count_by_stack))
+
+        n_samples = utils.load_json(str(experiment.path/'experiment.json'))['profile']['nSamples']
+        self.assertEqual(sum(count_by_stack.values()), n_samples)
+
+    def test_diff(self):
+        count_by_stack1 = {('MainThread', 'main', 'load'): 3, ('MainThread', 'main', 'train'): 1}
+        count_by_stack2 = {('MainThread', 'main', 'load'): 1, ('MainThread', 'main', 'train'): 3}
+
+        rows = profiler.diff_profiles(count_by_stack1, count_by_stack2)
+
+        self.assertEqual({row['function'] for row in rows[:2]}, {'load', 'train'})
+        self.assertEqual(rows[2], {'function': 'main', 'inclusive1': 1.0, 'inclusive2': 1.0, 'self1': 0.0, 'self2': 0.0})
+
+        train, = [row for row in rows if row['function'] == 'train']
+        self.assertEqual((train['inclusive1'], train['inclusive2']), (0.25, 0.75))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+import unittest
+import uuid
+from pathlib import Path
+from unittest import mock
+
+from exprec import Experiment
+from exprec import runner
+from exprec import utils
+from tests.helpers import TempFolderTestCase
+
+
+RANK_0_SCRIPT = '''
+import time
+from pathlib import Path
+from exprec import Experiment, utils
+
+with Experiment(verbose=False) as experiment:
+    experiment.add_scalar('loss', 0.0, 0)
+
+    # Exits after rank 1, so that its status is merged:
+    rank_1_path = experiment.path/'experiment.rank-1.json'
+    while not rank_1_path.exists() or utils.load_json(str(rank_1_path))['status'] == 'running':
+        time.sleep(0.05)
+'''
+
+RANK_1_SCRIPT = '''
+from exprec import Experiment
+
+with Experiment(verbose=False) as experiment:
+    experiment.add_scalar('loss', 1.0, 0)
+    raise RuntimeError('rank 1 failed')
+'''
+
+
+class TestRanks(TempFolderTestCase):
+    def test_ranks(self):
+        experiment_uuid = str(uuid.uuid1())
+        repository_folder = str(Path(__file__).resolve().parents[1])
+
+        processes = []
+        for rank, script in enumerate([RANK_0_SCRIPT, RANK_1_SCRIPT]):
+            env = dict(os.environ, EXPREC_UUID=experiment_uuid, RANK=str(rank),
+                PYTHONPATH=repository_folder)
+            env.pop('EXPREC_RANK', None)
+            processes.append(subprocess.Popen([sys.executable, '-c', script], env=env,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+
+        for process in processes:
+            process.wait(timeout=60)
+        self.assertEqual([process.returncode for process in processes], [0, 1])
+
+        path = Path('.exprec')/experiment_uuid
+        metadata = utils.load_json(str(path/runner.METADATA_JSON_FILENAME))
+        self.assertEqual(metadata['status'], 'failed')
+        self.assertEqual(metadata['rankStatuses'], {'1': 'failed'})
+
+        rank_metadata = utils.load_json(str(path/'experiment.rank-1.json'))
+        self.assertEqual(rank_metadata['exceptionType'], 'RuntimeError')
+
+    def test_uuid_without_rank(self):
+        environ = {name: value for name, value in os.environ.items() if name not in runner.RANK_ENVIRONMENT_VARIABLES}
+        environ[runner.UUID_ENVIRONMENT_VARIABLE] = str(uuid.uuid1())
+
+        # A uuid left over from a multi-process launch is ignored:
+        with mock.patch.dict(os.environ, environ, clear=True):
+            with Experiment(verbose=False) as experiment:
+                pass
+
+        self.assertNotEqual(experiment.uuid, environ[runner.UUID_ENVIRONMENT_VARIABLE])
+        self.assertEqual(experiment.rank, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
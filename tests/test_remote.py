@@ -0,0 +1,175 @@
+import errno
+import io
+import json
+import os
+import socket
+import sys
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from exprec import Experiment
+from exprec import constants as c
+from exprec import experiment_index
+from exprec import remote
+from tests.helpers import TempFolderTestCase
+
+
+def list_files(folder):
+    folder = Path(folder)
+    return {path.relative_to(folder).as_posix(): path.read_bytes()
+            for path in folder.glob('**/*') if path.is_file() and not path.name.endswith(remote.TEMP_SUFFIX)}
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class TestRemote(TempFolderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store_folder = Path(self.folder)/'store'
+
+        # The experiment records into `client/.exprec/` and the collector writes into `store/`:
+        os.mkdir('client')
+        os.chdir('client')
+        Path('main.py').write_text('print("hello")\n')
+
+        self.server = None
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+        super().tearDown()
+
+    def start_collector(self, port=0):
+        self.server = remote.serve_collector('127.0.0.1', port, str(self.store_folder))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        return 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+
+    def record(self, sink_url):
+        with Experiment(verbose=False, sink_url=sink_url, scalar_buffer_size=1) as experiment:
+            print('some output')
+            experiment.set_parameter('learning_rate', 0.1)
+            for step in range(100):
+                experiment.add_scalar('loss', 1 / (step + 1), step)
+
+            # Make the sink send the scalar file in more than one batch:
+            experiment._sink.sync()
+            experiment.add_scalar('loss', 0.0, 100)
+
+        return experiment
+
+    def check_mirrored(self, experiment):
+        local_files = list_files(experiment.path)
+        self.assertIn(c.METADATA_JSON_FILENAME, local_files)
+        self.assertEqual(list_files(self.store_folder/experiment.uuid), local_files)
+
+        manifest_path = Path(c.DEFAULT_PARENT_FOLDER)/experiment.uuid/c.SOURCE_MANIFEST_FILENAME
+        for file_hash in json.loads(manifest_path.read_text()).values():
+            self.assertTrue((self.store_folder/c.CACHE_FOLDER/'blobs'/file_hash[:2]/file_hash[2:]).exists())
+
+    def test_sink(self):
+        experiment = self.record(self.start_collector())
+
+        self.check_mirrored(experiment)
+        self.assertFalse(experiment._sink.spool_path.exists())
+
+    def test_spool(self):
+        port = get_free_port()
+        experiment = self.record('http://127.0.0.1:{}'.format(port))  # No collector is running
+        self.assertTrue(experiment._sink.spool_path.exists())
+
+        url = self.start_collector(port)
+        self.assertEqual(remote.send_spools(url), 0)
+
+        self.check_mirrored(experiment)
+        self.assertFalse(experiment._sink.spool_path.exists())
+
+    def test_unwritable_store(self):
+        url = self.start_collector()
+
+        # The collector answers 503, so the batches are spooled instead of being dropped:
+        with mock.patch('exprec.remote.create_experiment_folder', side_effect=OSError(errno.ENOSPC, 'No space left on device')):
+            experiment = self.record(url)
+        self.assertTrue(experiment._sink.spool_path.exists())
+        self.assertFalse(experiment._sink.rejected_path.exists())
+
+        self.assertEqual(remote.send_spools(url), 0)
+        self.check_mirrored(experiment)
+
+    def test_rejected_batch(self):
+        client = remote.CollectorClient(self.start_collector())
+        rejected_path = Path('uuid' + remote.REJECTED_SUFFIX)
+
+        sys.stdout = io.StringIO()
+        self.assertTrue(client.post(b'not a batch', rejected_path))
+        client.close()
+
+        self.assertIn('rejected', sys.stdout.getvalue())
+        self.assertEqual(rejected_path.read_bytes(), remote.SPOOL_LENGTH.pack(11) + b'not a batch')
+
+    def test_large_and_deleted_files(self):
+        url = self.start_collector()
+
+        with mock.patch('exprec.remote.MAX_RECORD_BYTES', 1000), mock.patch('exprec.remote.MAX_BATCH_BYTES', 2500):
+            with Experiment(verbose=False, sink_url=url) as experiment:
+                with experiment.open('checkpoint.bin', 'wb') as fp:
+                    fp.write(os.urandom(10**4))
+                with experiment.open('old.txt', 'w') as fp:
+                    fp.write('removed before the experiment exits')
+                experiment._sink.sync()
+
+                self.assertTrue((self.store_folder/experiment.uuid/c.FILES_FOLDER/'old.txt').exists())
+                os.remove(str(experiment.path/c.FILES_FOLDER/'old.txt'))
+
+                # Rewritten with a different size:
+                with experiment.open('checkpoint.bin', 'wb') as fp:
+                    fp.write(os.urandom(5000))
+
+        self.check_mirrored(experiment)
+        self.assertFalse((self.store_folder/experiment.uuid/c.FILES_FOLDER/'old.txt').exists())
+
+    def test_index(self):
+        experiment = self.record(self.start_collector())
+
+        # The collector registers the experiment in its index, so it's not rebuilt:
+        index_path = experiment_index.get_index_path(self.store_folder)
+        index = json.loads(index_path.read_text())
+        self.assertEqual(index['uuids'], [experiment.uuid])
+        self.assertEqual(index['folderMtime'], os.stat(str(self.store_folder)).st_mtime_ns)
+
+        with Experiment(verbose=False, sink_url=self.start_collector(), name='named') as experiment:
+            pass
+
+        index = json.loads(index_path.read_text())
+        self.assertEqual(index['uuidByName'], {'named': experiment.uuid})
+        self.assertEqual(index['folderMtime'], os.stat(str(self.store_folder)).st_mtime_ns)
+
+    def test_resent_records(self):
+        records = [({'mode': remote.WRITE_MODE, 'path': 'uuid/file.bin', 'offset': offset, 'size': 6}, data)
+                   for offset, data in [(0, b'abc'), (3, b'def')]]
+
+        for record in [records[0], records[0], records[1], records[1]]:
+            remote.apply_batch(remote.encode_batch([record]), str(self.store_folder))
+
+        self.assertEqual(list_files(self.store_folder/'uuid'), {'file.bin': b'abcdef'})
+
+        with self.assertRaises(ValueError):
+            remote.apply_batch(remote.encode_batch([({'mode': remote.WRITE_MODE, 'path': 'uuid/other.bin',
+                'offset': 3, 'size': 6}, b'def')]), str(self.store_folder))
+
+    def test_invalid_path(self):
+        with self.assertRaises(ValueError):
+            remote.apply_batch(remote.encode_batch([({'mode': remote.WRITE_MODE, 'path': '../outside', 'offset': 0}, b'')]),
+                str(self.store_folder))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import time
+import unittest
+
+from exprec import Experiment
+from exprec import scalars
+from exprec import constants as c
+from tests.helpers import TempFolderTestCase
+
+
+class TestResourceMonitor(TempFolderTestCase):
+    def test_samples(self):
+        with Experiment(verbose=False, monitor_resources=0.05) as experiment:
+            experiment.add_scalar('loss', 1.0)
+            time.sleep(0.3)
+
+            with self.assertRaises(ValueError):
+                experiment.add_scalar('system.loss', 1.0)
+
+        names = scalars.get_scalar_names(experiment.path/c.SCALARS_FOLDER)
+        self.assertIn('loss', names)
+        self.assertIn('system.cpu.process_percent', names)
+        self.assertIn('system.memory.rss_mb', names)
+
+        rss = scalars.read_scalar(scalars.get_scalar_path(experiment.path/c.SCALARS_FOLDER, 'system.memory.rss_mb'))
+        self.assertGreater(len(rss['step']), 1)
+        self.assertEqual(list(rss['step'][:2]), [50, 100])
+        self.assertGreater(rss['value'][0], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import shutil
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+
+from exprec import scalar_lod
+from exprec import scalars
+
+
+N_VALUES = 12345
+
+
+class TestScalarLod(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def check_levels(self, values):
+        for factor in scalar_lod.LOD_FACTORS:
+            level = scalar_lod.read_level(self.folder, 'x', factor)
+
+            # The last bucket is the tail, which is padded with NaN values here:
+            n_padding = (-len(values)) % factor
+            buckets = np.concatenate([values, np.full(n_padding, np.nan)]).reshape(-1, factor)
+
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)  # All-NaN buckets
+                np.testing.assert_allclose(level['mean'], np.nanmean(buckets, axis=1))
+                np.testing.assert_array_equal(level['min'], np.nanmin(buckets, axis=1))
+                np.testing.assert_array_equal(level['max'], np.nanmax(buckets, axis=1))
+
+            np.testing.assert_array_equal(level['step'], np.arange(0, len(values), factor))
+
+    def test_rows_and_series(self):
+        values = np.random.RandomState(0).normal(size=N_VALUES)
+        values[::97] = np.nan
+        values[5000:5200] = np.nan
+
+        writer = scalars.ScalarWriter(self.folder, buffer_size=37)
+
+        # Rows and series are mixed, so that series start in the middle of buckets:
+        for step in range(5003):
+            writer.add('x', values[step], step)
+        writer.add_series('x', values[5003:10007], np.arange(5003, 10007))
+        writer.add_series('x', values[10007:10011], np.arange(10007, 10011))
+        for step in range(10011, N_VALUES):
+            writer.add('x', values[step], step)
+
+        writer.close()
+
+        self.check_levels(values)
+
+    def test_chart_resolution(self):
+        writer = scalars.ScalarWriter(self.folder)
+        writer.add_series('x', np.arange(N_VALUES, dtype=np.float64), np.arange(N_VALUES))
+        writer.close()
+
+        # 12345 values have 1235 buckets of 10, which is enough for 1000 points but not 2000:
+        self.assertEqual(len(scalars.read_scalar_for_chart(self.folder, 'x', max_points=1000)['step']), 1235)
+        self.assertNotIn('min', scalars.read_scalar_for_chart(self.folder, 'x', max_points=2000))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import time
+import unittest
+from unittest import mock
+from pathlib import Path
+
+import numpy as np
+
+from exprec import Experiment
+from exprec import constants as c
+from exprec import scalar_lod
+from exprec import scalars
+from exprec import utils
+from tests.helpers import TempFolderTestCase
+
+
+WHOLE_SECOND = 1600000000.0  # isoformat() leaves out the microseconds
+TIMESTAMPS = [WHOLE_SECOND, WHOLE_SECOND + 0.25, WHOLE_SECOND + 1.000001]
+
+
+class TestScalars(TempFolderTestCase):
+    def write(self, folder, format, steps):
+        writer = scalars.ScalarWriter(folder, format=format, lod=False)
+        for step, value, timestamp in zip(steps, [0.5, 1.5, -2.0], TIMESTAMPS):
+            writer.add('loss', value, step, timestamp)
+        writer.close()
+
+        return scalars.get_scalar_path(folder, 'loss')
+
+    def create_experiment(self, status):
+        path = Path(c.DEFAULT_PARENT_FOLDER)/'uuid'
+        path.mkdir(parents=True)
+        utils.dump_json({'status': status}, str(path/c.METADATA_JSON_FILENAME))
+
+        return path
+
+    def test_binary(self):
+        path = self.write(Path('scalars'), scalars.BINARY_FORMAT, [0, 1, 2])
+        self.assertEqual(path.suffix, '.bin')
+
+        scalar = scalars.read_scalar(path)
+        self.assertIsInstance(scalar['value'], np.memmap)
+        self.assertEqual(scalar['step'].tolist(), [0, 1, 2])
+        self.assertEqual(scalar['value'].tolist(), [0.5, 1.5, -2.0])
+        self.assertEqual(scalars.read_binary_records(path)['timestamp'].tolist(), [scalars.to_timestamp(t) for t in TIMESTAMPS])
+
+        # A partially written record is ignored:
+        with path.open('ab') as fp:
+            fp.write(scalars.encode_binary_row(3, 1.0, 0.0)[:10])
+        self.assertEqual(len(scalars.read_scalar(path)['value']), 3)
+
+    def test_missing_steps(self):
+        scalar = scalars.read_scalar(self.write(Path('scalars'), scalars.BINARY_FORMAT, [0, None, 2]))
+        np.testing.assert_equal(scalar['step'], [0, np.nan, 2])
+
+    def read_values(self, folder, name='loss'):
+        path = scalars.get_scalar_path(folder, name)
+        return scalars.read_scalar(path)['value'].tolist() if path is not None else []
+
+    def test_buffering(self):
+        folder = Path('scalars')
+        writer = scalars.ScalarWriter(folder, buffer_size=3, flush_interval=60, lod=False)
+
+        writer.add('loss', 0.5, 0)
+        writer.add('loss', 1.5, 1)
+        self.assertEqual(self.read_values(folder), [])
+
+        writer.add('loss', -2.0, 2)
+        self.assertEqual(self.read_values(folder), [0.5, 1.5, -2.0])
+
+        writer.add('loss', 3.0, 3)
+        writer.close()
+        self.assertEqual(self.read_values(folder), [0.5, 1.5, -2.0, 3.0])
+
+    def test_flush_timer(self):
+        folder = Path('scalars')
+        writer = scalars.ScalarWriter(folder, flush_interval=0.1)
+        writer.add('loss', 0.5, 0)
+        writer.add('loss', 1.5, 1)
+        self.assertEqual(self.read_values(folder), [])
+
+        # The values are written by the timer, without waiting for more values to be added:
+        time.sleep(0.5)
+        self.assertEqual(self.read_values(folder), [0.5, 1.5])
+        self.assertEqual(scalar_lod.get_n_rows(folder, 'loss'), 2)
+
+        writer.close()
+
+    def test_one_file_per_scalar(self):
+        folder = Path('scalars')
+        writer = scalars.ScalarWriter(folder, buffer_size=1, lod=False)
+        with mock.patch.object(Path, 'open', autospec=True, side_effect=Path.open) as open_mock:
+            for step in range(10):
+                writer.add_many({'loss': step, 'accuracy': -step}, step)
+            self.assertEqual(open_mock.call_count, 2)
+        writer.close()
+
+        self.assertEqual(scalars.get_scalar_names(folder), ['accuracy', 'loss'])
+        self.assertEqual(self.read_values(folder), list(range(10)))
+
+    def test_bulk(self):
+        with Experiment(verbose=False, scalar_format=scalars.BINARY_FORMAT) as experiment:
+            experiment.add_scalars({'loss': 0.5, 'accuracy': 0.75}, step=0)
+            experiment.add_scalar_series('loss', np.array([1.5, -2.0]), steps=np.array([1, 2]))
+            experiment.add_scalar_series('accuracy', [0.8, 0.9])
+
+            # A series whose lengths don't match isn't written at all:
+            with self.assertRaises(ValueError):
+                experiment.add_scalar_series('loss', [3.0, 4.0], steps=[3])
+            with self.assertRaises(ValueError):
+                scalars.ScalarWriter(Path('scalars')).add_series('loss', np.zeros(2), np.arange(3))
+
+        folder = experiment.path/c.SCALARS_FOLDER
+        self.assertEqual(self.read_values(folder), [0.5, 1.5, -2.0])
+        self.assertEqual(scalars.read_scalar(scalars.get_scalar_path(folder, 'loss'))['step'].tolist(), [0, 1, 2])
+        self.assertEqual(self.read_values(folder, 'accuracy'), [0.75, 0.8, 0.9])
+        self.assertIsNone(scalars.get_scalar_path('scalars', 'loss'))
+        self.assertEqual(utils.load_json(str(experiment.path/c.METADATA_JSON_FILENAME))['status'], 'succeeded')
+
+    def test_convert(self):
+        path = self.create_experiment('succeeded')
+        for folder in [path/c.SCALARS_FOLDER, path/c.SCALARS_FOLDER/'rank-1']:
+            self.write(folder, scalars.CSV_FORMAT, [0, None, 2])
+
+        self.assertEqual(scalars.convert_store_to_binary(c.DEFAULT_PARENT_FOLDER), (2, []))
+
+        for folder in [path/c.SCALARS_FOLDER, path/c.SCALARS_FOLDER/'rank-1']:
+            binary_path = scalars.get_scalar_path(folder, 'loss')
+            self.assertEqual(binary_path.suffix, '.bin')
+            self.assertFalse(binary_path.with_suffix('.csv').exists())
+
+            records = scalars.read_binary_records(binary_path)
+            self.assertEqual(records['step'].tolist(), [0, scalars.MISSING_STEP, 2])
+            self.assertEqual(records['value'].tolist(), [0.5, 1.5, -2.0])
+            self.assertEqual(records['timestamp'].tolist(), [scalars.to_timestamp(t) for t in TIMESTAMPS])
+
+    def test_convert_running(self):
+        path = self.create_experiment('running')
+        self.write(path/c.SCALARS_FOLDER, scalars.CSV_FORMAT, [0, 1, 2])
+
+        self.assertEqual(scalars.convert_store_to_binary(c.DEFAULT_PARENT_FOLDER), (0, ['uuid']))
+        self.assertEqual(scalars.get_scalar_path(path/c.SCALARS_FOLDER, 'loss').suffix, '.csv')
+
+        # A rank that is still running counts as well:
+        utils.dump_json({'status': 'succeeded'}, str(path/c.METADATA_JSON_FILENAME))
+        utils.dump_json({'rank': 1, 'status': 'running'}, str(path/'experiment.rank-1.json'))
+        self.assertEqual(scalars.convert_store_to_binary(c.DEFAULT_PARENT_FOLDER), (0, ['uuid']))
+
+
+if __name__ == '__main__':
+    unittest.main()
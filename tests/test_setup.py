@@ -0,0 +1,34 @@
+import unittest
+from pathlib import Path
+
+from exprec import Experiment
+from exprec import runner
+from exprec import utils
+from tests.helpers import TempFolderTestCase, git
+
+
+class TestSetup(TempFolderTestCase):
+    def test_background_setup(self):
+        Path('main.py').write_text('print("first")\n')
+        git('init', '-q')
+        git('add', 'main.py')
+        git('commit', '-q', '-m', 'First')
+        sha = git('rev-parse', 'HEAD')
+
+        Path('main.py').write_text('print("dirty")\n')
+
+        with Experiment(verbose=False, background_setup=True, save_git_patch=True) as experiment:
+            # The code commits while the packages are listed, which mustn't change the recorded commit:
+            git('commit', '-q', '-a', '-m', 'Second')
+
+        metadata = utils.load_json(str(experiment.path/runner.METADATA_JSON_FILENAME))
+        self.assertEqual(metadata['git']['sha'], sha)
+        self.assertTrue(metadata['git']['dirty'])
+        self.assertIsNotNone(metadata['git']['patchFilename'])
+        self.assertIsInstance(metadata['setupSeconds']['blocking'], float)
+        self.assertIsInstance(metadata['setupSeconds']['background'], float)
+        self.assertTrue((experiment.path/runner.PACKAGES_FILENAME).exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from exprec import constants as c
+from exprec import source_store
+from tests.helpers import TempFolderTestCase
+
+
+class TestSourceStore(TempFolderTestCase):
+    def setUp(self):
+        super().setUp()
+
+        Path('main.py').write_text('print("main")\n')
+        Path('package').mkdir()
+        Path('package/module.py').write_text('print("module")\n')
+
+        self.experiment_path = Path(c.DEFAULT_PARENT_FOLDER)/'uuid'
+        self.experiment_path.mkdir(parents=True)
+        source_store.snapshot_source_code('.', self.experiment_path)
+
+    def check_source_folder(self):
+        source_folder = source_store.get_source_folder(self.experiment_path)
+        self.assertEqual(source_folder, self.experiment_path/c.SOURCE_CODE_FOLDER)
+        self.assertEqual((source_folder/'main.py').read_text(), 'print("main")\n')
+        self.assertEqual((source_folder/'package'/'module.py').read_text(), 'print("module")\n')
+
+    def test_source_folder(self):
+        self.check_source_folder()
+        self.check_source_folder()  # Already materialized
+
+    def test_interrupted(self):
+        link = os.link
+
+        def link_once(source, target):
+            if 'module.py' in target:
+                raise KeyboardInterrupt
+            link(source, target)
+
+        with mock.patch('os.link', link_once), self.assertRaises(KeyboardInterrupt):
+            source_store.get_source_folder(self.experiment_path)
+        self.assertFalse((self.experiment_path/c.SOURCE_CODE_FOLDER).exists())
+
+        self.check_source_folder()
+
+    def test_partial_folder(self):
+        # Left behind by a materialization that was interrupted before folders were replaced atomically:
+        (self.experiment_path/c.SOURCE_CODE_FOLDER).mkdir()
+        (self.experiment_path/c.SOURCE_CODE_FOLDER/'main.py').write_text('print("main")\n')
+
+        self.check_source_folder()
+
+
+if __name__ == '__main__':
+    unittest.main()
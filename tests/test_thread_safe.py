@@ -0,0 +1,113 @@
+import io
+import sys
+import threading
+import unittest
+from unittest import mock
+
+from exprec import Experiment
+from exprec import constants as c
+from exprec import scalars
+from exprec import utils
+from tests.helpers import TempFolderTestCase
+
+
+N_THREADS = 16
+N_VALUES_PER_THREAD = 2000
+
+
+class TestThreadSafe(TempFolderTestCase):
+    def setUp(self):
+        super().setUp()
+
+        # Threads are switched as often as possible, to make races likely:
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+
+    def tearDown(self):
+        sys.setswitchinterval(self.switch_interval)
+
+        super().tearDown()
+
+    def record_concurrently(self, scalar_format):
+        barrier = threading.Barrier(N_THREADS)
+
+        def produce(experiment, thread_index):
+            barrier.wait()
+
+            for i in range(N_VALUES_PER_THREAD):
+                # Each (step, value) pair is unique, so lost or corrupted rows can be detected:
+                experiment.add_scalar('shared', thread_index, step=thread_index * N_VALUES_PER_THREAD + i)
+                experiment.add_scalars({'thread-{}'.format(thread_index): i}, step=i)
+
+                if i % 100 == 0:
+                    experiment.set_parameter('thread-{}'.format(thread_index), i)
+
+        with Experiment(verbose=False, thread_safe=True, scalar_format=scalar_format, scalar_buffer_size=10) as experiment:
+            threads = [threading.Thread(target=produce, args=(experiment, thread_index)) for thread_index in range(N_THREADS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        return experiment.path
+
+    def check_experiment(self, path):
+        scalars_folder = path/c.SCALARS_FOLDER
+
+        shared = scalars.read_scalar(scalars.get_scalar_path(scalars_folder, 'shared'))
+        rows = sorted(zip(shared['step'].tolist(), shared['value'].tolist()))
+        expected_rows = [(thread_index * N_VALUES_PER_THREAD + i, thread_index)
+                         for thread_index in range(N_THREADS) for i in range(N_VALUES_PER_THREAD)]
+        self.assertEqual(rows, expected_rows)
+
+        for thread_index in range(N_THREADS):
+            scalar = scalars.read_scalar(scalars.get_scalar_path(scalars_folder, 'thread-{}'.format(thread_index)))
+            self.assertEqual(scalar['step'].tolist(), list(range(N_VALUES_PER_THREAD)))
+            self.assertEqual(scalar['value'].tolist(), list(range(N_VALUES_PER_THREAD)))
+
+        metadata = utils.load_json(str(path/c.METADATA_JSON_FILENAME))
+        last_parameter_value = (N_VALUES_PER_THREAD - 1) // 100 * 100
+        self.assertEqual(metadata['parameters'],
+            {'thread-{}'.format(thread_index): last_parameter_value for thread_index in range(N_THREADS)})
+        self.assertEqual(metadata['status'], 'succeeded')
+
+    def test_csv(self):
+        self.check_experiment(self.record_concurrently(scalars.CSV_FORMAT))
+
+    def test_binary(self):
+        self.check_experiment(self.record_concurrently(scalars.BINARY_FORMAT))
+
+    def test_invalid_arguments(self):
+        with Experiment(verbose=False, thread_safe=True) as experiment:
+            # Raised on the calling thread, not the writer thread:
+            with self.assertRaises(ValueError):
+                experiment.add_scalar_series('loss', [1.0, 2.0], steps=[0])
+            with self.assertRaises(ValueError):
+                experiment.add_scalar(c.SYSTEM_SCALAR_PREFIX + 'loss', 1.0)
+
+        self.assertEqual(utils.load_json(str(experiment.path/c.METADATA_JSON_FILENAME))['status'], 'succeeded')
+
+    def test_writer_error(self):
+        add = scalars.ScalarWriter.add
+
+        def add_or_fail(writer, name, *args):
+            if name == 'broken':
+                raise OSError('No space left on device')
+            add(writer, name, *args)
+
+        sys.stderr = io.StringIO()  # The writer thread prints the traceback
+        with mock.patch.object(scalars.ScalarWriter, 'add', add_or_fail), self.assertRaises(OSError):
+            with Experiment(verbose=False, thread_safe=True) as experiment:
+                experiment.add_scalar('broken', 1.0, 0)
+                experiment.add_scalar('loss', 1.0, 0)
+
+        # The later records are still written:
+        scalar = scalars.read_scalar(scalars.get_scalar_path(experiment.path/c.SCALARS_FOLDER, 'loss'))
+        self.assertEqual(scalar['value'].tolist(), [1.0])
+
+        metadata = utils.load_json(str(experiment.path/c.METADATA_JSON_FILENAME))
+        self.assertEqual((metadata['status'], metadata['exceptionType']), ('failed', 'OSError'))
+
+
+if __name__ == '__main__':
+    unittest.main()
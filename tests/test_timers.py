@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+from exprec import Experiment
+from exprec import timers
+from exprec import constants as c
+from tests.helpers import TempFolderTestCase
+
+
+N_CALLS = 100000
+MAX_OVERHEAD_FACTOR = 20  # Relative to a context manager that only measures the duration. Typically 3 to 5.
+
+
+class PlainSection:
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.duration = time.perf_counter() - self.start_time
+
+
+class TestTimers(TempFolderTestCase):
+    def test_sections(self):
+        with Experiment(verbose=False) as experiment:
+            @experiment.timer('evaluate')
+            def evaluate(value):
+                time.sleep(0.01)
+                return value
+
+            for step in range(5):
+                with experiment.timer('data'):
+                    time.sleep(0.002)
+                self.assertEqual(evaluate(step), step)
+
+        windows = timers.read_timers(experiment.path/c.TIMERS_FOLDER/timers.TIMERS_FILENAME)
+        breakdown = timers.get_breakdown(windows)
+
+        self.assertEqual([row['section'] for row in breakdown], ['evaluate', 'data'])
+        self.assertEqual([row['count'] for row in breakdown], [5, 5])
+        self.assertGreaterEqual(breakdown[0]['p50'], 0.01)
+        self.assertGreaterEqual(breakdown[1]['max'], breakdown[1]['p95'])
+
+    def measure(self, create_section):
+        start_time = time.perf_counter()
+        for _ in range(N_CALLS):
+            with create_section():
+                pass
+
+        return (time.perf_counter() - start_time) / N_CALLS
+
+    def test_overhead(self):
+        section_timers = timers.SectionTimers(self.folder, window=0.1)
+
+        # Both are measured under the same load, so the comparison doesn't depend on the machine:
+        baseline = self.measure(PlainSection)
+        overhead = self.measure(lambda: section_timers.section('empty'))
+
+        section_timers.close()
+
+        self.assertLess(overhead, MAX_OVERHEAD_FACTOR * baseline)
+
+        # The number of durations kept for the quantiles is bounded, however many calls a window has:
+        windows = timers.read_timers(os.path.join(self.folder, timers.TIMERS_FILENAME))
+        self.assertEqual(sum(window['sections']['empty']['count'] for window in windows), N_CALLS)
+
+        stats = timers.SectionStats()
+        for index in range(10 * timers.MAX_SAMPLES):
+            stats.add(index)
+        self.assertEqual(len(stats.samples), timers.MAX_SAMPLES)
+        self.assertEqual(stats.summarize()['max'], 10 * timers.MAX_SAMPLES - 1)
+
+    def test_flush_timer(self):
+        section_timers = timers.SectionTimers(self.folder, window=0.1)
+        with section_timers.section('data'):
+            pass
+
+        # The window is written by the timer, although no section ends after it:
+        time.sleep(0.5)
+        windows = timers.read_timers(os.path.join(self.folder, timers.TIMERS_FILENAME))
+        self.assertEqual([window['sections']['data']['count'] for window in windows], [1])
+
+        section_timers.close()
+
+    def test_slow_write(self):
+        section_timers = timers.SectionTimers(self.folder)
+        started, release = threading.Event(), threading.Event()
+        write = timers.SectionTimers._write
+
+        def slow_write(*args):
+            started.set()
+            release.wait()
+            write(*args)
+
+        with mock.patch.object(timers.SectionTimers, '_write', slow_write):
+            # A section on another thread ends the window, whose line is written slowly:
+            now = time.perf_counter()
+            thread = threading.Thread(target=section_timers.add, args=('slow', now, now + section_timers.window))
+            thread.start()
+            started.wait()
+
+            # Sections ending meanwhile aren't blocked by the write:
+            other_thread = threading.Thread(target=section_timers.add, args=('data', now, now))
+            other_thread.start()
+            other_thread.join(timeout=5)
+            self.assertFalse(other_thread.is_alive())
+
+            release.set()
+            thread.join()
+            other_thread.join()
+            section_timers.close()
+
+        windows = timers.read_timers(os.path.join(self.folder, timers.TIMERS_FILENAME))
+        self.assertEqual([list(window['sections']) for window in windows], [['slow'], ['data']])
+
+if __name__ == '__main__':
+    unittest.main()